@@ -0,0 +1,76 @@
+"""
+Adaptive concurrency
+AIMD control (additive increase, multiplicative decrease, as in TCP) of how
+many pages a ScrapePipeline loads at once. While rows keep succeeding and
+page time stays near the recent best, one more fetcher is added per window of
+rows; when too many rows fail (robot checks, errors) or pages slow down, the
+fetcher count is cut in half. Every change and its reason ends up in the
+pipeline's concurrency_log.
+"""
+
+import os
+
+# Off by default; SCRAPER_ADAPTIVE=1 turns it on for every job
+ADAPTIVE = os.environ.get("SCRAPER_ADAPTIVE", "0").lower() in ("1", "true", "yes")
+
+# Rows judged per decision (at least this many, and at least two per fetcher)
+MIN_WINDOW = 4
+
+# Share of failed rows in a window that counts as being pushed back
+FAILURE_LIMIT = 0.2
+
+# Page time, relative to the recent best, that counts as overloaded
+LATENCY_TOLERANCE = 2.0
+
+# How fast the best page time drifts up towards the current one, per row. A lasting
+# shift (slower pages, a slower exit) becomes the new baseline within a few windows
+# instead of holding the job at one fetcher for the rest of the run
+BASELINE_ALPHA = 0.05
+
+DECREASE_FACTOR = 0.5
+
+
+class AIMDController:
+    def __init__(self, pipeline, max_concurrency, min_concurrency=1):
+        self.pipeline = pipeline
+        self.max_concurrency = max(min_concurrency, max_concurrency)
+        self.min_concurrency = min_concurrency
+        self.best_latency = None  # lowest page time, drifting up to the current one
+        self._window = []  # True/False per row since the last decision
+        self._ignore = 0  # rows started before the last cut, not judged
+
+    def observe(self, data):
+        """Feed one finished row (its result dict, or None if it failed) and adjust if a window is complete"""
+        latency = self.pipeline.row_latency
+        if latency is not None:
+            if self.best_latency is None or latency < self.best_latency:
+                self.best_latency = latency
+            else:
+                self.best_latency += BASELINE_ALPHA * (latency - self.best_latency)
+        if self._ignore:
+            self._ignore -= 1
+            return
+        self._window.append(data is not None)
+
+        concurrency = self.pipeline.concurrency
+        if len(self._window) < max(MIN_WINDOW, 2 * concurrency):
+            return
+        failures = self._window.count(False)
+        rows = len(self._window)
+        self._window = []
+
+        if failures / rows > FAILURE_LIMIT:
+            self._decrease(f"{failures} of {rows} rows failed or were blocked")
+        elif latency is not None and latency > self.best_latency * LATENCY_TOLERANCE:
+            self._decrease(f"pages take {latency:.1f}s, over {LATENCY_TOLERANCE:g}x the recent best {self.best_latency:.1f}s")
+        elif concurrency < self.max_concurrency:
+            self._set(concurrency + 1, f"healthy: {failures} of {rows} rows failed, {latency or 0:.1f}s per page")
+
+    def _decrease(self, reason):
+        # Rows already loading were started at the old concurrency; don't judge the new one by them
+        self._ignore = self.pipeline.in_flight()
+        self._set(int(self.pipeline.concurrency * DECREASE_FACTOR), reason)
+
+    def _set(self, concurrency, reason):
+        concurrency = min(self.max_concurrency, max(self.min_concurrency, concurrency))
+        self.pipeline.set_concurrency(concurrency, reason)
@@ -11,71 +11,303 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+import argparse
+import csv
+import json
+import os
+import sys
 import time
 import re
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from datetime import datetime
+from proxy_pool import ProxyPool, TokenBucket, looks_blocked
+from product_html import count_embedded_images, count_embedded_videos, count_bullets, parse_offer
+from scrape_pipeline import ScrapePipeline
+from job_budget import JobBudget, parse_deadline
+from single_flight import flights
+from aimd import ADAPTIVE, AIMDController
+from tracing import TRACING, Tracer
+from job_scheduler import JobCancelled
 
 # Color fills for Excel
 GREEN_FILL = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
 RED_FILL = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+YELLOW_FILL = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+
+# Where product pages are fetched from (point at fake_amazon_server.py for offline runs)
+AMAZON_BASE_URL = os.environ.get("AMAZON_BASE_URL", "https://www.amazon.com")
+
+# Result fields, in sheet column order (F-M)
+FIELDS = ['link', 'buybox_seller', 'buybox_price', 'ranking', 'review', 'photos', 'videos', 'bullet_points']
+
+# Daily price sweep: column G (buybox) and column H (price)
+PRICE_CHECK_FIELDS = ['buybox_seller', 'buybox_price']
+
+# Requests for only these fields are served from the offer listing page
+OFFER_PAGE_FIELDS = {'link', 'buybox_seller', 'buybox_price'}
+
+# Seconds to let a product page settle after loading, and to pause between rows
+PAGE_LOAD_WAIT = 2
+ROW_DELAY = 2
+
+# The offer listing is a static fragment with no heavy scripts to wait for
+OFFER_PAGE_WAIT = 0.5
+
+# Browsers loading pages at once, and processes parsing them (0 = parse in the browser thread)
+FETCHERS = int(os.environ.get("SCRAPER_FETCHERS", "1"))
+PARSE_WORKERS = int(os.environ.get("SCRAPER_PARSE_WORKERS", "0"))
+
+# Pages each browser loads in background tabs ahead of the one being read (0 = off)
+PREFETCH_PAGES = int(os.environ.get("SCRAPER_PREFETCH", "0"))
+
+# Seconds to wait for a prefetched tab that still hasn't finished loading when it's needed
+PREFETCH_LOAD_TIMEOUT = 30
+
+# Most fetchers a job may add to catch up with its deadline
+MAX_FETCHERS = int(os.environ.get("SCRAPER_MAX_FETCHERS", str(max(FETCHERS, 3))))
+
+# process_excel can write the updated workbook or one record per row
+OUTPUT_FORMATS = ['xlsx', 'csv', 'json']
+
+# Words accepted in a "Priority" column besides numbers (1 = most important)
+PRIORITY_WORDS = {'high': 1, 'medium': 2, 'normal': 2, 'low': 3}
 
 class AmazonScraper:
-    def __init__(self, headless=False):
-        """Initialize the scraper with Chrome driver"""
+    def __init__(self, headless=False, proxy_pool=None, base_url=None, tracer=None, prefetch_pages=None,
+                 cancel_event=None):
+        """Initialize the scraper with Chrome driver
+        
+        If a ProxyPool is given, the browser is pinned to one of its exits and
+        moved to another exit when that one is quarantined. If a tracing.Tracer
+        is given, page loads, waits and every extractor method are recorded as spans.
+        prefetch_pages (default SCRAPER_PREFETCH) caps the background tabs that
+        ASINs queued with prefetch() are loaded in. Setting cancel_event ends waits
+        on the pool (rate limits, every exit quarantined) with JobCancelled.
+        """
+        self.headless = headless
+        self.proxy_pool = proxy_pool
+        self.proxy_exit = None
+        self.base_url = (base_url or AMAZON_BASE_URL).rstrip('/')
+        self.timings = defaultdict(float)  # phase -> total seconds, for throughput reports
+        self.tracer = tracer
+        self.prefetch_pages = PREFETCH_PAGES if prefetch_pages is None else max(0, prefetch_pages)
+        self.cancel_event = cancel_event
+        self._upcoming = []  # URLs queued by prefetch(), not opened yet
+        self._prefetched = {}  # URL -> window handle of its background tab, oldest first
+        self._source = None  # page_source of the current page, fetched at most once
+        self._start_driver()
+    
+    def _start_driver(self):
+        """Launch Chrome, routed through a proxy exit if a pool is configured"""
         options = webdriver.ChromeOptions()
-        if headless:
+        if self.headless:
             options.add_argument('--headless')  # Run in background
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--window-size=1920,1080')
+        if self.prefetch_pages:
+            options.add_argument('--disable-popup-blocking')  # Prefetch tabs are opened with window.open
         options.add_argument('user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+        if self.proxy_pool:
+            self.proxy_exit = self.proxy_pool.assign()
+            proxy_argument = self.proxy_exit.chrome_argument()
+            if proxy_argument:
+                options.add_argument(proxy_argument)
+            print(f"Using egress: {self.proxy_exit.url}")
         self.driver = webdriver.Chrome(options=options)
         self.wait = WebDriverWait(self.driver, 10)
+        self._prefetched = {}  # Tabs of a previous browser are gone
+    
+    def _rotate_exit(self):
+        """Restart the browser on a different exit after the current one was quarantined
+        
+        When every exit is quarantined, a restart would only land on another bad
+        exit (or this one again), so wait for the first to come out of quarantine.
+        If that is this browser's own exit, it carries on without a restart.
+        """
+        if not self.proxy_pool.healthy_exits():
+            print("Every exit is quarantined, waiting for one to come back")
+            with self._timed('quarantine_wait'):
+                if not self.proxy_pool.wait_for_healthy(self.cancel_event):
+                    raise JobCancelled()
+            if not self.proxy_exit.is_quarantined():
+                return
+        print(f"Exit {self.proxy_exit.url} quarantined, switching egress")
+        self.close()
+        self._start_driver()
+    
+    def _page_source(self):
+        """HTML of the current page, cached until the next navigation"""
+        if self._source is None:
+            with self._span('page_source'):
+                self._source = self.driver.page_source
+        return self._source
+    
+    def _is_blocked(self):
+        """Check whether Amazon served a robot check instead of the product page"""
+        try:
+            return looks_blocked(self.driver.title) or looks_blocked(self._page_source())
+        except Exception:
+            return False
+    
+    @contextmanager
+    def _timed(self, phase):
+        """Add the time spent in a block to self.timings[phase] (and trace it as a span)"""
+        start = time.perf_counter()
+        try:
+            with self._span(phase):
+                yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+    
+    def _span(self, name):
+        """Trace a block as a span when tracing is on (see tracing.py)"""
+        return self.tracer.span(name) if self.tracer is not None else nullcontext()
     
     def get_product_url(self, asin):
         """Generate Amazon product URL from ASIN"""
-        return f"https://www.amazon.com/dp/{asin}"
+        return f"{self.base_url}/dp/{asin}"
+    
+    def get_offer_url(self, asin):
+        """URL of the offer listing, a much lighter page than the product detail page"""
+        return f"{self.base_url}/gp/aod/ajax?asin={asin}&pc=dp"
+    
+    def _first_url(self, asin, fields):
+        """The page scrape_product and fetch_page load first for these fields, or None if none is needed"""
+        fields = FIELDS if fields is None else fields
+        if not set(fields) - {'link'}:
+            return None
+        if set(fields) <= OFFER_PAGE_FIELDS:
+            return self.get_offer_url(asin)
+        return self.get_product_url(asin)
+    
+    def prefetch(self, asin, fields=None):
+        """Queue an ASIN that is about to be scraped with these fields
+        
+        Right after the next page load, while that page is being read, its page
+        starts loading in a background tab (at most prefetch_pages at a time).
+        Scraping it then switches to the tab instead of navigating. No-op when
+        prefetch_pages is 0, so callers can always queue what comes next.
+        """
+        url = self._first_url(asin, fields)
+        if not self.prefetch_pages or url is None:
+            return
+        if url not in self._prefetched and url not in self._upcoming:
+            self._upcoming.append(url)
+    
+    def discard_prefetch(self, asin):
+        """Forget an ASIN queued with prefetch() that won't be scraped after all, closing its tab"""
+        for url in (self.get_product_url(asin), self.get_offer_url(asin)):
+            if url in self._upcoming:
+                self._upcoming.remove(url)
+            if url in self._prefetched:
+                handle = self._prefetched.pop(url)
+                self._close_tab(handle)
+    
+    def clear_prefetch(self):
+        """Forget everything queued with prefetch() and close its tabs, e.g. when a batch is abandoned"""
+        self._upcoming = []
+        tabs, self._prefetched = self._prefetched, {}
+        for handle in tabs.values():
+            try:
+                self._close_tab(handle)
+            except Exception:
+                pass  # The browser itself may be what failed
+    
+    def _open_prefetch_tabs(self):
+        """Start loading queued pages in background tabs, keeping the current page in front"""
+        if self.proxy_exit is not None and self.proxy_exit.is_quarantined():
+            return  # The next _load moves to another exit, which closes every tab
+        while self._upcoming and len(self._prefetched) < self.prefetch_pages:
+            url = self._upcoming.pop(0)
+            if self.proxy_exit is not None:
+                with self._timed('rate_limit'):
+                    if not self.proxy_exit.limiter.acquire(self.cancel_event):
+                        return
+            with self._timed('prefetch'):
+                try:
+                    before = set(self.driver.window_handles)
+                    self.driver.execute_script("window.open(arguments[0], '_blank');", url)
+                    opened = [handle for handle in self.driver.window_handles if handle not in before]
+                except Exception as e:
+                    print(f"Could not prefetch {url}: {e}")
+                    return
+            if opened:
+                self._prefetched[url] = opened[0]
+    
+    def _show_prefetched(self, handle, settle):
+        """Close the page we're done with and bring a prefetched tab to the front
+        
+        Returns the part of the settle wait still owed: a tab that finished loading
+        in the background has been settling since its load event, not since it was
+        opened, so a slow page still gets the full wait after it loads.
+        """
+        previous = self.driver.current_window_handle
+        self.driver.switch_to.window(handle)
+        self._close_tab(previous)
+        loaded_ago = self.driver.execute_script(
+            "var end = performance.timing.loadEventEnd;"
+            "return document.readyState == 'complete' && end > 0 ? (Date.now() - end) / 1000 : null;")
+        if loaded_ago is not None:
+            return max(0.0, settle - loaded_ago)
+        ready = lambda driver: driver.execute_script("return document.readyState") == "complete"
+        WebDriverWait(self.driver, PREFETCH_LOAD_TIMEOUT).until(ready)
+        return settle
+    
+    def _close_tab(self, handle):
+        """Close a tab without changing which one is in front"""
+        current = self.driver.current_window_handle
+        try:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        except Exception:
+            pass
+        finally:
+            self.driver.switch_to.window(current)
     
-    def scrape_product(self, asin, expected_price):
-        """Scrape all required information for a product"""
+    def scrape_product(self, asin, expected_price, fields=None):
+        """Scrape the requested fields (all of FIELDS by default) for a product"""
+        fields = FIELDS if fields is None else fields
         url = self.get_product_url(asin)
         print(f"\nScraping ASIN: {asin}")
         print(f"URL: {url}")
         
+        data = dict.fromkeys(FIELDS)
+        data['link'] = url
+        
+        if not set(fields) - {'link'}:
+            return data  # The link needs no page load
+        
         try:
-            self.driver.get(url)
-            time.sleep(2)  # Wait for page to load
-            
-            data = {
-                'link': url,
-                'buybox_seller': None,
-                'buybox_price': None,
-                'ranking': None,
-                'review': None,
-                'photos': None,
-                'videos': None,
-                'bullet_points': None
-            }
-            
-            # Extract buybox seller
-            data['buybox_seller'] = self._get_buybox_seller()
-            
-            # Extract price
-            data['buybox_price'] = self._get_price()
-            
-            # Extract ranking
-            data['ranking'] = self._get_ranking()
-            
-            # Extract review rating
-            data['review'] = self._get_review_rating()
+            # Buybox and price only: read them off the offer listing
+            if set(fields) <= OFFER_PAGE_FIELDS:
+                if not self._load(self.get_offer_url(asin), asin, OFFER_PAGE_WAIT):
+                    return None
+                with self._timed('offer'):
+                    seller, price = self._get_offer_buybox()
+                if price is not None:
+                    data['buybox_seller'] = seller
+                    data['buybox_price'] = price
+                    return data
+                print("No offer found, falling back to the product page")
             
-            # Count photos
-            data['photos'] = self._count_photos()
+            if not self._load(url, asin):
+                return None
             
-            # Check for videos
-            data['videos'] = self._check_videos()
-            
-            # Count bullet points
-            data['bullet_points'] = self._count_bullet_points()
+            extractors = {
+                'buybox_seller': self._get_buybox_seller,
+                'buybox_price': self._get_price,
+                'ranking': self._get_ranking,
+                'review': self._get_review_rating,
+                'photos': self._count_photos,
+                'videos': self._check_videos,
+                'bullet_points': self._count_bullet_points,
+            }
+            for field, extract in extractors.items():
+                if field in fields:
+                    with self._timed(field):
+                        data[field] = extract()
             
             return data
             
@@ -83,57 +315,177 @@ class AmazonScraper:
             print(f"Error scraping {asin}: {str(e)}")
             return None
     
-    def _get_buybox_seller(self):
-        """Extract the buybox seller name"""
+    def fetch_page(self, asin, fields=None):
+        """Load the page scrape_product would read and return it unparsed
+        
+        Returns (kind, data, source): kind is 'offer', 'product' or 'link' (no page
+        needed), data is a result dict with only the link filled in, and source is
+        the page HTML for product_html to parse. None if the page could not be loaded.
+        """
+        fields = FIELDS if fields is None else fields
+        url = self.get_product_url(asin)
+        print(f"\nFetching ASIN: {asin}")
+        
+        data = dict.fromkeys(FIELDS)
+        data['link'] = url
+        
+        if not set(fields) - {'link'}:
+            return 'link', data, ''
+        
         try:
-            # Method 1: Check for "Ships from and sold by Amazon.com"
+            if set(fields) <= OFFER_PAGE_FIELDS:
+                if not self._load(self.get_offer_url(asin), asin, OFFER_PAGE_WAIT):
+                    return None
+                source = self._page_source()
+                # Same test as scrape_product: an offer without a price means reading the product page
+                if parse_offer(source)[1] is not None:
+                    return 'offer', data, source
+                print("No offer found, falling back to the product page")
+            
+            if not self._load(url, asin):
+                return None
+            return 'product', data, self._page_source()
+            
+        except Exception as e:
+            print(f"Error fetching {asin}: {str(e)}")
+            return None
+    
+    def _load(self, url, asin, settle=None):
+        """Navigate to a page, respecting the exit's rate limit. False if Amazon served a robot check
+        
+        A page opened earlier by prefetch() is switched to instead. Either way, the
+        next queued pages start loading in the background before this returns.
+        """
+        settle = PAGE_LOAD_WAIT if settle is None else settle
+        if url in self._upcoming:
+            self._upcoming.remove(url)
+        prefetched = self._prefetched.pop(url, None)
+        if self.proxy_exit is not None and prefetched is None:
+            if self.proxy_exit.is_quarantined():
+                self._rotate_exit()
+            # Respect this exit's rate limit (prefetched pages paid it when they were opened)
+            with self._timed('rate_limit'):
+                if not self.proxy_exit.limiter.acquire(self.cancel_event):
+                    raise JobCancelled()
+        
+        start = time.monotonic()
+        try:
+            if prefetched is not None:
+                # The exit is scored on the wait from here on, not on how long the tab sat in the background
+                with self._timed('navigate'):
+                    settle = self._show_prefetched(prefetched, settle)
+            else:
+                with self._timed('navigate'):
+                    self.driver.get(url)
+            self._source = None
+            with self._timed('settle'):
+                time.sleep(settle)  # Wait for page to load
+        except Exception:
+            self._report_exit(False, start)
+            raise
+        
+        with self._timed('block_check'):
+            blocked = self._is_blocked()
+        self._report_exit(not blocked, start, blocked=blocked)
+        if blocked:
+            print(f"Robot check served for {asin}")
+        if self.prefetch_pages:
+            self._open_prefetch_tabs()
+        return not blocked
+    
+    def _get_offer_buybox(self):
+        """Extract (seller, price) of the featured offer from the offer listing page"""
+        for offer_selector in ("#aod-pinned-offer", "#aod-offer"):
             try:
-                merchant_info = self.driver.find_element(By.ID, "merchant-info")
-                text = merchant_info.text.lower()
-                if 'amazon.com' in text or 'amazon' in text:
-                    return "Amazon.com"
-                # Extract seller name from link
-                try:
-                    seller_link = merchant_info.find_element(By.TAG_NAME, "a")
-                    return seller_link.text.strip()
-                except:
-                    pass
+                offer = self.driver.find_element(By.CSS_SELECTOR, offer_selector)
             except:
-                pass
+                continue
             
-            # Method 2: Check tabular buybox
+            price = None
             try:
-                seller_element = self.driver.find_element(By.ID, "sellerProfileTriggerId")
-                seller_name = seller_element.text.strip()
-                if seller_name:
-                    return seller_name
+                price_text = offer.find_element(By.CSS_SELECTOR, ".a-price .a-offscreen").get_attribute("textContent")
+                price_match = re.search(r'[\d,]+\.?\d*', price_text)
+                if price_match:
+                    price = float(price_match.group().replace(',', ''))
             except:
                 pass
             
-            # Method 3: Look for "Sold by" text anywhere
+            seller = "Unknown"
             try:
-                sold_by_elements = self.driver.find_elements(By.XPATH, "//*[contains(text(), 'Sold by')]")
-                for elem in sold_by_elements:
-                    parent_text = elem.find_element(By.XPATH, "./..").text
-                    if 'amazon.com' in parent_text.lower() or 'amazon' in parent_text.lower():
+                seller_text = offer.find_element(By.CSS_SELECTOR, "#aod-offer-soldBy .a-col-right").text.strip()
+                if 'amazon' in seller_text.lower():
+                    seller = "Amazon.com"
+                elif seller_text:
+                    seller = seller_text
+            except:
+                pass
+            
+            if price is not None:
+                print(f"Found offer: {seller} at ${price}")
+                return seller, price
+        
+        return None, None
+    
+    def _report_exit(self, success, start, blocked=False):
+        """Feed the outcome of a page load back into the proxy pool's health scores"""
+        if self.proxy_exit is not None:
+            self.proxy_pool.report(self.proxy_exit, success, time.monotonic() - start, blocked)
+    
+    def _get_buybox_seller(self):
+        """Extract the buybox seller name"""
+        try:
+            # Method 1: Check for "Ships from and sold by Amazon.com"
+            with self._span('buybox_seller/merchant_info'):
+                try:
+                    merchant_info = self.driver.find_element(By.ID, "merchant-info")
+                    text = merchant_info.text.lower()
+                    if 'amazon.com' in text or 'amazon' in text:
                         return "Amazon.com"
-                    # Try to extract seller name
+                    # Extract seller name from link
                     try:
-                        seller_link = elem.find_element(By.XPATH, ".//following-sibling::a | .//a")
+                        seller_link = merchant_info.find_element(By.TAG_NAME, "a")
                         return seller_link.text.strip()
                     except:
                         pass
-            except:
-                pass
+                except:
+                    pass
+            
+            # Method 2: Check tabular buybox
+            with self._span('buybox_seller/seller_profile'):
+                try:
+                    seller_element = self.driver.find_element(By.ID, "sellerProfileTriggerId")
+                    seller_name = seller_element.text.strip()
+                    if seller_name:
+                        return seller_name
+                except:
+                    pass
+            
+            # Method 3: Look for "Sold by" text anywhere
+            with self._span('buybox_seller/sold_by_xpath'):
+                try:
+                    sold_by_elements = self.driver.find_elements(By.XPATH, "//*[contains(text(), 'Sold by')]")
+                    for elem in sold_by_elements:
+                        parent_text = elem.find_element(By.XPATH, "./..").text
+                        if 'amazon.com' in parent_text.lower() or 'amazon' in parent_text.lower():
+                            return "Amazon.com"
+                        # Try to extract seller name
+                        try:
+                            seller_link = elem.find_element(By.XPATH, ".//following-sibling::a | .//a")
+                            return seller_link.text.strip()
+                        except:
+                            pass
+                except:
+                    pass
             
             # Method 4: Check if "Add to Cart" button exists (usually means Amazon is seller)
-            try:
-                add_to_cart = self.driver.find_element(By.ID, "add-to-cart-button")
-                if add_to_cart:
-                    # If we can add to cart but haven't found seller, likely Amazon
-                    return "Amazon.com"
-            except:
-                pass
+            with self._span('buybox_seller/add_to_cart'):
+                try:
+                    add_to_cart = self.driver.find_element(By.ID, "add-to-cart-button")
+                    if add_to_cart:
+                        # If we can add to cart but haven't found seller, likely Amazon
+                        return "Amazon.com"
+                except:
+                    pass
             
             return "Unknown"
         except Exception as e:
@@ -144,56 +496,59 @@ class AmazonScraper:
         """Extract the current buybox price"""
         try:
             # Method 1: Try to get the offscreen price (most reliable, contains full price)
-            try:
-                price_element = self.driver.find_element(By.CSS_SELECTOR, ".a-price .a-offscreen")
-                price_text = price_element.get_attribute("textContent")
-                # Extract numeric value (e.g., "$89.99" -> 89.99)
-                price_match = re.search(r'[\d,]+\.?\d*', price_text)
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
-                    print(f"Found price (offscreen): ${price}")
-                    return price
-            except:
-                pass
+            with self._span('buybox_price/offscreen'):
+                try:
+                    price_element = self.driver.find_element(By.CSS_SELECTOR, ".a-price .a-offscreen")
+                    price_text = price_element.get_attribute("textContent")
+                    # Extract numeric value (e.g., "$89.99" -> 89.99)
+                    price_match = re.search(r'[\d,]+\.?\d*', price_text)
+                    if price_match:
+                        price = float(price_match.group().replace(',', ''))
+                        print(f"Found price (offscreen): ${price}")
+                        return price
+                except:
+                    pass
             
             # Method 2: Combine whole and fraction parts
-            try:
-                whole_element = self.driver.find_element(By.CLASS_NAME, "a-price-whole")
-                whole_text = whole_element.text.strip().replace(',', '').replace('.', '')  # Remove comma and trailing dot
-                
-                # Try to get the fraction part
-                fraction_text = "00"
+            with self._span('buybox_price/whole_fraction'):
                 try:
-                    fraction_element = self.driver.find_element(By.CLASS_NAME, "a-price-fraction")
-                    fraction_text = fraction_element.text.strip()
+                    whole_element = self.driver.find_element(By.CLASS_NAME, "a-price-whole")
+                    whole_text = whole_element.text.strip().replace(',', '').replace('.', '')  # Remove comma and trailing dot
+                    
+                    # Try to get the fraction part
+                    fraction_text = "00"
+                    try:
+                        fraction_element = self.driver.find_element(By.CLASS_NAME, "a-price-fraction")
+                        fraction_text = fraction_element.text.strip()
+                    except:
+                        pass
+                    
+                    # Combine whole and fraction
+                    price = float(f"{whole_text}.{fraction_text}")
+                    print(f"Found price (whole+fraction): ${price}")
+                    return price
                 except:
                     pass
-                
-                # Combine whole and fraction
-                price = float(f"{whole_text}.{fraction_text}")
-                print(f"Found price (whole+fraction): ${price}")
-                return price
-            except:
-                pass
             
             # Method 3: Old price selectors (fallback)
-            price_selectors = [
-                (By.ID, "priceblock_ourprice"),
-                (By.ID, "priceblock_dealprice"),
-            ]
-            
-            for selector_type, selector in price_selectors:
-                try:
-                    price_element = self.driver.find_element(selector_type, selector)
-                    price_text = price_element.text
-                    # Extract numeric value
-                    price_match = re.search(r'[\d,]+\.?\d*', price_text)
-                    if price_match:
-                        price = float(price_match.group().replace(',', ''))
-                        print(f"Found price (fallback): ${price}")
-                        return price
-                except:
-                    continue
+            with self._span('buybox_price/priceblock'):
+                price_selectors = [
+                    (By.ID, "priceblock_ourprice"),
+                    (By.ID, "priceblock_dealprice"),
+                ]
+                
+                for selector_type, selector in price_selectors:
+                    try:
+                        price_element = self.driver.find_element(selector_type, selector)
+                        price_text = price_element.text
+                        # Extract numeric value
+                        price_match = re.search(r'[\d,]+\.?\d*', price_text)
+                        if price_match:
+                            price = float(price_match.group().replace(',', ''))
+                            print(f"Found price (fallback): ${price}")
+                            return price
+                    except:
+                        continue
             
             print("No price found")
             return None
@@ -210,31 +565,33 @@ class AmazonScraper:
             rankings = []
             
             # Method 1: Look for specific SalesRank list items
-            try:
-                # This selector often finds the main ranking block
-                elements = self.driver.find_elements(By.XPATH, "//*[contains(text(), 'Best Sellers Rank')]/parent::*")
-                for elem in elements:
-                    text = elem.text
-                    # Extract all rankings from this block
-                    # Pattern: #123 in Category
-                    matches = re.finditer(r'#([\d,]+)\s+in\s+([^\(\n]+)', text)
-                    for match in matches:
-                        rank_num = int(match.group(1).replace(',', ''))
-                        full_text = f"#{match.group(1)} in {match.group(2).strip()}"
-                        rankings.append((rank_num, full_text))
-            except:
-                pass
-                
-            # Method 2: Look for any text containing "#" and "in" (fallback)
-            if not rankings:
+            with self._span('ranking/best_sellers_rank'):
                 try:
-                    body_text = self.driver.find_element(By.TAG_NAME, "body").text
-                    # Limit search to likely areas or just regex the whole body if needed (can be slow/noisy)
-                    # Better to look for specific containers if possible, but let's try a targeted regex on the page source
-                    # actually, let's stick to specific elements to avoid noise
-                    pass
+                    # This selector often finds the main ranking block
+                    elements = self.driver.find_elements(By.XPATH, "//*[contains(text(), 'Best Sellers Rank')]/parent::*")
+                    for elem in elements:
+                        text = elem.text
+                        # Extract all rankings from this block
+                        # Pattern: #123 in Category
+                        matches = re.finditer(r'#([\d,]+)\s+in\s+([^\(\n]+)', text)
+                        for match in matches:
+                            rank_num = int(match.group(1).replace(',', ''))
+                            full_text = f"#{match.group(1)} in {match.group(2).strip()}"
+                            rankings.append((rank_num, full_text))
                 except:
                     pass
+                
+            # Method 2: Look for any text containing "#" and "in" (fallback)
+            if not rankings:
+                with self._span('ranking/body_text'):
+                    try:
+                        body_text = self.driver.find_element(By.TAG_NAME, "body").text
+                        # Limit search to likely areas or just regex the whole body if needed (can be slow/noisy)
+                        # Better to look for specific containers if possible, but let's try a targeted regex on the page source
+                        # actually, let's stick to specific elements to avoid noise
+                        pass
+                    except:
+                        pass
 
             if rankings:
                 # Sort by rank number (ascending) to get the best rank
@@ -259,16 +616,17 @@ class AmazonScraper:
                 (By.XPATH, "//span[@id='acrPopover']/@title"),
             ]
             
-            for selector_type, selector in rating_selectors:
-                try:
-                    rating_element = self.driver.find_element(selector_type, selector)
-                    rating_text = rating_element.text if selector_type != By.XPATH else rating_element.get_attribute("title")
-                    # Extract numeric rating (e.g., "4.5 out of 5 stars" -> 4.5)
-                    rating_match = re.search(r'([\d.]+)\s*out of', rating_text)
-                    if rating_match:
-                        return float(rating_match.group(1))
-                except:
-                    continue
+            with self._span('review/selectors'):
+                for selector_type, selector in rating_selectors:
+                    try:
+                        rating_element = self.driver.find_element(selector_type, selector)
+                        rating_text = rating_element.text if selector_type != By.XPATH else rating_element.get_attribute("title")
+                        # Extract numeric rating (e.g., "4.5 out of 5 stars" -> 4.5)
+                        rating_match = re.search(r'([\d.]+)\s*out of', rating_text)
+                        if rating_match:
+                            return float(rating_match.group(1))
+                    except:
+                        continue
             
             return None
         except Exception as e:
@@ -278,57 +636,71 @@ class AmazonScraper:
     def _count_photos(self):
         """Count the number of product photos"""
         try:
+            # Fast path: the gallery data embedded in the page lists every image,
+            # including the ones hidden behind the "+N" thumbnail
+            with self._span('photos/embedded'):
+                try:
+                    embedded_count = count_embedded_images(self._page_source())
+                    if embedded_count:
+                        print(f"Found {embedded_count} images via embedded gallery data")
+                        return embedded_count
+                except Exception:
+                    pass
+            
             # Look for image thumbnails in the image block
             image_count = 0
             
             # Method 1: Count thumbnail images (most reliable)
-            try:
-                thumbnails = self.driver.find_elements(By.CSS_SELECTOR, "#altImages ul li.imageThumbnail")
-                if thumbnails:
-                    image_count = len(thumbnails)
-                    
-                    # Check for "+X" overlay on the last thumbnail
-                    # The overlay is often in a span following the input, or part of the button label
-                    try:
-                        # Look for text like "5+" or "+5" in the altImages section
-                        overlay_elements = self.driver.find_elements(By.CSS_SELECTOR, "#altImages .a-button-text span")
-                        for elem in overlay_elements:
-                            text = elem.text.strip()
-                            # Check for pattern like "5+" or "+5"
-                            match = re.search(r'(\d+)\+', text) or re.search(r'\+(\d+)', text)
-                            if match:
-                                hidden_count = int(match.group(1))
-                                print(f"Found hidden images overlay: {text} (adding {hidden_count})")
-                                image_count += hidden_count
-                                break
-                    except:
-                        pass
+            with self._span('photos/thumbnails'):
+                try:
+                    thumbnails = self.driver.find_elements(By.CSS_SELECTOR, "#altImages ul li.imageThumbnail")
+                    if thumbnails:
+                        image_count = len(thumbnails)
                         
-                    print(f"Found {image_count} images via thumbnails")
-                    return image_count
-            except:
-                pass
+                        # Check for "+X" overlay on the last thumbnail
+                        # The overlay is often in a span following the input, or part of the button label
+                        try:
+                            # Look for text like "5+" or "+5" in the altImages section
+                            overlay_elements = self.driver.find_elements(By.CSS_SELECTOR, "#altImages .a-button-text span")
+                            for elem in overlay_elements:
+                                text = elem.text.strip()
+                                # Check for pattern like "5+" or "+5"
+                                match = re.search(r'(\d+)\+', text) or re.search(r'\+(\d+)', text)
+                                if match:
+                                    hidden_count = int(match.group(1))
+                                    print(f"Found hidden images overlay: {text} (adding {hidden_count})")
+                                    image_count += hidden_count
+                                    break
+                        except:
+                            pass
+                        
+                        print(f"Found {image_count} images via thumbnails")
+                        return image_count
+                except:
+                    pass
             
             # Method 2: Count all items in altImages (includes videos)
-            try:
-                all_items = self.driver.find_elements(By.CSS_SELECTOR, "#altImages ul li")
-                video_items = self.driver.find_elements(By.CSS_SELECTOR, "#altImages ul li.videoThumbnail")
-                image_count = len(all_items) - len(video_items)
-                if image_count > 0:
-                    print(f"Found {image_count} images (total items: {len(all_items)}, videos: {len(video_items)})")
-                    return image_count
-            except:
-                pass
+            with self._span('photos/alt_images'):
+                try:
+                    all_items = self.driver.find_elements(By.CSS_SELECTOR, "#altImages ul li")
+                    video_items = self.driver.find_elements(By.CSS_SELECTOR, "#altImages ul li.videoThumbnail")
+                    image_count = len(all_items) - len(video_items)
+                    if image_count > 0:
+                        print(f"Found {image_count} images (total items: {len(all_items)}, videos: {len(video_items)})")
+                        return image_count
+                except:
+                    pass
             
             # Method 3: Alternative selector
-            try:
-                images = self.driver.find_elements(By.CSS_SELECTOR, "#imageBlock img")
-                if images:
-                    image_count = len(images)
-                    print(f"Found {image_count} images via imageBlock")
-                    return image_count
-            except:
-                pass
+            with self._span('photos/image_block'):
+                try:
+                    images = self.driver.find_elements(By.CSS_SELECTOR, "#imageBlock img")
+                    if images:
+                        image_count = len(images)
+                        print(f"Found {image_count} images via imageBlock")
+                        return image_count
+                except:
+                    pass
             
             print("No images found")
             return 0
@@ -339,20 +711,30 @@ class AmazonScraper:
     def _check_videos(self):
         """Check if product has videos (excluding review videos)"""
         try:
-            # Look for video elements in the image block
-            video_selectors = [
-                (By.CSS_SELECTOR, "#altImages ul li.videoThumbnail"),
-                (By.CSS_SELECTOR, "li[data-csa-c-type='video']"),
-                (By.XPATH, "//li[contains(@class, 'video')]"),
-            ]
-            
-            for selector_type, selector in video_selectors:
+            # Fast path: videos listed in the embedded gallery data. No videos there
+            # isn't conclusive (some pages load them separately), so fall through
+            with self._span('videos/embedded'):
                 try:
-                    videos = self.driver.find_elements(selector_type, selector)
-                    if videos and len(videos) > 0:
+                    if count_embedded_videos(self._page_source()):
                         return "YES"
-                except:
-                    continue
+                except Exception:
+                    pass
+            
+            # Look for video elements in the image block
+            with self._span('videos/selectors'):
+                video_selectors = [
+                    (By.CSS_SELECTOR, "#altImages ul li.videoThumbnail"),
+                    (By.CSS_SELECTOR, "li[data-csa-c-type='video']"),
+                    (By.XPATH, "//li[contains(@class, 'video')]"),
+                ]
+                
+                for selector_type, selector in video_selectors:
+                    try:
+                        videos = self.driver.find_elements(selector_type, selector)
+                        if videos and len(videos) > 0:
+                            return "YES"
+                    except:
+                        continue
             
             return "NO"
         except Exception as e:
@@ -362,21 +744,31 @@ class AmazonScraper:
     def _count_bullet_points(self):
         """Count the number of bullet points in product description"""
         try:
+            # Fast path: count the bullets in the page source in one pass
+            with self._span('bullet_points/embedded'):
+                try:
+                    count = count_bullets(self._page_source())
+                    if count:
+                        return "YES" if count >= 5 else "NO"
+                except Exception:
+                    pass
+            
             bullet_selectors = [
                 (By.CSS_SELECTOR, "#feature-bullets ul li"),
                 (By.XPATH, "//div[@id='feature-bullets']//li"),
             ]
             
-            for selector_type, selector in bullet_selectors:
-                try:
-                    bullets = self.driver.find_elements(selector_type, selector)
-                    # Filter out empty bullets
-                    valid_bullets = [b for b in bullets if b.text.strip()]
-                    if valid_bullets:
-                        count = len(valid_bullets)
-                        return "YES" if count >= 5 else "NO"
-                except:
-                    continue
+            with self._span('bullet_points/element_text'):
+                for selector_type, selector in bullet_selectors:
+                    try:
+                        bullets = self.driver.find_elements(selector_type, selector)
+                        # Filter out empty bullets
+                        valid_bullets = [b for b in bullets if b.text.strip()]
+                        if valid_bullets:
+                            count = len(valid_bullets)
+                            return "YES" if count >= 5 else "NO"
+                    except:
+                        continue
             
             return "NO"
         except Exception as e:
@@ -386,113 +778,383 @@ class AmazonScraper:
     def close(self):
         """Close the browser"""
         self.driver.quit()
+        if self.proxy_exit is not None:
+            self.proxy_pool.release(self.proxy_exit)
+            self.proxy_exit = None
+
+
+def parse_fields(value):
+    """Turn 'all', 'price_check' or a comma-separated list of FIELDS into a field list (None = all)"""
+    if value is None:
+        return None
+    names = value if isinstance(value, (list, tuple, set)) else str(value).split(',')
+    names = [name.strip().lower() for name in names if name and name.strip()]
+    if not names or names == ['all']:
+        return None
+    if names == ['price_check']:
+        return list(PRICE_CHECK_FIELDS)
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(FIELDS)}")
+    if set(names) | {'link'} == set(FIELDS):
+        return None
+    # Keep sheet column order
+    return [field for field in FIELDS if field in names]
 
 
-def process_excel(file_path, output_path=None):
-    """Process the Excel file and fill in the scraped data"""
+def _priority_column(ws):
+    """Column number of a "Priority" header in row 1, or None"""
+    for cell in ws[1]:
+        if isinstance(cell.value, str) and cell.value.strip().lower() == 'priority':
+            return cell.column
+    return None
+
+
+def _parse_priority(value):
+    """1 is most important; blank or unreadable values sort last"""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in PRIORITY_WORDS:
+            return PRIORITY_WORDS[text]
+        try:
+            return float(text)
+        except ValueError:
+            pass
+    return None
+
+
+def read_asin_rows(ws):
+    """Collect the rows to scrape (starting from row 3, since row 2 is the example)"""
+    priority_column = _priority_column(ws)
+    rows = []
+    for row_num in range(3, ws.max_row + 1):
+        asin = ws.cell(row_num, 2).value  # Column B
+        if not asin:
+            continue
+        rows.append({
+            'row_num': row_num,
+            'asin': str(asin).strip(),  # Clean ASIN (remove spaces)
+            'expected_price': ws.cell(row_num, 3).value,  # Column C
+            'priority': _parse_priority(ws.cell(row_num, priority_column).value) if priority_column else None,
+        })
+    return rows
+
+
+def order_by_priority(rows):
+    """Most important rows first, sheet order within a priority, unprioritized rows last"""
+    return sorted(rows, key=lambda row: (row['priority'] is None, row['priority'] or 0))
+
+
+def write_deferred_row(ws, row_num):
+    """Mark a row that was skipped to meet a deadline"""
+    ws.cell(row_num, 6).value = "DEFERRED"
+    ws.cell(row_num, 6).fill = YELLOW_FILL
+
+
+def write_result_row(ws, row_num, data, expected_price, fields=None):
+    """Fill columns F-M of one row with scraped data and validation colors
+    
+    Only the requested fields are written; other columns keep their old values.
+    """
+    fields = FIELDS if fields is None else fields
+    
+    # Column F: Link
+    ws.cell(row_num, 6).value = data['link']
+    
+    # Column G: BuyBox Seller
+    if 'buybox_seller' in fields:
+        buybox_seller = data['buybox_seller']
+        if buybox_seller and 'amazon.com' in buybox_seller.lower():
+            ws.cell(row_num, 7).value = "YES"
+            ws.cell(row_num, 7).fill = GREEN_FILL
+        else:
+            ws.cell(row_num, 7).value = buybox_seller or "Unknown"
+            ws.cell(row_num, 7).fill = RED_FILL
+    
+    # Column H: Price
+    buybox_price = data['buybox_price']
+    if 'buybox_price' in fields and buybox_price is not None:
+        ws.cell(row_num, 8).value = buybox_price
+        if expected_price and abs(buybox_price - expected_price) < 0.01:
+            ws.cell(row_num, 8).fill = GREEN_FILL
+        else:
+            ws.cell(row_num, 8).fill = RED_FILL
+    
+    # Column I: Ranking
+    if 'ranking' in fields:
+        ws.cell(row_num, 9).value = data['ranking']
+    
+    # Column J: Review
+    if 'review' in fields:
+        ws.cell(row_num, 10).value = data['review']
+    
+    # Column K: Photos
+    if 'photos' in fields:
+        photo_count = data['photos']
+        if photo_count >= 8:
+            ws.cell(row_num, 11).value = "GOOD"
+            ws.cell(row_num, 11).fill = GREEN_FILL
+        else:
+            ws.cell(row_num, 11).value = photo_count
+            ws.cell(row_num, 11).fill = RED_FILL
+    
+    # Column L: Videos
+    if 'videos' in fields:
+        ws.cell(row_num, 12).value = data['videos']
+    
+    # Column M: Bullet Points
+    if 'bullet_points' in fields:
+        ws.cell(row_num, 13).value = data['bullet_points']
+
+
+def select_rows(rows, first_row=None, last_row=None, shard_index=0, shard_count=1):
+    """Keep rows between first_row and last_row (sheet row numbers), then this shard's slice
+    
+    The selected rows are cut into shard_count contiguous slices of nearly equal
+    size, so machines given the same range and different indexes never overlap.
+    """
+    rows = [row for row in rows
+            if (first_row is None or row['row_num'] >= first_row)
+            and (last_row is None or row['row_num'] <= last_row)]
+    if shard_count > 1:
+        start = len(rows) * shard_index // shard_count
+        end = len(rows) * (shard_index + 1) // shard_count
+        rows = rows[start:end]
+    return rows
+
+
+def result_record(row, data, fields=None, status=None):
+    """One row's result as a flat dict, for CSV and JSON output"""
+    record = {
+        'row': row['row_num'],
+        'asin': row['asin'],
+        'expected_price': row['expected_price'],
+        'status': status or ("ok" if data else "failed"),
+    }
+    for field in FIELDS:
+        if fields is None or field == 'link' or field in fields:
+            record[field] = data[field] if data else None
+    return record
+
+
+def write_records(path, records, output_format):
+    """Write result records as CSV or JSON, sorted by sheet row"""
+    records = sorted(records, key=lambda record: record['row'])
+    if output_format == 'json':
+        with open(path, 'w') as f:
+            json.dump(records, f, indent=2, default=str)
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(records[0]) if records else ['row', 'asin'])
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def process_excel(file_path, output_path=None, proxy_pool=None, fields=None,
+                  fetchers=None, parse_workers=None, deadline=None,
+                  first_row=None, last_row=None, shard_index=0, shard_count=1,
+                  rate_per_minute=None, output_format=None, progress=None, adaptive=None,
+                  trace_path=None, prefetch=None):
+    """Process the Excel file and fill in the scraped data
+    
+    fields limits the scrape to a subset of FIELDS (see parse_fields); None means all.
+    fetchers browsers load pages in parallel and parse_workers processes parse them
+    (see scrape_pipeline); both default to SCRAPER_FETCHERS / SCRAPER_PARSE_WORKERS.
+    With a deadline (datetime), fetchers are added up to SCRAPER_MAX_FETCHERS when
+    behind, and rows that still can't make it are marked DEFERRED (see job_budget).
+    first_row/last_row and shard_index/shard_count pick the rows (see select_rows).
+    rate_per_minute caps page loads across all fetchers. output_format is 'xlsx'
+    (the updated workbook), 'csv' or 'json' (one record per scraped row); by default
+    it follows output_path's extension. progress(done, total, eta) is called after
+    each row. adaptive (default SCRAPER_ADAPTIVE) lets aimd.AIMDController move the
+    fetcher count between 1 and SCRAPER_MAX_FETCHERS based on failures and page time.
+    With trace_path, a span trace of the run (see tracing.py) is written there at the end.
+    prefetch (default SCRAPER_PREFETCH) pages per browser load in background tabs
+    while the current one is read (see AmazonScraper.prefetch).
+    Returns counts of scraped, failed and deferred rows.
+    """
+    fetchers = FETCHERS if fetchers is None else fetchers
+    adaptive = ADAPTIVE if adaptive is None else adaptive
+    parse_workers = PARSE_WORKERS if parse_workers is None else parse_workers
+    prefetch = PREFETCH_PAGES if prefetch is None else prefetch
+    if output_format is None:
+        extension = os.path.splitext(output_path or '')[1].lstrip('.').lower()
+        output_format = extension if extension in OUTPUT_FORMATS else 'xlsx'
     if output_path is None:
-        output_path = file_path.replace('.xlsx', '_updated.xlsx')
+        output_path = os.path.splitext(file_path)[0] + f'_updated.{output_format}'
+    if os.path.abspath(output_path) == os.path.abspath(file_path):
+        raise ValueError(f"Refusing to write the output over the input sheet {file_path}")
     
     # Load workbook
     wb = openpyxl.load_workbook(file_path)
     ws = wb.active
     
-    # Initialize scraper
-    scraper = AmazonScraper(headless=True)
+    if proxy_pool is None:
+        proxy_pool = ProxyPool.from_env()
     
-    try:
-        # Process each row (starting from row 3, since row 2 is the example)
-        for row_num in range(3, ws.max_row + 1):
-            asin = ws.cell(row_num, 2).value  # Column B
-            expected_price = ws.cell(row_num, 3).value  # Column C
-            
-            if not asin:
-                continue
-            
-            # Clean ASIN (remove spaces)
-            asin = str(asin).strip()
-            
-            print(f"\n{'='*60}")
-            print(f"Processing Row {row_num}: {asin}")
-            print(f"{'='*60}")
-            
-            # Scrape product data
-            data = scraper.scrape_product(asin, expected_price)
-            
-            if data:
-                # Column F: Link
-                ws.cell(row_num, 6).value = data['link']
-                
-                # Column G: BuyBox Seller
-                buybox_seller = data['buybox_seller']
-                if buybox_seller and 'amazon.com' in buybox_seller.lower():
-                    ws.cell(row_num, 7).value = "YES"
-                    ws.cell(row_num, 7).fill = GREEN_FILL
-                else:
-                    ws.cell(row_num, 7).value = buybox_seller or "Unknown"
-                    ws.cell(row_num, 7).fill = RED_FILL
-                
-                # Column H: Price
-                buybox_price = data['buybox_price']
-                if buybox_price is not None:
-                    ws.cell(row_num, 8).value = buybox_price
-                    if expected_price and abs(buybox_price - expected_price) < 0.01:
-                        ws.cell(row_num, 8).fill = GREEN_FILL
-                    else:
-                        ws.cell(row_num, 8).fill = RED_FILL
-                
-                # Column I: Ranking
-                ws.cell(row_num, 9).value = data['ranking']
-                
-                # Column J: Review
-                ws.cell(row_num, 10).value = data['review']
-                
-                # Column K: Photos
-                photo_count = data['photos']
-                if photo_count >= 8:
-                    ws.cell(row_num, 11).value = "GOOD"
-                    ws.cell(row_num, 11).fill = GREEN_FILL
-                else:
-                    ws.cell(row_num, 11).value = photo_count
-                    ws.cell(row_num, 11).fill = RED_FILL
-                
-                # Column L: Videos
-                ws.cell(row_num, 12).value = data['videos']
-                
-                # Column M: Bullet Points
-                ws.cell(row_num, 13).value = data['bullet_points']
-                
-                print(f"✓ Successfully processed {asin}")
-            else:
-                print(f"✗ Failed to scrape {asin}")
-            
-            # Save progress after each row
+    rows = select_rows(read_asin_rows(ws), first_row, last_row, shard_index, shard_count)
+    budget = JobBudget(deadline, max(fetchers, MAX_FETCHERS), raise_concurrency=not adaptive)
+    records = []
+    counts = {'scraped': 0, 'failed': 0, 'deferred': 0}
+    
+    def save():
+        if output_format == 'xlsx':
             wb.save(output_path)
-            print(f"Progress saved to {output_path}")
-            
-            # Small delay between requests
-            time.sleep(2)
+        else:
+            write_records(output_path, records, output_format)
+    
+    def save_row(row, data):
+        asin = row['asin']
+        if data:
+            write_result_row(ws, row['row_num'], data, row['expected_price'], fields)
+            counts['scraped'] += 1
+            print(f"✓ Successfully processed {asin} (row {row['row_num']})")
+        else:
+            counts['failed'] += 1
+            print(f"✗ Failed to scrape {asin} (row {row['row_num']})")
+        records.append(result_record(row, data, fields))
+        
+        if controller is not None:
+            controller.observe(data)
+        for deferred in budget.check(pipeline, counts['scraped'] + counts['failed']):
+            write_deferred_row(ws, deferred['row_num'])
+            records.append(result_record(deferred, None, fields, status="deferred"))
+            counts['deferred'] += 1
+        
+        # Save progress after each row
+        save()
+        print(f"Progress saved to {output_path}")
+        if progress is not None:
+            progress(counts['scraped'] + counts['failed'], len(rows) - counts['deferred'], budget.eta)
     
+    rate_limiter = TokenBucket(rate_per_minute / 60.0) if rate_per_minute else None
+    tracer = Tracer(os.path.basename(file_path)) if trace_path else None
+    pipeline = ScrapePipeline(lambda: AmazonScraper(headless=True, proxy_pool=proxy_pool, tracer=tracer,
+                                                    prefetch_pages=prefetch), fields,
+                              fetchers=fetchers, parse_workers=parse_workers, flights=flights,
+                              rate_limiter=rate_limiter, tracer=tracer, prefetch=prefetch,
+                              row_delay=ROW_DELAY)  # Small delay between requests
+    controller = AIMDController(pipeline, max(fetchers, MAX_FETCHERS)) if adaptive else None
+    try:
+        pipeline.run(order_by_priority(rows), save_row)
     finally:
-        scraper.close()
-        wb.save(output_path)
+        save()
+        if tracer is not None:
+            print(f"Trace written to {tracer.export(trace_path)}")
         print(f"\n{'='*60}")
         print(f"Complete! Output saved to: {output_path}")
         print(f"{'='*60}")
+    return counts
 
 
-if __name__ == "__main__":
-    import sys
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(max(0, seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class ProgressLine:
+    """Rows done, pages/sec and ETA on one line of stderr, redrawn in place on a terminal"""
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.live = self.stream.isatty()
+        self.started = time.monotonic()
     
-    input_file = "/Users/leibykoplowitz/Downloads/2025 master maintenance.xlsx"
+    def __call__(self, done, total, eta):
+        elapsed = time.monotonic() - self.started
+        rate = done / elapsed if elapsed else 0.0
+        line = f"{done}/{total} rows  {rate:.2f} pages/s"
+        if eta is not None and done < total:
+            line += f"  ETA {eta:%H:%M:%S} ({_format_duration((eta - datetime.now()).total_seconds())} left)"
+        if self.live:
+            self.stream.write("\r" + line.ljust(72))
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
     
-    if len(sys.argv) > 1:
-        input_file = sys.argv[1]
+    def close(self):
+        if self.live:
+            self.stream.write("\n")
+
+
+def _row_range(value):
+    """argparse type for --rows: '3-12', '3-' or '-12'"""
+    first, sep, last = value.partition('-')
+    try:
+        if not sep:
+            return int(first), int(first)
+        return (int(first) if first else None), (int(last) if last else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a row range like 3-12, got {value!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fill in a maintenance sheet with data scraped from Amazon",
+        epilog="Example: python3 amazon_scraper.py sheet.xlsx --rows 3-102 --shard-index 0 --shard-count 4 --format csv")
+    parser.add_argument("input", help="Maintenance workbook (.xlsx)")
+    parser.add_argument("legacy_fields", nargs="?", help=argparse.SUPPRESS)
+    parser.add_argument("-o", "--output", help="Output path (default: INPUT_updated.FORMAT)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="Output format (default: from --output, else xlsx)")
+    parser.add_argument("--fields", help="'all', 'price_check' or a comma-separated list of: " + ", ".join(FIELDS[1:]))
+    parser.add_argument("--rows", type=_row_range, metavar="FIRST-LAST", help="Sheet rows to scrape, e.g. 3-12")
+    parser.add_argument("--shard-index", type=int, default=0, help="Which slice of the rows this machine takes (0-based)")
+    parser.add_argument("--shard-count", type=int, default=1, help="Number of machines splitting the rows")
+    parser.add_argument("--workers", type=int, default=FETCHERS, help="Browsers loading pages in parallel")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                        help="Processes parsing pages (0 = parse through the browser)")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH_PAGES, metavar="N",
+                        help="Pages each browser loads in background tabs while the current one is read")
+    parser.add_argument("--adaptive", action="store_true", default=ADAPTIVE,
+                        help="Start at --workers and adjust to failures and page time, up to SCRAPER_MAX_FETCHERS")
+    parser.add_argument("--rate", type=float, help="Most page loads per minute, across all workers")
+    parser.add_argument("--deadline", help="Finish by this time (HH:MM or an ISO date and time)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="Write a span trace (Chrome trace-event JSON) here; with SCRAPER_TRACE=1 "
+                             "it defaults to OUTPUT_trace.json")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the progress line")
+    args = parser.parse_args(argv)
+    
+    if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    try:
+        fields = parse_fields(args.fields or args.legacy_fields)
+        deadline = parse_deadline(args.deadline)
+    except ValueError as e:
+        parser.error(str(e))
+    first_row, last_row = args.rows or (None, None)
     
-    output_file = input_file.replace('.xlsx', '_updated.xlsx')
+    output_format = args.format
+    output_file = args.output
+    if output_file is None:
+        shard = f"_shard{args.shard_index + 1}of{args.shard_count}" if args.shard_count > 1 else ""
+        output_file = os.path.splitext(args.input)[0] + f"_updated{shard}.{output_format or 'xlsx'}"
+    if os.path.abspath(output_file) == os.path.abspath(args.input):
+        parser.error("--output must not be the input sheet")
+    trace_path = args.trace
+    if trace_path is None and TRACING:
+        trace_path = os.path.splitext(output_file)[0] + "_trace.json"
     
     print(f"Starting Amazon scraper...")
-    print(f"Input file: {input_file}")
+    print(f"Input file: {args.input}")
     print(f"Output file: {output_file}")
+    print(f"Fields: {', '.join(fields or FIELDS)}")
     
-    process_excel(input_file, output_file)
+    progress = ProgressLine()
+    try:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull) if args.quiet else nullcontext():
+            counts = process_excel(args.input, output_file, fields=fields, fetchers=args.workers,
+                                   parse_workers=args.parse_workers, deadline=deadline,
+                                   first_row=first_row, last_row=last_row,
+                                   shard_index=args.shard_index, shard_count=args.shard_count,
+                                   rate_per_minute=args.rate, output_format=output_format, progress=progress,
+                                   adaptive=args.adaptive, trace_path=trace_path, prefetch=args.prefetch)
+    finally:
+        progress.close()
+    print(f"Scraped {counts['scraped']}, failed {counts['failed']}, deferred {counts['deferred']}")
+
+
+if __name__ == "__main__":
+    main()
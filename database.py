@@ -14,23 +14,47 @@ def init_db():
             filename TEXT NOT NULL,
             original_filename TEXT NOT NULL,
             upload_date TEXT NOT NULL,
-            status TEXT DEFAULT 'Ready', -- Ready, Running, Completed, Failed
+            status TEXT DEFAULT 'Ready', -- Ready, Queued, Running, Completed, Cancelled, Failed, Interrupted
             last_scraped TEXT,
             result_filename TEXT,
             progress_current INTEGER DEFAULT 0,
-            progress_total INTEGER DEFAULT 0
+            progress_total INTEGER DEFAULT 0,
+            content_hash TEXT,
+            file_size INTEGER DEFAULT 0,
+            fields TEXT, -- comma-separated subset of columns to scrape, NULL = all
+            deadline TEXT, -- finish-by time for the current job, NULL = none
+            eta TEXT, -- estimated finish time of the current job
+            deferred INTEGER DEFAULT 0, -- rows left unscraped to meet the deadline
+            concurrency INTEGER DEFAULT 0, -- browsers the current job is using
+            concurrency_log TEXT -- recent concurrency changes and why, one per line
         )
     ''')
+    # Older databases were created before these columns existed
+    _add_column_if_missing(c, 'content_hash', 'TEXT')
+    _add_column_if_missing(c, 'file_size', 'INTEGER DEFAULT 0')
+    _add_column_if_missing(c, 'fields', 'TEXT')
+    _add_column_if_missing(c, 'deadline', 'TEXT')
+    _add_column_if_missing(c, 'eta', 'TEXT')
+    _add_column_if_missing(c, 'deferred', 'INTEGER DEFAULT 0')
+    _add_column_if_missing(c, 'concurrency', 'INTEGER DEFAULT 0')
+    _add_column_if_missing(c, 'concurrency_log', 'TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)')
     conn.commit()
     conn.close()
 
-def add_file(filename, original_filename):
+def _add_column_if_missing(c, column, definition):
+    """Add a column to the files table unless it is already there"""
+    c.execute('PRAGMA table_info(files)')
+    if column not in [row[1] for row in c.fetchall()]:
+        c.execute(f'ALTER TABLE files ADD COLUMN {column} {definition}')
+
+def add_file(filename, original_filename, content_hash=None, file_size=0, fields=None):
     """Add a new file to the database"""
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
     upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute('INSERT INTO files (filename, original_filename, upload_date) VALUES (?, ?, ?)',
-              (filename, original_filename, upload_date))
+    c.execute('INSERT INTO files (filename, original_filename, upload_date, content_hash, file_size, fields) VALUES (?, ?, ?, ?, ?, ?)',
+              (filename, original_filename, upload_date, content_hash, file_size, fields))
     file_id = c.lastrowid
     conn.commit()
     conn.close()
@@ -56,6 +80,17 @@ def get_file(file_id):
     conn.close()
     return dict(row) if row else None
 
+def find_file_by_hash(content_hash, fields=None):
+    """Get the most recent file with identical content and field selection, if any"""
+    conn = sqlite3.connect(DB_NAME)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT * FROM files WHERE content_hash = ? AND fields IS ? ORDER BY upload_date DESC, id DESC LIMIT 1',
+              (content_hash, fields))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
 def update_status(file_id, status, result_filename=None):
     """Update the status of a file"""
     conn = sqlite3.connect(DB_NAME)
@@ -72,6 +107,16 @@ def update_status(file_id, status, result_filename=None):
     conn.commit()
     conn.close()
 
+def mark_interrupted():
+    """Mark jobs left Queued or Running by a previous process as Interrupted. Returns how many"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute("UPDATE files SET status = 'Interrupted' WHERE status IN ('Queued', 'Running')")
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
 def update_progress(file_id, current, total):
     """Update the progress of a scraping task"""
     conn = sqlite3.connect(DB_NAME)
@@ -81,6 +126,33 @@ def update_progress(file_id, current, total):
     conn.commit()
     conn.close()
 
+def set_deadline(file_id, deadline):
+    """Set (or clear) the deadline for the next job and reset its estimate"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute('UPDATE files SET deadline = ?, eta = NULL, deferred = 0 WHERE id = ?',
+              (deadline, file_id))
+    conn.commit()
+    conn.close()
+
+def update_eta(file_id, eta, deferred):
+    """Record the estimated finish time and the number of deferred rows"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute('UPDATE files SET eta = ?, deferred = ? WHERE id = ?',
+              (eta, deferred, file_id))
+    conn.commit()
+    conn.close()
+
+def update_concurrency(file_id, concurrency, log=None):
+    """Record how many browsers a job is using and the recent reasons for changing it"""
+    conn = sqlite3.connect(DB_NAME)
+    c = conn.cursor()
+    c.execute('UPDATE files SET concurrency = ?, concurrency_log = ? WHERE id = ?',
+              (concurrency, log, file_id))
+    conn.commit()
+    conn.close()
+
 def delete_file(file_id):
     """Delete a file from the database"""
     conn = sqlite3.connect(DB_NAME)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Fake Amazon Server
+Serves synthetic /dp/{asin} product pages (and /gp/aod/ajax offer
+listings) with the same structure the
+scraper reads from real Amazon, so scraping can be measured offline.
+Latency, jitter, intermittent 503s and robot-check pages can be injected.
+
+FakeProxy stands in for a proxy exit (forwarding, slow or blocked) so
+proxy_pool can be tested without real proxies. FakeScraper stands in for
+AmazonScraper itself, answering from the same products with no browser.
+
+Every ASIN always gets the same product, and faults are drawn from a
+seeded RNG per (ASIN, attempt), so runs are reproducible.
+
+    python3 fake_amazon_server.py --port 8001 --latency 0.3 --error-rate 0.05
+    AMAZON_BASE_URL=http://127.0.0.1:8001 python3 amazon_scraper.py sheet.xlsx
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+
+THIRD_PARTY_SELLERS = ["Acme Goods", "HomeDeals Direct", "Kitchen Outlet", "BrightStar Supply"]
+CATEGORIES = ["Kitchen & Dining", "Home & Kitchen", "Tools & Home Improvement", "Sports & Outdoors"]
+SUBCATEGORIES = ["Mixing Bowls", "Storage Containers", "Measuring Cups", "Water Bottles"]
+
+# Thumbnails shown before Amazon collapses the rest into a "+N" button
+VISIBLE_THUMBNAILS = 6
+
+PRODUCT_PAGE = Template("""<!DOCTYPE html>
+<html>
+<head><title>Amazon.com: $title</title></head>
+<body>
+<div id="dp">
+  <h1 id="title"><span id="productTitle">$title</span></h1>
+  <div id="averageCustomerReviews">
+    <span id="acrPopover" title="$rating out of 5 stars">
+      <i data-hook="average-star-rating" class="a-icon a-icon-star"><span class="a-icon-alt">$rating out of 5 stars</span></i>
+    </span>
+    <span data-hook="rating-out-of-text">$rating out of 5</span>
+  </div>
+  <script type="text/javascript">
+    P.when('A').register("ImageBlockATF", function(A){
+      var data = {
+        'colorImages': { 'initial': $images_json },
+        'colorToAsin': {'initial': {}},
+        'heroImage': {},
+        'videos': $videos_json,
+        'title': "$title"
+      };
+      A.trigger('P.AboveTheFold');
+      return data;
+    });
+  </script>
+  <div id="imageBlock">
+    <div id="altImages">
+      <ul>
+$thumbnails
+      </ul>
+    </div>
+  </div>
+  <div id="corePrice_feature_div">
+    <span class="a-price"><span class="a-offscreen">$$$price</span><span aria-hidden="true"><span class="a-price-symbol">$$</span><span class="a-price-whole">$price_whole<span class="a-price-decimal">.</span></span><span class="a-price-fraction">$price_fraction</span></span></span>
+  </div>
+  <div id="buybox">
+    <div id="merchant-info">$merchant_info</div>
+    <input id="add-to-cart-button" type="submit" value="Add to Cart">
+  </div>
+  <div id="feature-bullets">
+    <ul class="a-unordered-list a-vertical">
+$bullets
+    </ul>
+  </div>
+  <div id="detailBulletsWrapper_feature_div">
+    <ul>
+      <li><span class="a-text-bold">Best Sellers Rank:</span> #$rank in $category (<a href="#">See Top 100</a>)
+        <ul><li>#$sub_rank in $subcategory</li></ul>
+      </li>
+    </ul>
+  </div>
+</div>
+</body>
+</html>
+""")
+
+OFFER_PAGE = Template("""<div id="aod-container">
+  <div id="aod-pinned-offer">
+    <div id="aod-price-0"><span class="a-price"><span class="a-offscreen">$$$price</span></span></div>
+    <div id="aod-offer-shipsFrom"><div class="a-fixed-left-grid"><div class="a-fixed-left-grid-col a-col-left"><span>Ships from</span></div><div class="a-fixed-left-grid-col a-col-right"><span class="a-size-small a-color-base">$seller</span></div></div></div>
+    <div id="aod-offer-soldBy"><div class="a-fixed-left-grid"><div class="a-fixed-left-grid-col a-col-left"><span>Sold by</span></div><div class="a-fixed-left-grid-col a-col-right"><a class="a-size-small a-link-normal" href="#">$seller</a></div></div></div>
+  </div>
+</div>
+""")
+
+ROBOT_CHECK_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Robot Check</title></head>
+<body>
+<h4>Enter the characters you see below</h4>
+<p>Sorry, we just need to make sure you're not a robot.</p>
+<form method="get" action="/errors/validateCaptcha"><input id="captchacharacters" name="field-keywords"></form>
+</body>
+</html>
+"""
+
+SERVICE_UNAVAILABLE_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Sorry! Something went wrong!</title></head>
+<body>
+<p>Sorry! Something went wrong on our end. Please go back and try again.</p>
+<p>To discuss automated access to Amazon data please contact api-services-support@amazon.com.</p>
+</body>
+</html>
+"""
+
+
+def _rng_for(*parts):
+    """Random generator seeded from the given values, independent of request order"""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def make_product(asin):
+    """The product a given ASIN always maps to, in the scraper's result vocabulary"""
+    rng = _rng_for("product", asin)
+    amazon_sells = rng.random() < 0.7
+    price = round(rng.uniform(5, 250), 2)
+    photos = rng.randint(3, 12)
+    bullet_count = rng.randint(2, 7)
+    rank = rng.randint(100, 250000)
+    sub_rank = rng.randint(1, 500)
+    return {
+        'asin': asin,
+        'title': f"Synthetic Product {asin}",
+        'seller': "Amazon.com" if amazon_sells else rng.choice(THIRD_PARTY_SELLERS),
+        'price': price,
+        'rank': rank,
+        'category': rng.choice(CATEGORIES),
+        'sub_rank': sub_rank,
+        'subcategory': rng.choice(SUBCATEGORIES),
+        'rating': round(rng.uniform(3.0, 5.0), 1),
+        'photos': photos,
+        'videos': rng.randint(0, 2),
+        'bullets': [f"Feature {i + 1} of {asin}: sturdy, practical and easy to clean" for i in range(bullet_count)],
+    }
+
+
+def expected_result(product):
+    """What a correct scrape of the product should return (minus the link)"""
+    best_rank = min((product['rank'], product['category']), (product['sub_rank'], product['subcategory']))
+    return {
+        'buybox_seller': product['seller'],
+        'buybox_price': product['price'],
+        'ranking': f"#{best_rank[0]:,} in {best_rank[1]}",
+        'review': product['rating'],
+        'photos': product['photos'],
+        'videos': "YES" if product['videos'] else "NO",
+        'bullet_points': "YES" if len(product['bullets']) >= 5 else "NO",
+    }
+
+
+class FakeScraper:
+    """AmazonScraper's interface answered from make_product(), without a browser or a server
+
+    delay is slept per page and ASINs in fail come back as None (set them on the
+    class to affect every instance). crash_on exits the process on that ASIN, like a
+    worker node losing power mid-shard. Every page loaded is appended to loads.
+    """
+    delay = 0.0
+    fail = frozenset()
+    prefetch_pages = 0
+
+    def __init__(self, loads=None, crash_on=None, **kwargs):
+        self.loads = loads if loads is not None else []
+        self.crash_on = crash_on
+        self.closed = False
+
+    def _load(self, asin):
+        """Wait out one page load; False if the ASIN is set up to fail"""
+        if asin == self.crash_on:
+            os._exit(1)
+        time.sleep(self.delay)
+        self.loads.append(asin)
+        return asin not in self.fail
+
+    def scrape_product(self, asin, expected_price, fields=None):
+        if not self._load(asin):
+            return None
+        return {'link': f"/dp/{asin}", **expected_result(make_product(asin))}
+
+    def fetch_page(self, asin, fields=None):
+        if not self._load(asin):
+            return None
+        return 'product', {'link': f"/dp/{asin}"}, render_product(make_product(asin))
+
+    def prefetch(self, asin, fields=None):
+        pass
+
+    def discard_prefetch(self, asin):
+        pass
+
+    def clear_prefetch(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def render_offer(product):
+    """The offer listing fragment (/gp/aod/ajax) for a product"""
+    return OFFER_PAGE.substitute(price=f"{product['price']:.2f}", seller=html.escape(product['seller']))
+
+
+def render_product(product):
+    thumbnails = []
+    shown = min(product['photos'], VISIBLE_THUMBNAILS)
+    for i in range(shown):
+        thumbnails.append(f'        <li class="a-spacing-small item imageThumbnail a-declarative">'
+                          f'<span class="a-button-text"><img src="/images/{product["asin"]}_{i}.jpg"></span></li>')
+    hidden = product['photos'] - shown
+    if hidden:
+        thumbnails.append(f'        <li class="a-spacing-small item imageThumbnail">'
+                          f'<span class="a-button-text"><span>{hidden}+</span></span></li>')
+        # The "+N" button replaces the last visible thumbnail
+        thumbnails.pop(shown - 1)
+    for i in range(product['videos']):
+        thumbnails.append(f'        <li class="a-spacing-small item videoThumbnail">'
+                          f'<span class="a-button-text"><img src="/images/{product["asin"]}_video{i}.jpg"></span></li>')
+
+    if product['seller'] == "Amazon.com":
+        merchant_info = "Ships from and sold by Amazon.com."
+    else:
+        merchant_info = f'Ships from and sold by <a href="#">{html.escape(product["seller"])}</a>.'
+
+    images = [{"hiRes": f"/images/{product['asin']}_{i}_SL1500_.jpg",
+               "thumb": f"/images/{product['asin']}_{i}.jpg", "variant": "MAIN" if i == 0 else f"PT0{i}"}
+              for i in range(product['photos'])]
+    videos = [{"title": f"{product['title']} video {i + 1}", "url": f"/videos/{product['asin']}_{i}.mp4",
+               "isHeroVideo": i == 0} for i in range(product['videos'])]
+
+    whole, fraction = f"{product['price']:.2f}".split(".")
+    return PRODUCT_PAGE.substitute(
+        title=html.escape(product['title']),
+        images_json=json.dumps(images),
+        videos_json=json.dumps(videos),
+        rating=product['rating'],
+        thumbnails="\n".join(thumbnails),
+        price=f"{product['price']:.2f}",
+        price_whole=f"{int(whole):,}",
+        price_fraction=fraction,
+        merchant_info=merchant_info,
+        bullets="\n".join(f'      <li><span class="a-list-item">{html.escape(b)}</span></li>'
+                          for b in product['bullets']),
+        rank=f"{product['rank']:,}",
+        category=html.escape(product['category']),
+        sub_rank=f"{product['sub_rank']:,}",
+        subcategory=html.escape(product['subcategory']),
+    )
+
+
+class FakeAmazonServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.1,
+                 error_rate=0.0, captcha_rate=0.0, seed=1):
+        """Configure the server; port 0 picks a free port"""
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.seed = seed
+        self.stats = defaultdict(int)  # outcome -> count
+        self._attempts = defaultdict(int)  # asin -> requests so far
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def respond(self, path):
+        """Decide the (status, body) for a request path, sleeping for the injected latency"""
+        match = re.match(r'^/dp/([A-Za-z0-9]+)', path) or re.match(r'^/gp/aod/ajax.*[?&]asin=([A-Za-z0-9]+)', path)
+        if not match:
+            return 404, "<html><head><title>Page Not Found</title></head><body>Not found</body></html>"
+        asin = match.group(1)
+        render = render_offer if path.startswith('/gp/aod/') else render_product
+
+        with self._lock:
+            self._attempts[asin] += 1
+            attempt = self._attempts[asin]
+        rng = _rng_for("request", self.seed, asin, attempt)
+        time.sleep(max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter)))
+
+        roll = rng.random()
+        if roll < self.error_rate:
+            outcome, status, body = "503", 503, SERVICE_UNAVAILABLE_PAGE
+        elif roll < self.error_rate + self.captcha_rate:
+            outcome, status, body = "robot_check", 200, ROBOT_CHECK_PAGE
+        else:
+            outcome = "offer" if render is render_offer else "product"
+            status, body = 200, render(make_product(asin))
+        with self._lock:
+            self.stats[outcome] += 1
+        return status, body
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.respond(self.path)
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass  # keep harness output readable
+
+        return Handler
+
+
+class FakeProxy:
+    """Local stand-in for one proxy exit, for exercising proxy_pool without real proxies
+
+    mode "ok" forwards requests (after `delay` seconds), "blocked" answers every
+    request with a robot-check page, as an exit Amazon has flagged would.
+    """
+    def __init__(self, mode="ok", delay=0.0, host="127.0.0.1", port=0):
+        self.mode = mode
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def forward(self, url):
+        """(status, body) for a proxied GET of an absolute URL"""
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.delay)
+        if self.mode == "blocked":
+            return 200, ROBOT_CHECK_PAGE
+        try:
+            with self._opener.open(url, timeout=30) as response:
+                return response.status, response.read().decode("utf-8")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+
+    def _handler_class(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = proxy.forward(self.path)
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic Amazon product pages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="Share of requests answered with a robot check")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    fake = FakeAmazonServer(args.host, args.port, args.latency, args.jitter,
+                            args.error_rate, args.captcha_rate, args.seed)
+    print(f"Fake Amazon serving on {fake.url} (Ctrl+C to stop)")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.httpd.server_close()
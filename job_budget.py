@@ -0,0 +1,100 @@
+"""
+Job budgets
+Estimates when a scraping job will finish from the pipeline's per-row
+latency and, when the job has a deadline, steers it towards that deadline:
+first by adding fetchers (up to a cap), then, if even the cap is too slow,
+by deferring the lowest-priority rows that can no longer fit.
+"""
+
+import math
+from datetime import datetime, timedelta
+
+# Finished rows needed before the latency estimate is trusted enough to defer rows
+MIN_SAMPLES = 3
+
+# Share of the remaining time that is planned for, leaving slack for slow rows
+SAFETY_MARGIN = 0.9
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_deadline(value, now=None):
+    """Read a deadline: 'HH:MM' (the next time the clock shows it) or an ISO date and time.
+
+    Returns None for a blank value, raises ValueError for anything else unreadable.
+    """
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip()
+    now = now or datetime.now()
+    try:
+        clock = datetime.strptime(value, "%H:%M")
+    except ValueError:
+        # fromisoformat only accepts a "Z" suffix from Python 3.11 on, and the image runs 3.9
+        if value[-1:] in ("Z", "z"):
+            value = value[:-1] + "+00:00"
+        deadline = datetime.fromisoformat(value)
+        # Everything else here runs on naive local time, e.g. "2026-10-20T08:15Z" becomes local
+        if deadline.tzinfo is not None:
+            deadline = deadline.astimezone().replace(tzinfo=None)
+        return deadline
+    deadline = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    if deadline <= now:
+        deadline += timedelta(days=1)
+    return deadline
+
+
+def format_time(value):
+    """Same layout as the other timestamps in the files table"""
+    return value.strftime(TIME_FORMAT) if value else None
+
+
+class JobBudget:
+    def __init__(self, deadline=None, max_concurrency=1, raise_concurrency=True):
+        """raise_concurrency=False leaves the fetcher count to someone else (see aimd);
+        rows are then only deferred if even max_concurrency fetchers couldn't finish them.
+        """
+        self.deadline = deadline
+        self.max_concurrency = max(1, max_concurrency)
+        self.raise_concurrency = raise_concurrency
+        self.eta = None
+
+    def check(self, pipeline, done):
+        """Re-plan after a row finishes. Returns the rows deferred by this call (usually none)
+
+        done is the number of rows finished so far; self.eta is updated as well.
+        """
+        if pipeline.row_latency is None:
+            return []
+        now = datetime.now()
+        seconds_per_row = pipeline.row_latency + pipeline.row_delay
+        in_flight = pipeline.in_flight()
+        queued = pipeline.remaining()
+
+        deferred = []
+        if self.deadline is not None:
+            time_left = max(0.0, (self.deadline - now).total_seconds() * SAFETY_MARGIN)
+            work = (queued + in_flight) * seconds_per_row
+
+            # Behind: add fetchers, as many as the remaining work needs
+            if (self.raise_concurrency and work > time_left * pipeline.concurrency
+                    and pipeline.concurrency < self.max_concurrency):
+                needed = math.ceil(work / time_left) if time_left else self.max_concurrency
+                concurrency = min(self.max_concurrency, max(needed, pipeline.concurrency + 1))
+                eta = self._eta(queued + in_flight, seconds_per_row, pipeline.concurrency, now)
+                pipeline.set_concurrency(concurrency, f"behind deadline (ETA {eta:%H:%M})")
+
+            # Can't make it even at full concurrency: keep only the rows that fit
+            elif work > time_left * self.max_concurrency and done >= MIN_SAMPLES:
+                fits = max(0, math.floor(time_left * self.max_concurrency / seconds_per_row) - in_flight)
+                if fits < queued:
+                    deferred = pipeline.defer(keep=fits)
+                    queued -= len(deferred)
+                    print(f"Deadline can't be met, deferring {len(deferred)} rows")
+
+        self.eta = self._eta(queued + in_flight, seconds_per_row, pipeline.concurrency, now)
+        return deferred
+
+    @staticmethod
+    def _eta(rows, seconds_per_row, concurrency, now):
+        return now + timedelta(seconds=rows * seconds_per_row / concurrency)
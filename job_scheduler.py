@@ -0,0 +1,149 @@
+"""
+Job Scheduler
+Admission control for scraping jobs: a global limit on running jobs and
+open browsers, a FIFO queue per user served round-robin, rejection of
+duplicate runs and cooperative cancellation.
+"""
+
+import os
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("SCRAPER_MAX_JOBS", "2"))
+MAX_BROWSERS = int(os.environ.get("SCRAPER_MAX_BROWSERS", str(MAX_CONCURRENT_JOBS)))
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been asked to stop"""
+
+
+class JobScheduler:
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS, max_browsers=MAX_BROWSERS):
+        """Create a scheduler; worker threads are started lazily on first submit"""
+        self.max_jobs = max_jobs
+        self.max_browsers = max_browsers
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._browser_slots = threading.BoundedSemaphore(max_browsers)
+        self._queues = OrderedDict()  # user -> deque of (job_id, func, args), in round-robin order
+        self._queued = {}  # job_id -> user
+        self._running = {}  # job_id -> cancel event
+        self._workers = []
+
+    def submit(self, job_id, func, *args, user="anonymous"):
+        """Queue a job. Returns False if the same job is already queued or running.
+
+        func is called as func(*args, cancel_event=event) on a worker thread.
+        """
+        with self._lock:
+            if job_id in self._queued or job_id in self._running:
+                return False
+            self._queues.setdefault(user, deque()).append((job_id, func, args))
+            self._queued[job_id] = user
+            self._ensure_workers()
+            self._work_available.notify()
+            return True
+
+    def cancel(self, job_id):
+        """Cancel a queued job or ask a running one to stop. Returns 'queued', 'running' or None"""
+        with self._lock:
+            user = self._queued.pop(job_id, None)
+            if user is not None:
+                queue = self._queues[user]
+                for entry in list(queue):
+                    if entry[0] == job_id:
+                        queue.remove(entry)
+                if not queue:
+                    del self._queues[user]
+                return "queued"
+            event = self._running.get(job_id)
+            if event is not None:
+                event.set()
+                return "running"
+        return None
+
+    def is_active(self, job_id):
+        """True if the job is queued or running"""
+        with self._lock:
+            return job_id in self._queued or job_id in self._running
+
+    def queue_position(self, job_id):
+        """1-based position the job would be started in, or None if not queued"""
+        with self._lock:
+            order = self._round_robin_order()
+        return order.index(job_id) + 1 if job_id in order else None
+
+    def snapshot(self):
+        """Current running and queued job ids"""
+        with self._lock:
+            return {
+                "running": list(self._running),
+                "queued": self._round_robin_order(),
+                "max_jobs": self.max_jobs,
+                "max_browsers": self.max_browsers,
+            }
+
+    @contextmanager
+    def browser_slot(self, cancel_event=None, give_up=None):
+        """Hold one of the global browser slots while a Chrome instance is open
+
+        The wait raises JobCancelled once cancel_event is set or give_up() returns True.
+        """
+        while not self._browser_slots.acquire(timeout=0.5):
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled()
+            if give_up is not None and give_up():
+                raise JobCancelled()
+        try:
+            yield
+        finally:
+            self._browser_slots.release()
+
+    def _round_robin_order(self):
+        """Order queued jobs would start in: one per user per round (lock held)"""
+        queues = [list(q) for q in self._queues.values()]
+        order = []
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            order.extend(q[depth][0] for q in queues if depth < len(q))
+            depth += 1
+        return order
+
+    def _ensure_workers(self):
+        """Start worker threads up to max_jobs (lock held)"""
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < self.max_jobs:
+            worker = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"scrape-job-{len(self._workers)}")
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self):
+        """Pop the head of the next user's queue and rotate that user to the back (lock held)"""
+        user, queue = next(iter(self._queues.items()))
+        job_id, func, args = queue.popleft()
+        del self._queues[user]
+        if queue:
+            self._queues[user] = queue
+        del self._queued[job_id]
+        return job_id, func, args
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                while not self._queues:
+                    self._work_available.wait()
+                job_id, func, args = self._next_job()
+                cancel_event = threading.Event()
+                self._running[job_id] = cancel_event
+            try:
+                func(*args, cancel_event=cancel_event)
+            except Exception as e:
+                print(f"Job {job_id} error: {e}")
+            finally:
+                with self._lock:
+                    self._running.pop(job_id, None)
+
+
+scheduler = JobScheduler()
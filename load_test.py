@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Load test for the web app
+Runs web_app.py in-process with AmazonScraper swapped for a fake with
+configurable latency, then has simulated users watch the dashboard,
+upload sheets, start jobs and download results at the same time.
+Reports latency percentiles, error rates and SQLite lock errors.
+
+    python3 load_test.py --users 20 --iterations 15 --report load_report.json
+
+Every user follows a sequence of actions drawn from a seeded RNG, so the
+same arguments replay the same traffic.
+"""
+
+import argparse
+import functools
+import io
+import json
+import math
+import os
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import openpyxl
+import requests
+import uvicorn
+
+import database
+from fake_amazon_server import FakeScraper
+
+# Mix of actions each simulated user picks from
+ACTION_WEIGHTS = {
+    "dashboard": 6,
+    "upload": 2,
+    "scrape": 2,
+    "download": 1,
+}
+
+
+class FakeAmazonScraper(FakeScraper):
+    """FakeScraper with a random page time and failure rate, so jobs take realistic time"""
+    latency = 0.5
+    jitter = 0.2
+    failure_rate = 0.0
+    rng = random.Random(0)
+    _rng_lock = threading.Lock()
+
+    def scrape_product(self, asin, expected_price, *args, **kwargs):
+        with self._rng_lock:
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            failed = self.rng.random() < self.failure_rate
+        time.sleep(delay)
+        if failed:
+            return None
+        return super().scrape_product(asin, expected_price, *args, **kwargs)
+
+
+class LockErrorCounter:
+    """Counts 'database is locked' errors raised from the database module"""
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        for name in dir(database):
+            func = getattr(database, name)
+            if callable(func) and getattr(func, '__module__', None) == database.__name__ and not name.startswith('_'):
+                setattr(database, name, self._wrap(func))
+
+    def _wrap(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if 'locked' in str(e):
+                    with self._lock:
+                        self.count += 1
+                raise
+        return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def make_workbook(rows, seed):
+    """Build an .xlsx in memory in the layout the scraper expects (same seed, same bytes)"""
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.cell(1, 2).value = "ASIN"
+    ws.cell(1, 3).value = "Price"
+    ws.cell(2, 2).value = "B07GFT91Z1"  # example row, skipped by the scraper
+    ws.cell(2, 3).value = 89.99
+    for row_num in range(3, rows + 3):
+        ws.cell(row_num, 2).value = "B0" + "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(8))
+        ws.cell(row_num, 3).value = round(rng.uniform(5, 200), 2)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = None
+        self.samples = defaultdict(list)  # action -> [latency]
+        self.errors = defaultdict(int)  # action -> count
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self.lock_errors = LockErrorCounter()
+
+    def start_server(self, workdir):
+        """Point the app at a scratch database and directories, patch in the fake scraper and serve it"""
+        database.DB_NAME = os.path.join(workdir, "load_test.db")
+        self.lock_errors.install()
+
+        import web_app
+        web_app.UPLOAD_DIR = os.path.join(workdir, "uploads")
+        web_app.RESULTS_DIR = os.path.join(workdir, "results")
+        os.makedirs(web_app.UPLOAD_DIR, exist_ok=True)
+        os.makedirs(web_app.RESULTS_DIR, exist_ok=True)
+        web_app.AmazonScraper = FakeAmazonScraper
+        database.init_db()
+
+        port = free_port()
+        self.base_url = f"http://127.0.0.1:{port}"
+        config = uvicorn.Config(web_app.app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        thread = threading.Thread(target=self.server.run, daemon=True)
+        thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def record(self, action, start, response=None, error=False):
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[action].append(elapsed)
+            if response is not None:
+                self.status_codes[action][response.status_code] += 1
+                if response.status_code >= 400:
+                    error = True
+            if error:
+                self.errors[action] += 1
+
+    def run_user(self, user_index):
+        rng = random.Random(self.args.seed * 1000 + user_index)
+        session = requests.Session()
+        actions = list(ACTION_WEIGHTS)
+        weights = [ACTION_WEIGHTS[a] for a in actions]
+        my_files = []
+
+        for iteration in range(self.args.iterations):
+            action = rng.choices(actions, weights)[0]
+            if action in ("scrape", "download") and not my_files:
+                action = "upload"
+
+            if action == "upload":
+                # Build the sheet before the clock starts
+                duplicate = rng.random() < self.args.duplicate_rate
+                seed = 0 if duplicate else self.args.seed * 100000 + user_index * 1000 + iteration
+                content = make_workbook(self.args.rows, seed)
+                filename = f"user{user_index}_{iteration}.xlsx"
+
+            start = time.perf_counter()
+            try:
+                if action == "dashboard":
+                    response = session.get(f"{self.base_url}/", timeout=60)
+                elif action == "upload":
+                    response = session.post(f"{self.base_url}/upload", timeout=60, allow_redirects=False,
+                                            files={"file": (filename, content)})
+                elif action == "scrape":
+                    file_id = rng.choice(my_files)
+                    response = session.post(f"{self.base_url}/scrape/{file_id}", timeout=60, allow_redirects=False)
+                else:
+                    file_id = rng.choice(my_files)
+                    response = session.get(f"{self.base_url}/download/{file_id}", timeout=60, allow_redirects=False)
+                self.record(action, start, response)
+            except requests.RequestException:
+                self.record(action, start, error=True)
+                response = None
+
+            if action == "upload" and response is not None:
+                file_id = self.uploaded_file_id(response, filename)
+                if file_id:
+                    my_files.append(file_id)
+
+            time.sleep(rng.uniform(0, self.args.think_time))
+
+    def uploaded_file_id(self, response, filename):
+        """Find the id of the file an upload created (or the duplicate it was matched to)"""
+        location = response.headers.get("location", "")
+        if "duplicate=" in location:
+            return int(location.split("duplicate=")[1].split("&")[0])
+        for f in database.get_all_files():
+            if f['original_filename'] == filename:
+                return f['id']
+        return None
+
+    def wait_for_jobs(self, timeout):
+        """Let queued and running jobs finish so their DB writes are part of the measurement"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not any(f['status'] in ("Queued", "Running") for f in database.get_all_files()):
+                return True
+            time.sleep(0.5)
+        return False
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            self.start_server(workdir)
+            started = time.perf_counter()
+            users = [threading.Thread(target=self.run_user, args=(i,)) for i in range(self.args.users)]
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            traffic_seconds = time.perf_counter() - started
+            drained = self.wait_for_jobs(self.args.drain_timeout)
+            files = database.get_all_files()
+            self.server.should_exit = True
+            return self.report(traffic_seconds, drained, files)
+
+    def report(self, traffic_seconds, drained, files):
+        endpoints = {}
+        for action, latencies in sorted(self.samples.items()):
+            endpoints[action] = {
+                "requests": len(latencies),
+                "errors": self.errors[action],
+                "error_rate": round(self.errors[action] / len(latencies), 4),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p90_ms": round(percentile(latencies, 90) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "max_ms": round(max(latencies) * 1000, 1),
+                "status_codes": dict(self.status_codes[action]),
+            }
+        statuses = defaultdict(int)
+        for f in files:
+            statuses[f['status']] += 1
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "report"},
+            "duration_seconds": round(traffic_seconds, 2),
+            "requests_per_second": round(sum(len(v) for v in self.samples.values()) / traffic_seconds, 2),
+            "sqlite_lock_errors": self.lock_errors.count,
+            "jobs_drained": drained,
+            "job_statuses": dict(statuses),
+            "endpoints": endpoints,
+        }
+
+
+def print_report(report):
+    print(f"\n{'='*78}")
+    print(f"Load test: {report['config']['users']} users x {report['config']['iterations']} actions "
+          f"in {report['duration_seconds']}s ({report['requests_per_second']} req/s)")
+    print(f"{'='*78}")
+    print(f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, stats in report['endpoints'].items():
+        print(f"{action:<12}{stats['requests']:>10}{stats['errors']:>8}{stats['p50_ms']:>10}"
+              f"{stats['p90_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print(f"{'-'*78}")
+    print(f"SQLite lock errors: {report['sqlite_lock_errors']}")
+    print(f"Job statuses: {report['job_statuses']} (all finished: {report['jobs_drained']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test for web_app.py with a fake scraper")
+    parser.add_argument("--users", type=int, default=20, help="Simulated concurrent users")
+    parser.add_argument("--iterations", type=int, default=15, help="Actions per user")
+    parser.add_argument("--rows", type=int, default=10, help="ASIN rows per uploaded sheet")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake seconds per product page")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- seconds added to each page")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of fake pages that fail")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="Share of uploads that repeat an earlier sheet")
+    parser.add_argument("--think-time", type=float, default=0.2, help="Max seconds a user pauses between actions")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="Seconds to wait for jobs to finish")
+    parser.add_argument("--seed", type=int, default=1, help="RNG seed; same seed, same traffic")
+    parser.add_argument("--report", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    FakeAmazonScraper.latency = args.latency
+    FakeAmazonScraper.jitter = args.jitter
+    FakeAmazonScraper.failure_rate = args.failure_rate
+    FakeAmazonScraper.rng = random.Random(args.seed)
+
+    report = LoadTest(args).run()
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report saved to: {args.report}")
@@ -0,0 +1,299 @@
+"""
+Product page HTML helpers
+Pure-Python readers for data Amazon embeds in the raw page source. These
+work on the HTML string alone, so one page_source fetch replaces many
+WebDriver round trips.
+"""
+
+import html
+import re
+
+# 'colorImages': { 'initial': [ {...}, {...} ] } inside the ImageBlockATF script
+COLOR_IMAGES_RE = re.compile(r'''["']colorImages["']\s*:\s*\{\s*["']initial["']\s*:\s*\[''')
+VIDEOS_RE = re.compile(r'''["']videos["']\s*:\s*\[''')
+SCRIPT_RE = re.compile(r'<script\b[^>]*>(.*?)</script>', re.S | re.I)
+FEATURE_BULLETS_RE = re.compile(r'''<div[^>]*\bid=["']feature-bullets["'][^>]*>(.*?)</ul>''', re.S | re.I)
+LIST_ITEM_RE = re.compile(r'<li\b[^>]*>(.*?)</li>', re.S | re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _array_end(source, start):
+    """Index just past the bracket matching source[start] ('[' or '{'), or -1 if unbalanced"""
+    depth = 0
+    quote = None
+    i = start
+    while i < len(source):
+        ch = source[i]
+        if quote:
+            if ch == '\\':
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '[{':
+            depth += 1
+        elif ch in ']}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return -1
+
+
+def count_array_items(source, open_bracket):
+    """Count the top-level objects in the JSON/JS array starting at source[open_bracket]"""
+    end = _array_end(source, open_bracket)
+    if end == -1:
+        return None
+    count = 0
+    depth = 0
+    quote = None
+    i = open_bracket + 1
+    while i < end - 1:
+        ch = source[i]
+        if quote:
+            if ch == '\\':
+                i += 2
+                continue
+            if ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '[{':
+            if depth == 0 and ch == '{':
+                count += 1
+            depth += 1
+        elif ch in ']}':
+            depth -= 1
+        i += 1
+    return count
+
+
+def _image_block_script(source):
+    """The script that carries the image gallery data, or None"""
+    for match in SCRIPT_RE.finditer(source):
+        if COLOR_IMAGES_RE.search(match.group(1)):
+            return match.group(1)
+    return None
+
+
+def count_embedded_images(source):
+    """Number of gallery images in the embedded data (hidden "+N" images included), or None"""
+    script = _image_block_script(source)
+    if script is None:
+        return None
+    match = COLOR_IMAGES_RE.search(script)
+    return count_array_items(script, match.end() - 1)
+
+
+def count_embedded_videos(source):
+    """Number of product videos in the gallery data, or None if the page has no gallery data.
+
+    Only the gallery script is searched, so customer review videos are not counted.
+    """
+    script = _image_block_script(source)
+    if script is None:
+        return None
+    match = VIDEOS_RE.search(script)
+    if match is None:
+        return 0
+    return count_array_items(script, match.end() - 1)
+
+
+def count_bullets(source):
+    """Number of non-empty "About this item" bullets, or None if the section is missing"""
+    match = FEATURE_BULLETS_RE.search(source)
+    if match is None:
+        return None
+    items = LIST_ITEM_RE.findall(match.group(1))
+    return sum(1 for item in items if TAG_RE.sub('', item).strip())
+
+
+# --- Whole-page parsing, used by the process-pool parser stage ---
+
+MERCHANT_INFO_RE = re.compile(r'''<div[^>]*\bid=["']merchant-info["'][^>]*>(.*?)</div>''', re.S | re.I)
+SELLER_PROFILE_RE = re.compile(r'''\bid=["']sellerProfileTriggerId["'][^>]*>(.*?)</a>''', re.S | re.I)
+LINK_TEXT_RE = re.compile(r'<a\b[^>]*>(.*?)</a>', re.S | re.I)
+ADD_TO_CART_RE = re.compile(r'''\bid=["']add-to-cart-button["']''', re.I)
+OFFSCREEN_PRICE_RE = re.compile(
+    r'''<span[^>]*class=["'][^"']*\ba-price\b[^"']*["'][^>]*>\s*<span[^>]*class=["'][^"']*\ba-offscreen\b[^"']*["'][^>]*>([^<]+)<''',
+    re.S | re.I)
+PRICE_WHOLE_RE = re.compile(r'''class=["']a-price-whole["'][^>]*>([^<]*)''', re.I)
+PRICE_FRACTION_RE = re.compile(r'''class=["']a-price-fraction["'][^>]*>([^<]*)''', re.I)
+PRICE_BLOCK_RE = re.compile(r'''\bid=["']priceblock_(?:ourprice|dealprice)["'][^>]*>([^<]*)''', re.I)
+NUMBER_RE = re.compile(r'[\d,]+\.?\d*')
+RANK_BLOCK_END_RE = re.compile(r'</tr>|</ul>', re.I)
+RANK_RE = re.compile(r'#([\d,]+)\s+in\s+([^\(\n]+)')
+RATING_PATTERNS = [
+    re.compile(r'''data-hook=["']rating-out-of-text["'][^>]*>([^<]*)''', re.I),
+    re.compile(r'''data-hook=["']average-star-rating["'].*?<span[^>]*class=["']a-icon-alt["'][^>]*>([^<]*)''', re.S | re.I),
+    re.compile(r'''\bid=["']acrPopover["'][^>]*title=["']([^"']*)''', re.I),
+]
+ALT_IMAGES_RE = re.compile(r'''\bid=["']altImages["'][^>]*>(.*?)</ul>''', re.S | re.I)
+IMAGE_THUMB_RE = re.compile(r'''<li[^>]*class=["'][^"']*\bimageThumbnail\b''', re.I)
+VIDEO_THUMB_RE = re.compile(r'''<li[^>]*class=["'][^"']*\bvideoThumbnail\b|data-csa-c-type=["']video["']''', re.I)
+OVERLAY_RE = re.compile(r'<span[^>]*>\s*\+?(\d+)\+?\s*</span>')
+PINNED_OFFER_RE = re.compile(r'''\bid=["']aod-(?:pinned-)?offer["'][^>]*>(.*)''', re.S | re.I)
+SOLD_BY_RE = re.compile(r'''\bid=["']aod-offer-soldBy["'].*?a-col-right[^>]*>(.*?)</div>''', re.S | re.I)
+BLOCK_TAG_RE = re.compile(r'<br\s*/?>|</?(?:li|ul|div|tr|p)\b[^>]*>', re.I)
+
+
+def html_to_text(fragment):
+    """Rough equivalent of WebElement.text: block tags become newlines, other tags vanish"""
+    text = BLOCK_TAG_RE.sub('\n', fragment)
+    text = TAG_RE.sub('', text)
+    text = html.unescape(text)
+    return re.sub(r'[ \t\r\f\v]+', ' ', text)
+
+
+def _parse_number(text):
+    match = NUMBER_RE.search(text or '')
+    if not match:
+        return None
+    try:
+        return float(match.group().replace(',', ''))
+    except ValueError:
+        return None
+
+
+def parse_buybox_seller(source):
+    """Same methods as AmazonScraper._get_buybox_seller, on raw HTML"""
+    match = MERCHANT_INFO_RE.search(source)
+    if match:
+        if 'amazon' in html_to_text(match.group(1)).lower():
+            return "Amazon.com"
+        link = LINK_TEXT_RE.search(match.group(1))
+        if link and html_to_text(link.group(1)).strip():
+            return html_to_text(link.group(1)).strip()
+
+    match = SELLER_PROFILE_RE.search(source)
+    if match and html_to_text(match.group(1)).strip():
+        return html_to_text(match.group(1)).strip()
+
+    position = source.find('Sold by')
+    if position != -1:
+        window = source[position:position + 1000]
+        if 'amazon' in html_to_text(window[:300]).lower():
+            return "Amazon.com"
+        link = LINK_TEXT_RE.search(window)
+        if link and html_to_text(link.group(1)).strip():
+            return html_to_text(link.group(1)).strip()
+
+    if ADD_TO_CART_RE.search(source):
+        return "Amazon.com"
+    return "Unknown"
+
+
+def parse_price(source):
+    """Same methods as AmazonScraper._get_price, on raw HTML"""
+    match = OFFSCREEN_PRICE_RE.search(source)
+    if match:
+        price = _parse_number(html.unescape(match.group(1)))
+        if price is not None:
+            return price
+
+    whole = PRICE_WHOLE_RE.search(source)
+    if whole:
+        whole_text = whole.group(1).strip().replace(',', '').replace('.', '')
+        fraction = PRICE_FRACTION_RE.search(source)
+        fraction_text = fraction.group(1).strip() if fraction else "00"
+        try:
+            return float(f"{whole_text}.{fraction_text or '00'}")
+        except ValueError:
+            pass
+
+    match = PRICE_BLOCK_RE.search(source)
+    if match:
+        return _parse_number(match.group(1))
+    return None
+
+
+def parse_ranking(source):
+    """Best (lowest) Best Sellers Rank, formatted like AmazonScraper._get_ranking"""
+    rankings = []
+    for match in re.finditer('Best Sellers Rank', source):
+        end = RANK_BLOCK_END_RE.search(source, match.end())
+        block = source[match.end():end.end() if end else match.end() + 1500]
+        for rank in RANK_RE.finditer(html_to_text(block)):
+            rankings.append((int(rank.group(1).replace(',', '')),
+                             f"#{rank.group(1)} in {rank.group(2).strip()}"))
+    if not rankings:
+        return None
+    rankings.sort(key=lambda x: x[0])
+    return rankings[0][1]
+
+
+def parse_review_rating(source):
+    for pattern in RATING_PATTERNS:
+        match = pattern.search(source)
+        if match:
+            rating = re.search(r'([\d.]+)\s*out of', match.group(1))
+            if rating:
+                return float(rating.group(1))
+    return None
+
+
+def parse_photo_count(source):
+    """Embedded gallery count, falling back to thumbnails plus the "+N" overlay"""
+    count = count_embedded_images(source)
+    if count:
+        return count
+    match = ALT_IMAGES_RE.search(source)
+    if not match:
+        return 0
+    count = len(IMAGE_THUMB_RE.findall(match.group(1)))
+    overlay = OVERLAY_RE.search(match.group(1))
+    if count and overlay:
+        count += int(overlay.group(1))
+    return count
+
+
+def parse_videos(source):
+    if count_embedded_videos(source):
+        return "YES"
+    match = ALT_IMAGES_RE.search(source)
+    if match and VIDEO_THUMB_RE.search(match.group(1)):
+        return "YES"
+    return "YES" if VIDEO_THUMB_RE.search(source) else "NO"
+
+
+def parse_bullet_points(source):
+    count = count_bullets(source)
+    return "YES" if count and count >= 5 else "NO"
+
+
+PARSERS = {
+    'buybox_seller': parse_buybox_seller,
+    'buybox_price': parse_price,
+    'ranking': parse_ranking,
+    'review': parse_review_rating,
+    'photos': parse_photo_count,
+    'videos': parse_videos,
+    'bullet_points': parse_bullet_points,
+}
+
+
+def parse_product(source, fields=None):
+    """Extract the requested fields (all by default) from a product detail page"""
+    return {field: parser(source) for field, parser in PARSERS.items() if fields is None or field in fields}
+
+
+def parse_offer(source):
+    """Extract (seller, price) of the featured offer from an offer listing fragment"""
+    match = PINNED_OFFER_RE.search(source)
+    if not match:
+        return None, None
+    offer = match.group(1)
+    price_match = re.search(r'''class=["']a-offscreen["'][^>]*>([^<]+)<''', offer)
+    price = _parse_number(html.unescape(price_match.group(1))) if price_match else None
+    seller = "Unknown"
+    sold_by = SOLD_BY_RE.search(offer)
+    if sold_by:
+        seller_text = html_to_text(sold_by.group(1)).strip()
+        if 'amazon' in seller_text.lower():
+            seller = "Amazon.com"
+        elif seller_text:
+            seller = seller_text
+    return seller, price
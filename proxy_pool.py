@@ -0,0 +1,264 @@
+"""
+Proxy Pool
+A pool of HTTP proxies / egress endpoints with a rate limit per exit,
+health scoring on recent success, latency and block rate, and automatic
+quarantine of exits that go bad.
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+# Defaults, overridable through the environment (see ProxyPool.from_env)
+DEFAULT_RATE_PER_MINUTE = 20
+DEFAULT_QUARANTINE_SECONDS = 120
+MAX_QUARANTINE_SECONDS = 3600
+
+# Exponential moving average weight given to the newest observation
+EWMA_ALPHA = 0.2
+
+# An exit whose score drops below this, or that is blocked this many
+# times in a row, is quarantined
+MIN_HEALTH_SCORE = 0.35
+MAX_CONSECUTIVE_BLOCKS = 3
+
+# "direct" in the proxy list means the machine's own address
+DIRECT = "direct"
+
+ROBOT_CHECK_MARKERS = (
+    "robot check",
+    "/errors/validatecaptcha",
+    "enter the characters you see below",
+    "to discuss automated access to amazon data",
+)
+
+
+def looks_blocked(html, status_code=200):
+    """True if a response is a throttle or robot-check page rather than content"""
+    if status_code in (429, 503):
+        return True
+    text = (html or "")[:20000].lower()
+    return any(marker in text for marker in ROBOT_CHECK_MARKERS)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, burst=1):
+        """Allow rate_per_second requests on average, with bursts up to `burst`"""
+        self.rate = rate_per_second
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        """Take a token if one is available right now (a rate of 0 means unlimited)"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self, cancel_event=None):
+        """Block until a token is available"""
+        while not self.try_acquire():
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            time.sleep(min(self.wait_time(), 1.0) or 0.01)
+        return True
+
+
+class ProxyExit:
+    def __init__(self, url, rate_per_minute=DEFAULT_RATE_PER_MINUTE):
+        """One egress endpoint; url is an http(s)/socks proxy URL or 'direct'"""
+        self.url = url
+        self.limiter = TokenBucket(rate_per_minute / 60.0)
+        self.success_rate = 1.0
+        self.block_rate = 0.0
+        self.latency = None
+        self.requests = 0
+        self.consecutive_blocks = 0
+        self.quarantined_until = 0.0
+        self.quarantine_count = 0
+        self.assigned = 0  # browsers currently pinned to this exit
+
+    @property
+    def is_direct(self):
+        return self.url == DIRECT
+
+    def is_quarantined(self, now=None):
+        return (now or time.monotonic()) < self.quarantined_until
+
+    def score(self):
+        """Health between 0 and 1: recent success, penalised for blocks and slowness"""
+        latency_factor = 1.0
+        if self.latency is not None:
+            # 5s pages score 0.5, 15s pages 0.25
+            latency_factor = 1.0 / (1.0 + self.latency / 5.0)
+        return self.success_rate * (1.0 - self.block_rate) * (0.5 + 0.5 * latency_factor)
+
+    def chrome_argument(self):
+        """Chrome flag routing a browser through this exit, or None for direct"""
+        if self.is_direct:
+            return None
+        return f"--proxy-server={self.url}"
+
+    def requests_proxies(self):
+        """Proxy mapping for the requests library"""
+        if self.is_direct:
+            return None
+        return {"http": self.url, "https": self.url}
+
+    def status(self):
+        return {
+            "url": self.url,
+            "score": round(self.score(), 3),
+            "success_rate": round(self.success_rate, 3),
+            "block_rate": round(self.block_rate, 3),
+            "latency": round(self.latency, 2) if self.latency is not None else None,
+            "requests": self.requests,
+            "quarantined_for": max(0, round(self.quarantined_until - time.monotonic())),
+            "assigned": self.assigned,
+        }
+
+
+class ProxyPool:
+    def __init__(self, urls, rate_per_minute=DEFAULT_RATE_PER_MINUTE,
+                 quarantine_seconds=DEFAULT_QUARANTINE_SECONDS):
+        """Create a pool from a list of proxy URLs ('direct' for no proxy)"""
+        if not urls:
+            raise ValueError("ProxyPool needs at least one exit")
+        self.exits = [ProxyExit(url, rate_per_minute) for url in urls]
+        self.quarantine_seconds = quarantine_seconds
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a pool from SCRAPER_PROXIES / SCRAPER_PROXY_FILE, or None if neither is set"""
+        urls = [u.strip() for u in os.environ.get("SCRAPER_PROXIES", "").split(",") if u.strip()]
+        proxy_file = os.environ.get("SCRAPER_PROXY_FILE")
+        if proxy_file:
+            with open(proxy_file) as f:
+                urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        if not urls:
+            return None
+        return cls(
+            urls,
+            rate_per_minute=float(os.environ.get("SCRAPER_PROXY_RATE", DEFAULT_RATE_PER_MINUTE)),
+            quarantine_seconds=float(os.environ.get("SCRAPER_PROXY_QUARANTINE", DEFAULT_QUARANTINE_SECONDS)),
+        )
+
+    def healthy_exits(self):
+        now = time.monotonic()
+        return [e for e in self.exits if not e.is_quarantined(now)]
+
+    def wait_for_healthy(self, cancel_event=None):
+        """Block until at least one exit is out of quarantine. False if cancelled first"""
+        while not self.healthy_exits():
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            soonest = min(e.quarantined_until for e in self.exits)
+            time.sleep(min(max(soonest - time.monotonic(), 0.01), 1.0))
+        return True
+
+    def assign(self):
+        """Pick an exit to pin a browser to: healthy, least shared, best scored"""
+        with self._lock:
+            candidates = self.healthy_exits() or [min(self.exits, key=lambda e: e.quarantined_until)]
+            chosen = min(candidates, key=lambda e: (e.assigned, -e.score()))
+            chosen.assigned += 1
+            return chosen
+
+    def release(self, proxy_exit):
+        """Unpin a browser from an exit"""
+        with self._lock:
+            proxy_exit.assigned = max(0, proxy_exit.assigned - 1)
+
+    def acquire(self, cancel_event=None):
+        """Block until some healthy exit has rate budget, take a token from it and return it"""
+        while True:
+            candidates = self.healthy_exits()
+            if not candidates:
+                # Everything is quarantined: wait for the first exit to come back
+                soonest = min(self.exits, key=lambda e: e.quarantined_until)
+                delay = soonest.quarantined_until - time.monotonic()
+            else:
+                for proxy_exit in sorted(candidates, key=lambda e: -e.score()):
+                    if proxy_exit.limiter.try_acquire():
+                        return proxy_exit
+                delay = min(e.limiter.wait_time() for e in candidates)
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            time.sleep(min(max(delay, 0.01), 1.0))
+
+    def report(self, proxy_exit, success, latency=None, blocked=False):
+        """Record the outcome of one request through an exit and quarantine it if unhealthy"""
+        with self._lock:
+            proxy_exit.requests += 1
+            proxy_exit.success_rate += EWMA_ALPHA * ((1.0 if success else 0.0) - proxy_exit.success_rate)
+            proxy_exit.block_rate += EWMA_ALPHA * ((1.0 if blocked else 0.0) - proxy_exit.block_rate)
+            if latency is not None:
+                if proxy_exit.latency is None:
+                    proxy_exit.latency = latency
+                else:
+                    proxy_exit.latency += EWMA_ALPHA * (latency - proxy_exit.latency)
+            proxy_exit.consecutive_blocks = proxy_exit.consecutive_blocks + 1 if blocked else 0
+
+            if proxy_exit.consecutive_blocks >= MAX_CONSECUTIVE_BLOCKS or proxy_exit.score() < MIN_HEALTH_SCORE:
+                self._quarantine(proxy_exit)
+            elif success and proxy_exit.quarantine_count:
+                # A good result after coming back from quarantine resets the backoff
+                proxy_exit.quarantine_count = 0
+
+    def _quarantine(self, proxy_exit):
+        """Take an exit out of rotation, backing off exponentially on repeat offences (lock held)"""
+        duration = min(self.quarantine_seconds * (2 ** proxy_exit.quarantine_count), MAX_QUARANTINE_SECONDS)
+        proxy_exit.quarantined_until = time.monotonic() + duration
+        proxy_exit.quarantine_count += 1
+        # Give it a neutral record when it comes back so it is retried on probation
+        proxy_exit.success_rate = 0.6
+        proxy_exit.block_rate = 0.2
+        proxy_exit.consecutive_blocks = 0
+        print(f"Quarantining exit {proxy_exit.url} for {duration:.0f}s")
+
+    def fetch(self, url, timeout=30, headers=None, cancel_event=None):
+        """GET a URL through the best available exit. Returns (response or None, exit)"""
+        proxy_exit = self.acquire(cancel_event)
+        if proxy_exit is None:
+            return None, None
+        start = time.monotonic()
+        try:
+            response = requests.get(url, timeout=timeout, headers=headers,
+                                    proxies=proxy_exit.requests_proxies())
+        except requests.RequestException as e:
+            print(f"Request via {proxy_exit.url} failed: {e}")
+            self.report(proxy_exit, success=False, latency=time.monotonic() - start)
+            return None, proxy_exit
+        blocked = looks_blocked(response.text, response.status_code)
+        self.report(proxy_exit, success=response.ok and not blocked,
+                    latency=time.monotonic() - start, blocked=blocked)
+        return response, proxy_exit
+
+    def status(self):
+        """Per-exit health, for the dashboard or logs"""
+        with self._lock:
+            return [e.status() for e in self.exits]
@@ -0,0 +1,412 @@
+"""
+Scrape pipeline
+Splits scraping into an I/O stage and a CPU stage. Fetcher threads each
+drive their own browser and only load pages; the raw HTML is spooled to a
+file (in /dev/shm when available, so it stays in memory) and parsed by a
+process pool with product_html. Only the file path crosses the process
+boundary, and at most max_pending pages wait between the stages, so fast
+fetchers cannot run ahead of the parsers.
+
+With parse_workers=0 the fetchers call scrape_product themselves, which is
+how the scraper has always worked.
+
+With a single-flight registry, an ASIN already being fetched by another
+pipeline (another job) is waited for and shared rather than loaded again.
+
+The number of fetchers can be changed while the pipeline runs
+(set_concurrency), and rows not yet started can be pulled back out (defer).
+
+With prefetch=N, each fetcher claims the next N rows ahead of time and
+queues them on its scraper (AmazonScraper.prefetch), so their pages load in
+background tabs while the current one is read.
+
+With a tracing.Tracer, each row is recorded as a span tagged with its ASIN
+and sheet row, along with the waits around it and the parse in its worker.
+"""
+
+import os
+import queue
+from collections import deque
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+from job_scheduler import JobCancelled
+from product_html import parse_offer, parse_product
+
+# Fetched pages are handed to the parsers through files here
+SPOOL_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Weight of the newest row in the row_latency average
+LATENCY_ALPHA = 0.3
+
+# Concurrency changes remembered in concurrency_log
+CONCURRENCY_LOG_SIZE = 10
+
+
+def parse_spooled_page(path, kind, fields):
+    """Parse a spooled page in a worker process and delete it
+
+    Returns (parsed fields, seconds, perf_counter at the start, worker pid).
+    """
+    started = time.perf_counter()
+    try:
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+    finally:
+        os.remove(path)
+    if kind == "offer":
+        seller, price = parse_offer(source)
+        parsed = {'buybox_seller': seller, 'buybox_price': price}
+    else:
+        parsed = parse_product(source, fields)
+    return parsed, time.perf_counter() - started, started, os.getpid()
+
+
+def spool_page(source):
+    """Write page HTML to a spool file and return its path"""
+    fd, path = tempfile.mkstemp(prefix="page_", suffix=".html", dir=SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(source)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+class ScrapePipeline:
+    def __init__(self, scraper_factory, fields=None, fetchers=1, parse_workers=0, max_pending=None,
+                 row_delay=0, cancel_event=None, browser_slot=None, flights=None, rate_limiter=None,
+                 tracer=None, prefetch=0):
+        """
+        scraper_factory() builds one AmazonScraper per fetcher thread.
+        browser_slot(give_up), if given, is a context manager held for each browser's
+        lifetime. Its wait should end with job_scheduler.JobCancelled once give_up()
+        returns True (see JobScheduler.browser_slot).
+        flights, if given, is a single_flight.SingleFlight shared with other pipelines.
+        rate_limiter, if given, is a proxy_pool.TokenBucket shared by all fetchers.
+        tracer, if given, is a tracing.Tracer (pass the same one to the scrapers).
+        prefetch is how many rows each fetcher queues on its scraper ahead of the
+        one it is scraping (match the scrapers' prefetch_pages).
+        """
+        self.scraper_factory = scraper_factory
+        self.fields = fields
+        self.fetchers = max(1, fetchers)
+        self.parse_workers = max(0, parse_workers)
+        self.max_pending = max_pending or max(2, self.parse_workers * 2)
+        self.row_delay = row_delay
+        self.cancel_event = cancel_event
+        self.browser_slot = browser_slot or (lambda give_up=None: nullcontext())
+        self.flights = flights
+        self.rate_limiter = rate_limiter
+        self.tracer = tracer
+        self.prefetch = max(0, prefetch)
+        self.parse_seconds = 0.0
+        self.row_latency = None  # EWMA of seconds from fetch start to parsed result
+        self.deferred = 0
+        self.concurrency_log = deque(maxlen=CONCURRENCY_LOG_SIZE)  # "HH:MM:SS 2 -> 3: reason"
+        self.concurrency_changes = 0
+
+        self._rows = deque()
+        self._results = queue.Queue()
+        self._stop = threading.Event()
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._claimed = 0  # rows taken by fetchers for prefetching, not started yet
+        self._errors = []
+        self._threads = []
+        self._active = 0
+        self._executor = None
+
+    def _stopping(self):
+        return self._stop.is_set() or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def _out_of_work(self):
+        """Nothing left for a fetcher that hasn't started its browser yet"""
+        with self._lock:
+            return self._stopping() or not self._rows
+
+    def _span(self, name):
+        return self.tracer.span(name) if self.tracer is not None else nullcontext()
+
+    @contextmanager
+    def _traced(self, row):
+        """Tag everything traced on this thread with the row, inside a 'row' span"""
+        if self.tracer is None:
+            yield
+            return
+        with self.tracer.tags(asin=row['asin'], row=row['row_num']), self.tracer.span('row'):
+            yield
+
+    def run(self, rows, on_result):
+        """Scrape rows, calling on_result(row, data) on this thread as each one finishes.
+
+        Rows may finish out of order when there is more than one fetcher. Returns
+        True when every row was scraped, False if the cancel event stopped the run.
+        Rows taken back with defer() are not scraped and do not count against that.
+        """
+        self._rows.extend(rows)
+        self._executor = ProcessPoolExecutor(self.parse_workers) if self.parse_workers else None
+        self.set_concurrency(self.fetchers)
+
+        delivered = 0
+        try:
+            while delivered + self.deferred < len(rows):
+                try:
+                    row, data = self._results.get(timeout=0.5)
+                except queue.Empty:
+                    with self._lock:
+                        idle = self._in_flight == 0
+                        threads = list(self._threads)
+                    if idle and self._results.empty() and not any(t.is_alive() for t in threads):
+                        break
+                    continue
+                on_result(row, data)
+                delivered += 1
+        finally:
+            self._stop.set()
+            with self._lock:
+                threads = list(self._threads)
+            for thread in threads:
+                thread.join()
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+
+        if self._errors:
+            raise self._errors[0]
+        return delivered + self.deferred == len(rows)
+
+    @property
+    def concurrency(self):
+        """Fetchers currently allowed to load pages"""
+        return self.fetchers
+
+    def set_concurrency(self, fetchers, reason=None):
+        """Change the number of fetchers. New ones start right away; extra ones stop after their current row"""
+        fetchers = max(1, fetchers)
+        with self._lock:
+            if reason and fetchers != self.fetchers:
+                entry = f"{time.strftime('%H:%M:%S')} {self.fetchers} -> {fetchers}: {reason}"
+                self.concurrency_log.append(entry)
+                self.concurrency_changes += 1
+                print(f"Concurrency {entry}")
+            self.fetchers = fetchers
+            while self._active < self.fetchers and self._rows and not self._stop.is_set():
+                thread = threading.Thread(target=self._fetch_loop, name=f"fetcher-{len(self._threads) + 1}",
+                                          daemon=True)
+                self._threads.append(thread)
+                self._active += 1
+                thread.start()
+
+    def in_flight(self):
+        """Rows being fetched or parsed right now"""
+        with self._lock:
+            return self._in_flight
+
+    def remaining(self):
+        """Rows not yet started (including those claimed for prefetching)"""
+        with self._lock:
+            return len(self._rows) + self._claimed
+
+    def defer(self, keep=0):
+        """Take back every row not yet started except the first `keep`, and return them
+
+        Rows already claimed for prefetching count towards `keep` and are never deferred.
+        """
+        deferred = []
+        with self._lock:
+            while len(self._rows) > max(0, keep - self._claimed):
+                deferred.append(self._rows.pop())
+            self.deferred += len(deferred)
+        deferred.reverse()
+        return deferred
+
+    def _fetch_loop(self):
+        counted = True
+        ahead = deque()  # rows this fetcher claimed and queued on its scraper
+        try:
+            # Fetchers added late may wait a long time for a slot; don't open a browser for no rows
+            if self._out_of_work():
+                return
+            requested = time.perf_counter()
+            with self.browser_slot(self._out_of_work):
+                if self.tracer is not None:
+                    self.tracer.add('browser_slot', requested, time.perf_counter() - requested)
+                if self._out_of_work():
+                    return
+                with self._span('browser_start'):
+                    scraper = self.scraper_factory()
+                try:
+                    while not self._stopping():
+                        with self._lock:
+                            if self._active > self.fetchers:
+                                # Concurrency was lowered
+                                self._active -= 1
+                                counted = False
+                                return
+                            if ahead:
+                                row = ahead.popleft()
+                                self._claimed -= 1
+                            elif self._rows:
+                                row = self._rows.popleft()
+                            else:
+                                return
+                            claimed = []
+                            while len(ahead) + len(claimed) < self.prefetch and self._rows:
+                                claimed.append(self._rows.popleft())
+                            ahead.extend(claimed)
+                            self._claimed += len(claimed)
+                        for next_row in claimed:
+                            scraper.prefetch(next_row['asin'], self.fields)
+                        with self._traced(row):
+                            if self.rate_limiter is not None:
+                                with self._span('job_rate_limit'):
+                                    acquired = self.rate_limiter.acquire(self.cancel_event)
+                                if not acquired:
+                                    with self._lock:
+                                        self._rows.appendleft(row)  # Cancelled while waiting
+                                    return
+                            if self._executor is None:
+                                self._scrape_inline(scraper, row)
+                            else:
+                                self._fetch_and_submit(scraper, row)
+                        if self.row_delay:
+                            with self._span('row_delay'):
+                                self._stop.wait(self.row_delay)
+                finally:
+                    # Rows claimed but never started go back to the front for the other fetchers
+                    with self._lock:
+                        self._rows.extendleft(reversed(ahead))
+                        self._claimed -= len(ahead)
+                    scraper.close()
+        except JobCancelled:
+            pass  # Gave up waiting for a browser slot; run() reports a cancel by returning False
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            if counted:
+                with self._lock:
+                    self._active -= 1
+
+    def _join_flight(self, row):
+        """Share another fetch of the same ASIN if there is one. Returns (flight, shared)
+
+        flight is what this fetch must resolve (None without a registry); shared is
+        True when the row was already answered from someone else's fetch.
+        """
+        if self.flights is None:
+            return None, False
+        flight, leader = self.flights.join(row['asin'], self.fields)
+        if leader:
+            return flight, False
+        with self._span('shared_wait'):
+            data = flight.wait(self._stopping)
+        self._finish(row, data, None)
+        return None, True
+
+    def _scrape_inline(self, scraper, row):
+        with self._lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        flight, shared = self._join_flight(row)
+        if shared:
+            if self.prefetch:
+                scraper.discard_prefetch(row['asin'])
+            return
+        data = None
+        try:
+            data = scraper.scrape_product(row['asin'], row['expected_price'], self.fields)
+        finally:
+            self._complete(row, data, started, flight)
+
+    def _fetch_and_submit(self, scraper, row):
+        # Wait for room between the stages before loading another page
+        with self._span('parse_backpressure'):
+            while not self._pending.acquire(timeout=0.5):
+                if self._stopping():
+                    return
+        with self._lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        flight, shared = self._join_flight(row)
+        if shared:
+            if self.prefetch:
+                scraper.discard_prefetch(row['asin'])
+            self._pending.release()
+            return
+
+        try:
+            page = scraper.fetch_page(row['asin'], self.fields)
+        except Exception:
+            page = None
+        if page is None:
+            self._pending.release()
+            self._complete(row, None, started, flight)
+            return
+        kind, data, source = page
+        if kind == "link":
+            self._pending.release()
+            self._complete(row, data, started, flight)
+            return
+
+        try:
+            path = spool_page(source)
+        except Exception as e:
+            # Spool full, gone or unwritable page text: lose this row rather than the run
+            print(f"Couldn't spool {row['asin']} for parsing: {e}")
+            self._pending.release()
+            self._complete(row, None, started, flight)
+            return
+        try:
+            future = self._executor.submit(parse_spooled_page, path, kind, self.fields)
+        except Exception:
+            os.remove(path)
+            self._pending.release()
+            self._complete(row, None, started, flight)
+            raise
+
+        def done(future):
+            self._pending.release()
+            if future.cancelled():
+                if os.path.exists(path):
+                    os.remove(path)
+                self._complete(row, None, started, flight)
+            elif future.exception() is not None:
+                print(f"Error parsing {row['asin']}: {future.exception()}")
+                self._complete(row, None, started, flight)
+            else:
+                parsed, seconds, parse_started, worker = future.result()
+                with self._lock:
+                    self.parse_seconds += seconds
+                if self.tracer is not None:
+                    self.tracer.add('parse', parse_started, seconds, lane=f"parser-{worker}",
+                                    asin=row['asin'], row=row['row_num'], kind=kind)
+                data.update(parsed)
+                self._complete(row, data, started, flight)
+
+        future.add_done_callback(done)
+
+    def _complete(self, row, data, started, flight):
+        """Finish a row this fetcher loaded, sharing the result with anyone waiting on it"""
+        if flight is not None:
+            self.flights.resolve(flight, data)
+            data = dict(data) if data is not None else None
+        self._finish(row, data, started)
+
+    def _finish(self, row, data, started):
+        # Rows answered from a shared fetch (started=None) say nothing about page load time
+        if started is not None:
+            seconds = time.monotonic() - started
+            with self._lock:
+                if self.row_latency is None:
+                    self.row_latency = seconds
+                else:
+                    self.row_latency += LATENCY_ALPHA * (seconds - self.row_latency)
+        self._results.put((row, data))
+        with self._lock:
+            self._in_flight -= 1
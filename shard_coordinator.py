@@ -0,0 +1,234 @@
+"""
+Shard Coordinator
+Splits the ASIN rows of one workbook into shards and hands them to remote
+worker nodes (see shard_worker.py) over a small HTTP API. Shards are leased;
+a lease that is not renewed or completed in time expires and the shard is
+handed to another worker.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+
+SHARD_SIZE = int(os.environ.get("SCRAPER_SHARD_SIZE", "10"))
+LEASE_SECONDS = float(os.environ.get("SCRAPER_LEASE_SECONDS", "120"))
+MAX_SHARD_ATTEMPTS = int(os.environ.get("SCRAPER_SHARD_ATTEMPTS", "3"))
+WORKER_TOKEN = os.environ.get("SCRAPER_WORKER_TOKEN")
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+
+class Shard:
+    def __init__(self, job_id, shard_id, rows):
+        self.job_id = job_id
+        self.shard_id = shard_id
+        self.rows = rows  # [{'row_num', 'asin', 'expected_price'}]
+        self.state = PENDING
+        self.lease_id = None
+        self.lease_expires = 0.0
+        self.worker = None
+        self.attempts = 0
+
+
+class ShardedJob:
+    def __init__(self, job_id, rows, shard_size, fields=None):
+        self.job_id = job_id
+        self.fields = fields  # subset of amazon_scraper.FIELDS, None = all
+        self.shards = [Shard(job_id, i, rows[start:start + shard_size])
+                       for i, start in enumerate(range(0, len(rows), shard_size))]
+        self.results = queue.Queue()  # (shard_id, [{'row_num', 'data'}]) for the merging thread
+
+
+class Coordinator:
+    def __init__(self, shard_size=SHARD_SIZE, lease_seconds=LEASE_SECONDS, max_attempts=MAX_SHARD_ATTEMPTS):
+        """In-memory shard book-keeping shared by the API and the merging job threads"""
+        self.shard_size = shard_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def add_job(self, job_id, rows, fields=None):
+        """Split rows into shards and make them available to workers"""
+        job = ShardedJob(job_id, rows, self.shard_size, fields)
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def remove_job(self, job_id):
+        """Stop handing out a job's shards; late results are rejected"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def lease(self, worker):
+        """Give the oldest pending (or expired) shard and its job's fields to a worker; (None, None) if there is no work"""
+        now = time.monotonic()
+        with self._lock:
+            for job in self._jobs.values():
+                for shard in job.shards:
+                    if shard.state == LEASED and shard.lease_expires < now:
+                        print(f"Lease on job {job.job_id} shard {shard.shard_id} held by {shard.worker} expired")
+                        self._give_up_or_requeue(job, shard)
+                    if shard.state != PENDING:
+                        continue
+                    shard.state = LEASED
+                    shard.lease_id = uuid.uuid4().hex
+                    shard.lease_expires = now + self.lease_seconds
+                    shard.worker = worker
+                    shard.attempts += 1
+                    return shard, job.fields
+        return None, None
+
+    def renew(self, job_id, shard_id, lease_id):
+        """Extend a lease; False if the lease is no longer held"""
+        with self._lock:
+            shard = self._find_shard(job_id, shard_id)
+            if shard is None or shard.state != LEASED or shard.lease_id != lease_id:
+                return False
+            shard.lease_expires = time.monotonic() + self.lease_seconds
+            return True
+
+    def complete(self, job_id, shard_id, lease_id, results):
+        """Accept a shard's results. The first completion wins, even from an expired lease
+
+        Raises ValueError if any result is for a row outside the shard, so a buggy or
+        confused worker can't overwrite rows belonging to other shards.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            shard = self._find_shard(job_id, shard_id)
+            if shard is None or shard.state == DONE:
+                return False
+            shard_rows = {row['row_num'] for row in shard.rows}
+            stray = sorted({r['row_num'] for r in results} - shard_rows)
+            if stray:
+                raise ValueError(f"Rows {stray} are not part of job {job_id} shard {shard_id}")
+            # Any later holder of the shard loses its lease on the next renew
+            shard.state = DONE
+            job.results.put((shard_id, results))
+            return True
+
+    def fail(self, job_id, shard_id, lease_id):
+        """A worker gave up on a shard; hand it to someone else"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            shard = self._find_shard(job_id, shard_id)
+            if shard is None or shard.state != LEASED or shard.lease_id != lease_id:
+                return False
+            self._give_up_or_requeue(job, shard)
+            return True
+
+    def status(self):
+        with self._lock:
+            return [{
+                "job_id": job.job_id,
+                "shards": len(job.shards),
+                "pending": sum(1 for s in job.shards if s.state == PENDING),
+                "leased": [{"shard_id": s.shard_id, "worker": s.worker,
+                            "expires_in": round(s.lease_expires - time.monotonic(), 1)}
+                           for s in job.shards if s.state == LEASED],
+                "done": sum(1 for s in job.shards if s.state == DONE),
+            } for job in self._jobs.values()]
+
+    def _find_shard(self, job_id, shard_id):
+        """Look up a shard of an active job (lock held)"""
+        job = self._jobs.get(job_id)
+        if job is None or not 0 <= shard_id < len(job.shards):
+            return None
+        return job.shards[shard_id]
+
+    def _give_up_or_requeue(self, job, shard):
+        """Put a shard back in the queue, or finish it empty after too many attempts (lock held)"""
+        shard.lease_id = None
+        shard.worker = None
+        if shard.attempts >= self.max_attempts:
+            print(f"Giving up on job {job.job_id} shard {shard.shard_id} after {shard.attempts} attempts")
+            shard.state = DONE
+            job.results.put((shard.shard_id, []))
+        else:
+            shard.state = PENDING
+
+
+coordinator = Coordinator()
+
+
+# --- HTTP API used by shard_worker.py ---
+
+router = APIRouter(prefix="/shards")
+
+
+class LeaseRequest(BaseModel):
+    worker: str
+
+
+class LeaseRef(BaseModel):
+    lease_id: str
+
+
+class RowResult(BaseModel):
+    row_num: int
+    data: Optional[dict] = None
+
+
+class ShardResults(BaseModel):
+    lease_id: str
+    results: List[RowResult]
+
+
+def _check_token(token):
+    if WORKER_TOKEN and token != WORKER_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid worker token")
+
+
+@router.post("/lease")
+async def lease_shard(body: LeaseRequest, x_worker_token: Optional[str] = Header(None)):
+    _check_token(x_worker_token)
+    shard, fields = coordinator.lease(body.worker)
+    if shard is None:
+        return {"shard": None}
+    return {"shard": {
+        "job_id": shard.job_id,
+        "shard_id": shard.shard_id,
+        "lease_id": shard.lease_id,
+        "lease_seconds": coordinator.lease_seconds,
+        "rows": shard.rows,
+        "fields": fields,
+    }}
+
+
+@router.post("/{job_id}/{shard_id}/renew")
+async def renew_lease(job_id: int, shard_id: int, body: LeaseRef, x_worker_token: Optional[str] = Header(None)):
+    _check_token(x_worker_token)
+    if not coordinator.renew(job_id, shard_id, body.lease_id):
+        raise HTTPException(status_code=410, detail="Lease no longer held")
+    return {"ok": True}
+
+
+@router.post("/{job_id}/{shard_id}/complete")
+async def complete_shard(job_id: int, shard_id: int, body: ShardResults,
+                         x_worker_token: Optional[str] = Header(None)):
+    _check_token(x_worker_token)
+    results = [{"row_num": r.row_num, "data": r.data} for r in body.results]
+    try:
+        return {"accepted": coordinator.complete(job_id, shard_id, body.lease_id, results)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{job_id}/{shard_id}/fail")
+async def fail_shard(job_id: int, shard_id: int, body: LeaseRef, x_worker_token: Optional[str] = Header(None)):
+    _check_token(x_worker_token)
+    return {"requeued": coordinator.fail(job_id, shard_id, body.lease_id)}
+
+
+@router.get("/status")
+async def shard_status():
+    return {"jobs": coordinator.status()}
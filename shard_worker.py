@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Shard Worker
+Leases shards of ASIN rows from a coordinator (web_app.py running with
+SCRAPER_MODE=coordinator), scrapes them and posts the rows back.
+
+Run several of these, on one machine or many:
+    python3 shard_worker.py --coordinator http://coordinator-host:8000 --name node-1
+"""
+
+import argparse
+import os
+import socket
+import time
+
+import requests
+
+from amazon_scraper import AmazonScraper
+from proxy_pool import ProxyPool
+
+# Tries at posting a finished shard before handing it back, and the pause between them
+COMPLETE_ATTEMPTS = 3
+RETRY_SECONDS = 2
+
+
+class ShardWorker:
+    def __init__(self, coordinator_url, name, headless=True, poll_interval=5, token=None, scraper_factory=None):
+        """scraper_factory() builds the scraper (default: an AmazonScraper using SCRAPER_PROXIES)"""
+        self.coordinator_url = coordinator_url.rstrip('/')
+        self.name = name
+        self.headless = headless
+        self.poll_interval = poll_interval
+        self.session = requests.Session()
+        if token:
+            self.session.headers['X-Worker-Token'] = token
+        self.scraper_factory = scraper_factory or (
+            lambda: AmazonScraper(headless=self.headless, proxy_pool=ProxyPool.from_env()))
+        self.scraper = None
+
+    def _post(self, path, payload):
+        response = self.session.post(f"{self.coordinator_url}/shards{path}", json=payload, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def run(self, once=False):
+        """Lease and process shards until interrupted (or until no work is left, with once=True)"""
+        try:
+            while True:
+                try:
+                    shard = self._post("/lease", {"worker": self.name})["shard"]
+                except requests.RequestException as e:
+                    print(f"Coordinator unreachable: {e}")
+                    shard = None
+
+                if shard is None:
+                    if once:
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+
+                self.process_shard(shard)
+        finally:
+            if self.scraper is not None:
+                self.scraper.close()
+
+    def process_shard(self, shard):
+        """Scrape every row of a shard, renewing the lease as we go, then report back"""
+        job_id = shard['job_id']
+        shard_id = shard['shard_id']
+        lease_id = shard['lease_id']
+        print(f"Leased job {job_id} shard {shard_id} ({len(shard['rows'])} rows)")
+
+        if self.scraper is None:
+            self.scraper = self.scraper_factory()
+
+        results = []
+        rows = shard['rows']
+        try:
+            for i, row in enumerate(rows):
+                # Let the next pages load in background tabs while this one is read (SCRAPER_PREFETCH)
+                for next_row in rows[i + 1:i + 1 + self.scraper.prefetch_pages]:
+                    self.scraper.prefetch(next_row['asin'], shard.get('fields'))
+                data = self.scraper.scrape_product(row['asin'], row['expected_price'], shard.get('fields'))
+                results.append({"row_num": row['row_num'], "data": data})
+
+                # Keep the lease alive; stop if the coordinator has moved on
+                try:
+                    self._post(f"/{job_id}/{shard_id}/renew", {"lease_id": lease_id})
+                except requests.HTTPError:
+                    print(f"Lost lease on job {job_id} shard {shard_id}, abandoning it")
+                    return
+        except Exception as e:
+            print(f"Shard {shard_id} failed: {e}")
+            self._give_back(job_id, shard_id, lease_id)
+            return
+        finally:
+            # An abandoned or failed shard leaves its next rows queued; don't carry them into the next shard
+            self.scraper.clear_prefetch()
+
+        for attempt in range(1, COMPLETE_ATTEMPTS + 1):
+            try:
+                accepted = self._post(f"/{job_id}/{shard_id}/complete",
+                                      {"lease_id": lease_id, "results": results})["accepted"]
+            except requests.HTTPError as e:
+                print(f"Coordinator refused results for job {job_id} shard {shard_id}: {e}")
+                break
+            except requests.RequestException as e:
+                print(f"Couldn't post results for job {job_id} shard {shard_id} (try {attempt}): {e}")
+                if attempt < COMPLETE_ATTEMPTS:
+                    time.sleep(RETRY_SECONDS * attempt)
+                continue
+            print(f"Completed job {job_id} shard {shard_id} ({'accepted' if accepted else 'already done'})")
+            return
+        self._give_back(job_id, shard_id, lease_id)
+
+    def _give_back(self, job_id, shard_id, lease_id):
+        """Tell the coordinator to hand a shard to someone else (if it can't be reached, the lease just expires)"""
+        try:
+            self._post(f"/{job_id}/{shard_id}/fail", {"lease_id": lease_id})
+        except requests.RequestException:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape shards handed out by a coordinator")
+    parser.add_argument("--coordinator", required=True, help="Base URL of the coordinator web app")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}", help="Worker name shown in lease status")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Seconds to wait when there is no work")
+    parser.add_argument("--show-browser", action="store_true", help="Run Chrome with a visible window")
+    parser.add_argument("--once", action="store_true", help="Exit when the coordinator has no more work")
+    args = parser.parse_args()
+
+    worker = ShardWorker(args.coordinator, args.name, headless=not args.show_browser,
+                         poll_interval=args.poll_interval, token=os.environ.get("SCRAPER_WORKER_TOKEN"))
+    worker.run(once=args.once)
@@ -0,0 +1,108 @@
+"""
+Single-flight registry
+Lets concurrent jobs share page loads. The first job to ask for an ASIN
+fetches it; any other job asking for that ASIN while the fetch is in flight
+waits for it and gets a copy of the result instead of loading the page again.
+Results are also shared for SCRAPER_SHARE_SECONDS after they finish, so jobs
+that run a few seconds apart still overlap.
+
+A result can stand in for any request whose fields it covers: a full scrape
+serves a price check, but not the other way round.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Seconds a finished result keeps being handed out (0 = only share in-flight fetches)
+SHARE_SECONDS = float(os.environ.get("SCRAPER_SHARE_SECONDS", "60"))
+
+
+class Flight:
+    """One page fetch that other requests can wait on"""
+    def __init__(self, asin, fields):
+        self.asin = asin
+        self.fields = fields  # frozenset, None = all fields
+        self.data = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def covers(self, fields):
+        return self.fields is None or (fields is not None and fields <= self.fields)
+
+    def wait(self, should_stop=None, poll=0.5):
+        """Block until the fetch finishes and return a copy of its result (None if it failed or we stopped)"""
+        while not self._done.wait(poll):
+            if should_stop is not None and should_stop():
+                return None
+        return dict(self.data) if self.data is not None else None
+
+
+class SingleFlight:
+    def __init__(self, share_seconds=SHARE_SECONDS):
+        self.share_seconds = share_seconds
+        self._flights = defaultdict(list)  # asin -> [Flight]
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.fetches = 0
+        self.coalesced = 0  # joined a fetch still in flight
+        self.hits = 0  # reused a recently finished result
+
+    def join(self, asin, fields=None):
+        """Find or start the fetch for an ASIN. Returns (flight, leader)
+
+        The leader must load the page and call resolve(); everyone else calls flight.wait().
+        """
+        wanted = None if fields is None else frozenset(fields)
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            flights = self._flights[asin]
+            flights[:] = [f for f in flights
+                          if f.finished_at is None or now - f.finished_at < self.share_seconds]
+            for flight in flights:
+                if flight.covers(wanted):
+                    if flight.finished_at is None:
+                        self.coalesced += 1
+                    else:
+                        self.hits += 1
+                    return flight, False
+
+            flight = Flight(asin, wanted)
+            flights.append(flight)
+            self.fetches += 1
+            return flight, True
+
+    def resolve(self, flight, data):
+        """Publish the leader's result and wake everyone waiting on it"""
+        with self._lock:
+            flight.data = data
+            flight.finished_at = time.monotonic()
+            # Failures are passed to current waiters but not kept for later requests
+            if data is None or self.share_seconds <= 0:
+                flights = self._flights.get(flight.asin, [])
+                if flight in flights:
+                    flights.remove(flight)
+                if not flights:
+                    self._flights.pop(flight.asin, None)
+        flight._done.set()
+
+    def status(self):
+        with self._lock:
+            in_flight = sum(1 for flights in self._flights.values() for f in flights if f.finished_at is None)
+            shared = sum(1 for flights in self._flights.values() for f in flights if f.finished_at is not None)
+            return {
+                "requests": self.requests,
+                "fetches": self.fetches,
+                "coalesced": self.coalesced,
+                "hits": self.hits,
+                "saved_page_loads": self.coalesced + self.hits,
+                "in_flight": in_flight,
+                "shared_results": shared,
+                "share_seconds": self.share_seconds,
+            }
+
+
+# Shared by every job in this process
+flights = SingleFlight()
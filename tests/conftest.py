@@ -0,0 +1,18 @@
+import os
+import sys
+
+# The modules live at the top of the repo, next to web_app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_amazon_server import expected_result, make_product  # noqa: E402
+
+
+def make_rows(count, start=0, expected_price=10.0):
+    """Sheet rows as read_asin_rows returns them, from row 3 with ASINs B000000000, B000000001, ..."""
+    return [{'row_num': i + 3, 'asin': f"B{i:09d}", 'expected_price': expected_price}
+            for i in range(start, start + count)]
+
+
+def scraped(asin):
+    """What FakeScraper.scrape_product returns for an ASIN"""
+    return {'link': f"/dp/{asin}", **expected_result(make_product(asin))}
@@ -0,0 +1,80 @@
+from aimd import LATENCY_TOLERANCE, MIN_WINDOW, AIMDController
+
+
+class FakePipeline:
+    def __init__(self, concurrency=1):
+        self.concurrency = concurrency
+        self.row_latency = 1.0
+        self.in_flight_rows = 0
+        self.reasons = []
+
+    def in_flight(self):
+        return self.in_flight_rows
+
+    def set_concurrency(self, concurrency, reason=None):
+        self.reasons.append(reason)
+        self.concurrency = concurrency
+
+
+def feed(controller, results):
+    for ok in results:
+        controller.observe({} if ok else None)
+
+
+def test_healthy_windows_add_one_fetcher_at_a_time():
+    pipeline = FakePipeline(concurrency=1)
+    controller = AIMDController(pipeline, max_concurrency=3)
+    feed(controller, [True] * MIN_WINDOW)
+    assert pipeline.concurrency == 2
+    feed(controller, [True] * MIN_WINDOW)
+    assert pipeline.concurrency == 3
+    feed(controller, [True] * 20)
+    assert pipeline.concurrency == 3  # capped
+
+
+def test_failures_halve_concurrency():
+    pipeline = FakePipeline(concurrency=4)
+    controller = AIMDController(pipeline, max_concurrency=8)
+    feed(controller, [False, False, True, True, True, True, True, True])
+    assert pipeline.concurrency == 2
+    assert "failed" in pipeline.reasons[-1]
+
+
+def test_slow_pages_halve_concurrency():
+    pipeline = FakePipeline(concurrency=2)
+    controller = AIMDController(pipeline, max_concurrency=4)
+    feed(controller, [True] * 3)
+    pipeline.row_latency = 5.0
+    feed(controller, [True])
+    assert pipeline.concurrency == 1
+    assert "pages take" in pipeline.reasons[-1]
+
+
+def test_rows_in_flight_at_a_cut_are_not_judged():
+    pipeline = FakePipeline(concurrency=4)
+    controller = AIMDController(pipeline, max_concurrency=8)
+    pipeline.in_flight_rows = 3
+    feed(controller, [False] * 8)
+    assert pipeline.concurrency == 2
+    # The next three results were started at 4 fetchers; they mustn't cut again
+    feed(controller, [False] * 3)
+    assert pipeline.concurrency == 2
+
+
+def test_never_below_the_minimum():
+    pipeline = FakePipeline(concurrency=1)
+    controller = AIMDController(pipeline, max_concurrency=4)
+    feed(controller, [False] * MIN_WINDOW)
+    assert pipeline.concurrency == 1
+
+
+def test_a_lasting_slowdown_becomes_the_new_baseline():
+    pipeline = FakePipeline(concurrency=2)
+    controller = AIMDController(pipeline, max_concurrency=4)
+    feed(controller, [True] * 3)
+    pipeline.row_latency = 5.0  # e.g. every page now goes through a slower exit, and stays that way
+    feed(controller, [True])
+    assert pipeline.concurrency == 1
+    feed(controller, [True] * 40)
+    assert controller.best_latency * LATENCY_TOLERANCE > 5.0
+    assert pipeline.concurrency > 1 and pipeline.reasons[-1].startswith("healthy")
@@ -0,0 +1,39 @@
+import pytest
+
+import amazon_scraper
+
+
+@pytest.fixture
+def outputs(monkeypatch):
+    """Output paths main() would hand to process_excel, without scraping anything"""
+    paths = []
+
+    def process_excel(file_path, output_path, **kwargs):
+        paths.append(output_path)
+        return {'scraped': 0, 'failed': 0, 'deferred': 0}
+
+    monkeypatch.setattr(amazon_scraper, "process_excel", process_excel)
+    return paths
+
+
+@pytest.mark.parametrize("name", ["Master.XLSX", "Master.xlsm", "Master.xlsx"])
+def test_default_output_never_overwrites_the_input(outputs, name):
+    amazon_scraper.main([name, "--format", "csv"])
+    assert outputs == ["Master_updated.csv"]
+
+
+def test_default_output_names_the_shard(outputs):
+    amazon_scraper.main(["Master.XLSX", "--shard-index", "1", "--shard-count", "4"])
+    assert outputs == ["Master_updated_shard2of4.xlsx"]
+
+
+def test_output_over_the_input_is_refused(outputs):
+    with pytest.raises(SystemExit):
+        amazon_scraper.main(["Master.xlsx", "-o", "./Master.xlsx"])
+    assert outputs == []
+
+
+def test_process_excel_refuses_to_write_over_its_input(tmp_path):
+    sheet = str(tmp_path / "Master.xlsx")
+    with pytest.raises(ValueError):
+        amazon_scraper.process_excel(sheet, sheet)
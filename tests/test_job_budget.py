@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from job_budget import JobBudget, parse_deadline
+
+
+class FakePipeline:
+    """The parts of ScrapePipeline that JobBudget reads and steers"""
+    def __init__(self, row_latency, queued, in_flight=0, concurrency=1, row_delay=0):
+        self.row_latency = row_latency
+        self.row_delay = row_delay
+        self.concurrency = concurrency
+        self.queued = [{'row_num': i} for i in range(queued)]
+        self._in_flight = in_flight
+        self.changes = []
+
+    def in_flight(self):
+        return self._in_flight
+
+    def remaining(self):
+        return len(self.queued)
+
+    def set_concurrency(self, concurrency, reason=None):
+        self.changes.append((concurrency, reason))
+        self.concurrency = concurrency
+
+    def defer(self, keep=0):
+        deferred, self.queued = self.queued[keep:], self.queued[:keep]
+        return deferred
+
+
+def test_parse_deadline_clock_time_is_the_next_occurrence():
+    now = datetime(2026, 10, 19, 12, 0)
+    assert parse_deadline("18:30", now) == datetime(2026, 10, 19, 18, 30)
+    assert parse_deadline("09:00", now) == datetime(2026, 10, 20, 9, 0)
+
+
+def test_parse_deadline_iso_and_blank():
+    assert parse_deadline("2026-10-20T08:15") == datetime(2026, 10, 20, 8, 15)
+    assert parse_deadline("") is None
+    assert parse_deadline(None) is None
+    with pytest.raises(ValueError):
+        parse_deadline("tomorrow-ish")
+
+
+def test_parse_deadline_with_a_timezone_is_local_time():
+    deadline = parse_deadline("2026-10-20T08:15+00:00")
+    assert deadline.tzinfo is None
+    assert deadline == datetime(2026, 10, 20, 8, 15, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert deadline > datetime.now()  # comparable with the naive clock JobBudget uses
+
+
+def test_parse_deadline_accepts_a_utc_z_suffix():
+    # Spelled out because datetime.fromisoformat only takes "Z" itself from Python 3.11
+    expected = parse_deadline("2026-10-20T08:15+00:00")
+    assert parse_deadline("2026-10-20T08:15Z") == expected
+    assert parse_deadline("2026-10-20T08:15z") == expected
+
+
+def test_eta_without_deadline():
+    budget = JobBudget()
+    pipeline = FakePipeline(row_latency=2.0, queued=9, in_flight=1)
+    assert budget.check(pipeline, done=1) == []
+    expected = datetime.now() + timedelta(seconds=20)
+    assert abs((budget.eta - expected).total_seconds()) < 1
+
+
+def test_no_estimate_before_the_first_row():
+    budget = JobBudget(datetime.now() + timedelta(minutes=5))
+    assert budget.check(FakePipeline(row_latency=None, queued=10), done=0) == []
+    assert budget.eta is None
+
+
+def test_behind_deadline_adds_fetchers_up_to_the_cap():
+    budget = JobBudget(datetime.now() + timedelta(seconds=100), max_concurrency=3)
+    pipeline = FakePipeline(row_latency=10.0, queued=20)
+    assert budget.check(pipeline, done=1) == []
+    assert pipeline.concurrency == 3
+    assert "behind deadline" in pipeline.changes[0][1]
+
+
+def test_rows_that_cannot_fit_are_deferred():
+    budget = JobBudget(datetime.now() + timedelta(seconds=100.5), max_concurrency=1)
+    pipeline = FakePipeline(row_latency=10.0, queued=20)
+    deferred = budget.check(pipeline, done=3)
+    # About 90s of planned time at 10s a row leaves room for 9 rows
+    assert len(pipeline.queued) == 9 and len(deferred) == 11
+
+
+def test_no_deferral_before_enough_samples():
+    budget = JobBudget(datetime.now() + timedelta(seconds=100), max_concurrency=1)
+    pipeline = FakePipeline(row_latency=10.0, queued=20)
+    assert budget.check(pipeline, done=1) == []
+
+
+def test_adaptive_jobs_are_not_sped_up_by_the_budget():
+    budget = JobBudget(datetime.now() + timedelta(seconds=100), max_concurrency=3, raise_concurrency=False)
+    pipeline = FakePipeline(row_latency=10.0, queued=20)
+    budget.check(pipeline, done=1)
+    assert pipeline.changes == []
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from job_scheduler import JobCancelled, JobScheduler
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_users_are_served_round_robin():
+    scheduler = JobScheduler(max_jobs=1, max_browsers=1)
+    gate = threading.Event()
+    started = []
+
+    def job(name, cancel_event=None):
+        started.append(name)
+        gate.wait(2)
+
+    scheduler.submit("blocker", job, "blocker", user="x")
+    wait_for(lambda: started == ["blocker"])
+    scheduler.submit("a1", job, "a1", user="alice")
+    scheduler.submit("a2", job, "a2", user="alice")
+    scheduler.submit("b1", job, "b1", user="bob")
+    assert scheduler.snapshot()["queued"] == ["a1", "b1", "a2"]
+    assert scheduler.queue_position("a2") == 3
+
+    gate.set()
+    wait_for(lambda: len(started) == 4)
+    assert started == ["blocker", "a1", "b1", "a2"]
+
+
+def test_duplicate_jobs_are_rejected():
+    scheduler = JobScheduler(max_jobs=1)
+    gate = threading.Event()
+    assert scheduler.submit(1, lambda cancel_event=None: gate.wait(2))
+    assert not scheduler.submit(1, lambda cancel_event=None: None)
+    gate.set()
+
+
+def test_cancel_queued_and_running_jobs():
+    scheduler = JobScheduler(max_jobs=1)
+    stopped = threading.Event()
+
+    def running(cancel_event=None):
+        cancel_event.wait(2)
+        stopped.set()
+
+    scheduler.submit(1, running)
+    wait_for(lambda: scheduler.snapshot()["running"] == [1])
+    scheduler.submit(2, lambda cancel_event=None: None)
+    assert scheduler.cancel(2) == "queued"
+    assert not scheduler.is_active(2)
+    assert scheduler.cancel(1) == "running"
+    assert stopped.wait(2)
+    assert scheduler.cancel(3) is None
+
+
+def test_browser_slot_wait_is_cancellable():
+    scheduler = JobScheduler(max_jobs=2, max_browsers=1)
+    cancel = threading.Event()
+    cancel.set()
+    with scheduler.browser_slot():
+        with pytest.raises(JobCancelled):
+            with scheduler.browser_slot(cancel):
+                pass
+    with scheduler.browser_slot(cancel):
+        pass  # free again
@@ -0,0 +1,141 @@
+import itertools
+import re
+import time
+
+import requests
+from selenium.common.exceptions import NoSuchElementException
+
+import amazon_scraper
+from amazon_scraper import PRICE_CHECK_FIELDS, AmazonScraper
+from conftest import make_rows
+from fake_amazon_server import make_product, render_product
+from shard_worker import ShardWorker
+
+LOAD_SECONDS = 0.2  # How long the fake browser takes to load any page
+READ_SECONDS = 0.2  # How long the caller spends on a page before asking for the next
+
+
+class FakeTabDriver:
+    """Just enough of a Chrome WebDriver for prefetch: tabs, window.open, readyState and slow page loads"""
+    _ids = itertools.count()
+
+    def __init__(self):
+        self.tabs = {}  # handle -> (url, time.monotonic() when it started loading)
+        self.current_window_handle = self._new_tab("about:blank", 0)
+        self.switch_to = self
+        self.title = "Synthetic Product"
+
+    def _new_tab(self, url, started):
+        handle = f"tab-{next(self._ids)}"
+        self.tabs[handle] = (url, started)
+        return handle
+
+    @property
+    def window_handles(self):
+        return list(self.tabs)
+
+    def window(self, handle):
+        self.current_window_handle = handle
+
+    def get(self, url):
+        time.sleep(LOAD_SECONDS)
+        self.tabs[self.current_window_handle] = (url, 0)
+
+    def execute_script(self, script, *args):
+        if "window.open" in script:
+            self._new_tab(args[0], time.monotonic())
+        else:
+            _, started = self.tabs[self.current_window_handle]
+            loaded_ago = time.monotonic() - started - LOAD_SECONDS
+            if "loadEventEnd" in script:
+                return loaded_ago if loaded_ago >= 0 else None
+            return "complete" if loaded_ago >= 0 else "loading"
+
+    def close(self):
+        del self.tabs[self.current_window_handle]
+
+    @property
+    def page_source(self):
+        url, _ = self.tabs[self.current_window_handle]
+        return render_product(make_product(re.search(r'B\w{9}', url).group()))
+
+    def find_element(self, by, selector):
+        raise NoSuchElementException(selector)
+
+    def find_elements(self, by, selector):
+        return []
+
+    def quit(self):
+        pass
+
+
+class TabScraper(AmazonScraper):
+    """AmazonScraper driving FakeTabDriver, recording the latency each page load would report"""
+    def _start_driver(self):
+        self.driver = FakeTabDriver()
+        self._prefetched = {}
+        self.latencies = []
+
+    def _report_exit(self, success, start, blocked=False):
+        self.latencies.append(time.monotonic() - start)
+
+
+def asins(count):
+    return [f"B{i:09d}" for i in range(count)]
+
+
+def read_all(scraper, batch):
+    """Fetch each ASIN in turn, queueing the next ones the way shard_worker does; returns seconds taken"""
+    started = time.monotonic()
+    for i, asin in enumerate(batch):
+        for upcoming in batch[i + 1:i + 1 + scraper.prefetch_pages]:
+            scraper.prefetch(upcoming)
+        kind, data, source = scraper.fetch_page(asin)
+        assert asin in source
+        time.sleep(READ_SECONDS)
+    return time.monotonic() - started
+
+
+def test_prefetch_overlaps_loading_with_reading(monkeypatch):
+    monkeypatch.setattr(amazon_scraper, "PAGE_LOAD_WAIT", 0)
+    batch = asins(6)
+    plain = TabScraper(base_url="http://fake", prefetch_pages=0)
+    ahead = TabScraper(base_url="http://fake", prefetch_pages=1)
+
+    plain_seconds = read_all(plain, batch)
+    ahead_seconds = read_all(ahead, batch)
+    # Every page after the first loaded while the previous one was being read
+    assert ahead_seconds < plain_seconds - (len(batch) - 2) * LOAD_SECONDS
+    assert len(ahead.driver.window_handles) == 1
+    # The exit is scored on the wait for the tab (none here), not the time it spent loading in the background
+    assert min(plain.latencies) >= LOAD_SECONDS
+    assert max(ahead.latencies[1:]) < LOAD_SECONDS / 2
+
+
+def test_abandoned_shard_leaves_no_prefetch_behind(monkeypatch):
+    monkeypatch.setattr(amazon_scraper, "PAGE_LOAD_WAIT", 0)
+    monkeypatch.setattr(amazon_scraper, "OFFER_PAGE_WAIT", 0)
+    scraper = TabScraper(base_url="http://fake", prefetch_pages=2)
+    worker = ShardWorker("http://coordinator", "w1", scraper_factory=lambda: scraper)
+
+    def post(path, payload):
+        raise requests.HTTPError("410 lease no longer held")
+
+    monkeypatch.setattr(worker, "_post", post)
+    rows = make_rows(5)
+    worker.process_shard({'job_id': 1, 'shard_id': 0, 'lease_id': "l", 'rows': rows,
+                          'fields': PRICE_CHECK_FIELDS})
+
+    assert scraper._upcoming == [] and scraper._prefetched == {}
+    assert len(scraper.driver.window_handles) == 1
+
+
+def test_prefetched_page_settles_from_when_it_finished_loading():
+    scraper = TabScraper(base_url="http://fake", prefetch_pages=1)
+    driver = scraper.driver
+    loaded_long_ago = driver._new_tab("http://fake/dp/B000000001", time.monotonic() - 1.0)
+    just_loaded = driver._new_tab("http://fake/dp/B000000002", time.monotonic() - LOAD_SECONDS)
+
+    assert scraper._show_prefetched(loaded_long_ago, settle=0.5) == 0
+    # Opened LOAD_SECONDS ago but only just loaded: the whole settle is still owed
+    assert scraper._show_prefetched(just_loaded, settle=0.5) > 0.45
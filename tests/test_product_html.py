@@ -0,0 +1,81 @@
+from product_html import count_embedded_images, count_embedded_videos, parse_photo_count, parse_videos
+
+
+def gallery(images, videos=None):
+    """A page with an ImageBlockATF-style script holding these image and video literals"""
+    videos_entry = f"'videos': [{', '.join(videos)}]," if videos is not None else ""
+    return f"""<html><body>
+  <script type="text/javascript">
+    P.when('A').register("ImageBlockATF", function(A){{
+      var data = {{
+        'colorImages': {{ 'initial': [{', '.join(images)}] }},
+        'heroImage': {{}},
+        {videos_entry}
+        'title': "Bowl"
+      }};
+      return data;
+    }});
+  </script>
+</body></html>"""
+
+
+def thumbnails(visible, more=0, videos=0):
+    """An altImages strip: `visible` image thumbnails, then a "+N" button for `more` hidden ones"""
+    items = ['<li class="item imageThumbnail"><span class="a-button-text"><img src="t.jpg"></span></li>'] * visible
+    if more:
+        items.append(f'<li class="item imageThumbnail"><span class="a-button-text"><span>{more}+</span></span></li>')
+    items += ['<li class="item videoThumbnail"><span class="a-button-text"><img src="v.jpg"></span></li>'] * videos
+    return f'<div id="imageBlock"><div id="altImages"><ul>{"".join(items)}</ul></div></div>'
+
+
+def test_embedded_images_counts_hidden_images_too():
+    # Nine images in the data although the strip shows five and a "+4" button
+    page = gallery(['{"hiRes": "%d.jpg"}' % i for i in range(9)]) + thumbnails(5, more=4)
+    assert count_embedded_images(page) == 9
+
+
+def test_embedded_images_ignores_brackets_and_quotes_inside_strings():
+    images = ['{"alt": "Set of 3 [large] {blue}", "hiRes": "a.jpg"}',
+              "{'alt': 'Chef\\'s bowl }', 'variants': [{'x': 1}, {'x': 2}]}",
+              '{"main": {"1500": [1500, 1500]}}']
+    assert count_embedded_images(gallery(images)) == 3
+
+
+def test_embedded_images_without_gallery_data():
+    assert count_embedded_images("<html><body>No scripts here</body></html>") is None
+    # colorImages outside a <script> isn't gallery data
+    assert count_embedded_images("<p>'colorImages': { 'initial': [{}, {}] }</p>") is None
+    assert count_embedded_images(gallery([])) == 0
+
+
+def test_embedded_images_truncated_array_is_unknown():
+    page = "<script>var data = {'colorImages': { 'initial': [{\"a\": 1}, {\"b\": </script>"
+    assert count_embedded_images(page) is None
+
+
+def test_embedded_videos():
+    page = gallery(['{"hiRes": "a.jpg"}'], videos=['{"title": "Unboxing [HD]"}', '{"title": "How to use"}'])
+    assert count_embedded_videos(page) == 2
+    assert count_embedded_videos(gallery(['{"hiRes": "a.jpg"}'], videos=[])) == 0
+    assert count_embedded_videos(gallery(['{"hiRes": "a.jpg"}'])) == 0  # no videos key at all
+    assert count_embedded_videos("<html></html>") is None
+
+
+def test_review_videos_are_not_product_videos():
+    reviews = "<script>var reviews = {'videos': [{'url': 'review.mp4'}]};</script>"
+    assert count_embedded_videos(gallery(['{"hiRes": "a.jpg"}']) + reviews) == 0
+
+
+def test_photo_count_falls_back_to_thumbnails_and_the_plus_n_button():
+    # The "+4" button takes the place of a sixth thumbnail: 6 + 4 photos
+    assert parse_photo_count(thumbnails(5, more=4)) == 10
+    assert parse_photo_count(thumbnails(3)) == 3
+    assert parse_photo_count("<html></html>") == 0
+    # The embedded data wins when present
+    assert parse_photo_count(gallery(['{"hiRes": "%d.jpg"}' % i for i in range(7)]) + thumbnails(5, more=4)) == 7
+
+
+def test_videos_fall_back_to_video_thumbnails():
+    assert parse_videos(gallery(['{}'], videos=['{}'])) == "YES"
+    assert parse_videos(thumbnails(3, videos=1)) == "YES"
+    assert parse_videos(thumbnails(3)) == "NO"
@@ -0,0 +1,197 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+import requests
+
+from amazon_scraper import AmazonScraper
+from fake_amazon_server import FakeAmazonServer, FakeProxy
+from job_scheduler import JobCancelled
+from proxy_pool import MAX_CONSECUTIVE_BLOCKS, ProxyPool, TokenBucket, looks_blocked
+
+
+def test_token_bucket_allows_burst_then_limits():
+    bucket = TokenBucket(rate_per_second=1, burst=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert 0 < bucket.wait_time() <= 1
+
+
+def test_token_bucket_rate_zero_is_unlimited():
+    bucket = TokenBucket(0)
+    assert all(bucket.try_acquire() for _ in range(100))
+    assert bucket.wait_time() == 0
+
+
+def test_token_bucket_acquire_stops_on_cancel():
+    bucket = TokenBucket(rate_per_second=0.001)
+    bucket.try_acquire()
+    cancel = threading.Event()
+    cancel.set()
+    assert bucket.acquire(cancel) is False
+
+
+def test_looks_blocked():
+    assert looks_blocked("<title>Robot Check</title>")
+    assert looks_blocked("", status_code=503)
+    assert not looks_blocked("<title>Product</title>")
+
+
+def test_pool_needs_an_exit():
+    with pytest.raises(ValueError):
+        ProxyPool([])
+
+
+def test_failures_lower_score_and_quarantine():
+    pool = ProxyPool(["direct", "http://proxy:3128"], quarantine_seconds=60)
+    bad = pool.exits[1]
+    start = bad.score()
+    pool.report(bad, success=False, latency=1.0)
+    assert bad.score() < start
+    for _ in range(20):
+        pool.report(bad, success=False, latency=1.0)
+    assert bad.is_quarantined()
+    assert pool.healthy_exits() == [pool.exits[0]]
+
+
+def test_consecutive_blocks_quarantine_with_backoff():
+    pool = ProxyPool(["http://a:1"], quarantine_seconds=10)
+    proxy_exit = pool.exits[0]
+    for _ in range(MAX_CONSECUTIVE_BLOCKS):
+        pool.report(proxy_exit, success=False, blocked=True)
+    first = proxy_exit.quarantined_until
+    assert proxy_exit.is_quarantined()
+    assert proxy_exit.quarantine_count == 1
+
+    proxy_exit.quarantined_until = 0  # back on probation: one more block sends it back, for twice as long
+    pool.report(proxy_exit, success=False, blocked=True)
+    assert proxy_exit.quarantine_count == 2
+    assert proxy_exit.quarantined_until - first > 10  # doubled to 20s
+
+
+def test_slow_exit_scores_lower():
+    pool = ProxyPool(["http://fast:1", "http://slow:1"])
+    fast, slow = pool.exits
+    pool.report(fast, success=True, latency=1.0)
+    pool.report(slow, success=True, latency=15.0)
+    assert fast.score() > slow.score()
+
+
+def test_assign_spreads_browsers_then_prefers_score():
+    pool = ProxyPool(["http://a:1", "http://b:1"])
+    pool.report(pool.exits[1], success=False)
+    first = pool.assign()
+    second = pool.assign()
+    assert first is pool.exits[0]  # better score
+    assert second is pool.exits[1]  # least shared
+    pool.release(first)
+    assert pool.assign() is pool.exits[0]
+
+
+def test_acquire_skips_quarantined_exits():
+    pool = ProxyPool(["http://a:1", "http://b:1"], rate_per_minute=600)
+    for _ in range(MAX_CONSECUTIVE_BLOCKS):
+        pool.report(pool.exits[0], success=False, blocked=True)
+    assert pool.acquire() is pool.exits[1]
+
+
+@pytest.fixture
+def amazon():
+    server = FakeAmazonServer(latency=0, jitter=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def proxies():
+    started = []
+
+    def start(mode="ok", delay=0.0):
+        started.append(FakeProxy(mode, delay).start())
+        return started[-1]
+
+    yield start
+    for proxy in started:
+        proxy.stop()
+
+
+def test_traffic_moves_off_blocked_and_dead_exits(amazon, proxies):
+    good = proxies()
+    blocked = proxies("blocked")
+    pool = ProxyPool([good.url, blocked.url, "http://127.0.0.1:9"], rate_per_minute=6000)
+    # Every exit starts out equal, so the bad ones get tried too
+    outcomes = [pool.fetch(f"{amazon.url}/dp/B00000000{i % 10}", timeout=5) for i in range(30)]
+
+    good_exit, blocked_exit, dead_exit = pool.exits
+    assert blocked_exit.is_quarantined() and dead_exit.is_quarantined()
+    assert not good_exit.is_quarantined()
+    assert good.requests >= 20 and blocked.requests <= MAX_CONSECUTIVE_BLOCKS
+    last = outcomes[-5:]
+    assert all(response is not None and response.ok and proxy_exit is good_exit for response, proxy_exit in last)
+    assert "Synthetic Product" in last[-1][0].text
+
+
+def _timed_fetch(proxy_exit, url):
+    """(success, latency) of one request pinned to an exit, the way AmazonScraper reports a page load"""
+    start = time.monotonic()
+    response = requests.get(url, proxies=proxy_exit.requests_proxies(), timeout=5)
+    return response.ok, time.monotonic() - start
+
+
+def test_slow_exit_loses_to_a_fast_one(amazon, proxies):
+    fast = proxies()
+    slow = proxies(delay=0.3)
+    pool = ProxyPool([fast.url, slow.url], rate_per_minute=6000)
+    for proxy_exit in pool.exits:
+        for _ in range(3):
+            pool.report(proxy_exit, *_timed_fetch(proxy_exit, f"{amazon.url}/dp/B000000001"))
+    fast_exit, slow_exit = pool.exits
+    assert slow_exit.latency > fast_exit.latency
+    assert fast_exit.score() > slow_exit.score()
+    assert pool.assign() is fast_exit
+
+
+class NoBrowserScraper(AmazonScraper):
+    """AmazonScraper that pins an exit like the real one but never launches Chrome"""
+    def _start_driver(self):
+        self.starts = getattr(self, 'starts', 0) + 1
+        self.proxy_exit = self.proxy_pool.assign()
+        self.driver = mock.Mock()
+
+
+def test_rotation_moves_to_a_healthy_exit():
+    pool = ProxyPool(["http://a:1", "http://b:1"])
+    scraper = NoBrowserScraper(proxy_pool=pool)
+    first = scraper.proxy_exit
+    for _ in range(MAX_CONSECUTIVE_BLOCKS):
+        pool.report(first, success=False, blocked=True)
+    scraper._rotate_exit()
+    assert scraper.starts == 2 and scraper.proxy_exit is not first
+
+
+def test_rotation_waits_instead_of_restarting_when_every_exit_is_quarantined():
+    pool = ProxyPool(["http://a:1"], quarantine_seconds=0.2)
+    scraper = NoBrowserScraper(proxy_pool=pool)
+    for _ in range(MAX_CONSECUTIVE_BLOCKS):
+        pool.report(scraper.proxy_exit, success=False, blocked=True)
+    started = time.monotonic()
+    scraper._rotate_exit()
+    assert time.monotonic() - started >= 0.15
+    assert scraper.starts == 1  # same exit back on probation, no browser restart
+    assert not scraper.proxy_exit.is_quarantined()
+
+
+def test_quarantine_wait_ends_when_the_job_is_cancelled():
+    pool = ProxyPool(["http://a:1"], quarantine_seconds=3600)
+    cancel = threading.Event()
+    scraper = NoBrowserScraper(proxy_pool=pool, cancel_event=cancel)
+    for _ in range(MAX_CONSECUTIVE_BLOCKS):
+        pool.report(scraper.proxy_exit, success=False, blocked=True)
+    threading.Timer(0.2, cancel.set).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelled):
+        scraper._rotate_exit()
+    assert time.monotonic() - started < 2
+    assert scraper.starts == 1
@@ -0,0 +1,200 @@
+import threading
+import time
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+import product_html
+import scrape_pipeline
+from amazon_scraper import PRICE_CHECK_FIELDS, AmazonScraper
+from conftest import make_rows
+from fake_amazon_server import FakeScraper, expected_result, make_product, render_product
+from job_scheduler import JobScheduler
+from scrape_pipeline import ScrapePipeline
+from single_flight import SingleFlight
+
+
+def run(pipeline, rows):
+    results = {}
+    ok = pipeline.run(rows, lambda row, data: results.__setitem__(row['asin'], data))
+    return ok, results
+
+
+@pytest.mark.parametrize("fetchers", [1, 3])
+def test_inline_scrapes_every_row(fetchers):
+    scrapers = []
+    pipeline = ScrapePipeline(lambda: scrapers.append(FakeScraper()) or scrapers[-1], fetchers=fetchers)
+    ok, results = run(pipeline, make_rows(10))
+    assert ok
+    assert sorted(results) == [row['asin'] for row in make_rows(10)]
+    assert all(data['buybox_price'] == make_product(asin)['price'] for asin, data in results.items())
+    assert len(scrapers) == fetchers and all(s.closed for s in scrapers)
+    assert pipeline.in_flight() == 0 and pipeline.row_latency is not None
+
+
+def test_parse_workers_match_inline_results():
+    pipeline = ScrapePipeline(FakeScraper, fetchers=2, parse_workers=2)
+    ok, results = run(pipeline, make_rows(8))
+    assert ok
+    for asin, data in results.items():
+        expected = expected_result(make_product(asin))
+        assert {field: data[field] for field in expected} == expected
+    assert pipeline.parse_seconds > 0
+
+
+def test_failed_rows_are_delivered_as_none(monkeypatch):
+    rows = make_rows(4)
+    monkeypatch.setattr(FakeScraper, "fail", {rows[1]['asin']})
+    ok, results = run(ScrapePipeline(FakeScraper), rows)
+    assert ok and results[rows[1]['asin']] is None
+
+
+def test_cancel_stops_the_run(monkeypatch):
+    monkeypatch.setattr(FakeScraper, "delay", 0.05)
+    cancel = threading.Event()
+    pipeline = ScrapePipeline(FakeScraper, cancel_event=cancel)
+    delivered = []
+
+    def on_result(row, data):
+        delivered.append(row)
+        cancel.set()
+
+    assert pipeline.run(make_rows(10), on_result) is False
+    assert len(delivered) < 10
+
+
+def test_defer_takes_back_unstarted_rows(monkeypatch):
+    monkeypatch.setattr(FakeScraper, "delay", 0.02)
+    pipeline = ScrapePipeline(FakeScraper)
+    rows = make_rows(10)
+    deferred = []
+    delivered = []
+
+    def on_result(row, data):
+        delivered.append(row)
+        if not deferred:
+            deferred.extend(pipeline.defer(keep=2))
+
+    assert pipeline.run(rows, on_result)
+    assert len(delivered) + len(deferred) == 10
+    assert deferred == rows[-len(deferred):]  # the tail of the queue goes first
+    assert pipeline.deferred == len(deferred)
+
+
+def test_set_concurrency_adds_fetchers_and_logs_the_reason(monkeypatch):
+    monkeypatch.setattr(FakeScraper, "delay", 0.01)
+    scrapers = []
+    pipeline = ScrapePipeline(lambda: scrapers.append(FakeScraper()) or scrapers[-1])
+
+    def on_result(row, data):
+        if pipeline.concurrency == 1:
+            pipeline.set_concurrency(3, "test")
+
+    assert pipeline.run(make_rows(20), on_result)
+    assert len(scrapers) >= 2
+    assert pipeline.concurrency_changes == 1 and "1 -> 3: test" in pipeline.concurrency_log[0]
+
+
+def test_scraper_errors_are_raised():
+    def broken_factory():
+        raise RuntimeError("no browser")
+
+    with pytest.raises(RuntimeError):
+        ScrapePipeline(broken_factory).run(make_rows(2), lambda row, data: None)
+
+
+def test_two_pipelines_share_one_fetch_per_asin(monkeypatch):
+    monkeypatch.setattr(FakeScraper, "delay", 0.05)
+    flights = SingleFlight(share_seconds=60)
+    loads = []
+    outputs = [{}, {}]
+
+    def job(i):
+        pipeline = ScrapePipeline(lambda: FakeScraper(loads), flights=flights)
+        pipeline.run(make_rows(5), lambda row, data: outputs[i].__setitem__(row['asin'], data))
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(loads) == sorted(row['asin'] for row in make_rows(5))
+    assert outputs[0] == outputs[1] and len(outputs[0]) == 5
+
+
+def test_a_failed_spool_loses_the_row_not_the_run(monkeypatch):
+    def full_spool(source):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(scrape_pipeline, "spool_page", full_spool)
+    pipeline = ScrapePipeline(FakeScraper, parse_workers=1)
+    ok, results = run(pipeline, make_rows(3))
+    assert ok and results == dict.fromkeys(row['asin'] for row in make_rows(3))
+    assert pipeline.in_flight() == 0
+
+
+# An offer listing that has offers but no price on the pinned one (e.g. "See all buying options")
+PRICELESS_OFFER = """<div id="aod-container">
+  <div id="aod-pinned-offer"><div id="aod-offer-soldBy"><div class="a-col-right">Some Seller</div></div></div>
+  <div id="aod-offer"><span class="a-offscreen">FREE delivery</span></div>
+</div>"""
+
+
+class PricelessOfferElement:
+    def find_element(self, by, selector):
+        raise NoSuchElementException(selector)
+
+
+class PageScraper(AmazonScraper):
+    """AmazonScraper over canned pages: the offer listing above, then the fake server's product page"""
+    def _start_driver(self):
+        self.driver = None
+        self.loaded = []
+
+    def _load(self, url, asin, settle=None):
+        self.loaded.append('offer' if '/gp/aod/' in url else 'product')
+        self._source = PRICELESS_OFFER if self.loaded[-1] == 'offer' else render_product(make_product(asin))
+        return True
+
+    def _page_source(self):
+        return self._source
+
+    def _get_offer_buybox(self):
+        self.driver = PricelessOfferElement()  # what Selenium finds on the priceless listing
+        return super()._get_offer_buybox()
+
+    # On the product page, read the DOM the way product_html reads the HTML
+    def _get_buybox_seller(self):
+        return product_html.parse_buybox_seller(self._source)
+
+    def _get_price(self):
+        return product_html.parse_price(self._source)
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("parse_workers", [0, 1])
+def test_offer_without_a_price_falls_back_to_the_product_page(parse_workers):
+    scrapers = []
+    pipeline = ScrapePipeline(lambda: scrapers.append(PageScraper(base_url="http://fake")) or scrapers[-1],
+                              fields=PRICE_CHECK_FIELDS, parse_workers=parse_workers)
+    rows = make_rows(1)
+    ok, results = run(pipeline, rows)
+    product = expected_result(make_product(rows[0]['asin']))
+    assert ok and scrapers[0].loaded == ['offer', 'product']
+    data = results[rows[0]['asin']]
+    assert (data['buybox_seller'], data['buybox_price']) == (product['buybox_seller'], product['buybox_price'])
+
+
+def test_fetchers_waiting_for_a_slot_give_up_when_the_rows_run_out(monkeypatch):
+    monkeypatch.setattr(FakeScraper, "delay", 0.05)
+    scheduler = JobScheduler(max_jobs=1, max_browsers=1)
+    scrapers = []
+    pipeline = ScrapePipeline(lambda: scrapers.append(FakeScraper()) or scrapers[-1], fetchers=2,
+                              browser_slot=lambda give_up=None: scheduler.browser_slot(give_up=give_up))
+    started = time.monotonic()
+    ok, results = run(pipeline, make_rows(5))
+    assert ok and len(results) == 5
+    assert len(scrapers) == 1  # the second fetcher never got a slot while there was work
+    assert time.monotonic() - started < 2
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from conftest import make_rows
+from shard_coordinator import DONE, LEASED, PENDING, Coordinator
+
+
+def test_rows_are_split_into_shards_and_leased_in_order():
+    coordinator = Coordinator(shard_size=2)
+    job = coordinator.add_job(1, make_rows(5), fields=['buybox_price'])
+    assert [len(s.rows) for s in job.shards] == [2, 2, 1]
+
+    shard, fields = coordinator.lease("w1")
+    assert shard.shard_id == 0 and shard.state == LEASED and shard.worker == "w1"
+    assert fields == ['buybox_price']
+    assert coordinator.lease("w2")[0].shard_id == 1
+    assert coordinator.lease("w3")[0].shard_id == 2
+    assert coordinator.lease("w4") == (None, None)
+
+
+def test_renew_needs_the_current_lease():
+    coordinator = Coordinator(shard_size=10)
+    coordinator.add_job(1, make_rows(3))
+    shard, _ = coordinator.lease("w1")
+    assert coordinator.renew(1, 0, shard.lease_id)
+    assert not coordinator.renew(1, 0, "someone-else")
+    assert not coordinator.renew(1, 5, shard.lease_id)
+    assert not coordinator.renew(2, 0, shard.lease_id)
+
+
+def test_expired_lease_goes_to_another_worker():
+    coordinator = Coordinator(shard_size=10, lease_seconds=0.01)
+    coordinator.add_job(1, make_rows(3))
+    first, _ = coordinator.lease("w1")
+    old_lease = first.lease_id
+    time.sleep(0.02)
+    second, _ = coordinator.lease("w2")
+    assert second is first and second.worker == "w2" and second.attempts == 2
+    assert not coordinator.renew(1, 0, old_lease)
+
+
+def test_first_completion_wins():
+    coordinator = Coordinator(shard_size=10)
+    job = coordinator.add_job(1, make_rows(2))
+    shard, _ = coordinator.lease("w1")
+    results = [{'row_num': 3, 'data': {'buybox_price': 1.0}}, {'row_num': 4, 'data': None}]
+    assert coordinator.complete(1, 0, shard.lease_id, results)
+    assert shard.state == DONE
+    assert job.results.get_nowait() == (0, results)
+    assert not coordinator.complete(1, 0, shard.lease_id, results)
+    assert job.results.empty()
+
+
+def test_fail_requeues_then_gives_up():
+    coordinator = Coordinator(shard_size=10, max_attempts=2)
+    job = coordinator.add_job(1, make_rows(2))
+    shard, _ = coordinator.lease("w1")
+    assert coordinator.fail(1, 0, shard.lease_id)
+    assert shard.state == PENDING
+    assert not coordinator.fail(1, 0, shard.lease_id)  # no longer leased
+
+    shard, _ = coordinator.lease("w2")
+    assert coordinator.fail(1, 0, shard.lease_id)
+    assert shard.state == DONE
+    assert job.results.get_nowait() == (0, [])
+
+
+def test_removed_job_rejects_late_results():
+    coordinator = Coordinator(shard_size=10)
+    coordinator.add_job(1, make_rows(2))
+    shard, _ = coordinator.lease("w1")
+    coordinator.remove_job(1)
+    assert not coordinator.complete(1, 0, shard.lease_id, [])
+    assert coordinator.status() == []
+
+
+def test_results_must_belong_to_the_shard():
+    coordinator = Coordinator(shard_size=2)
+    job = coordinator.add_job(1, make_rows(4))
+    shard, _ = coordinator.lease("w1")
+    with pytest.raises(ValueError):
+        coordinator.complete(1, 0, shard.lease_id, [{'row_num': 5, 'data': None}])  # row of shard 1
+    assert shard.state == LEASED and job.results.empty()
@@ -0,0 +1,104 @@
+import multiprocessing
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+uvicorn = pytest.importorskip("uvicorn")
+from fastapi import FastAPI
+
+import shard_coordinator
+import shard_worker
+from conftest import make_rows, scraped
+from fake_amazon_server import FakeScraper
+from shard_coordinator import Coordinator
+from shard_worker import ShardWorker
+
+
+def work(url, name, crash_on=None):
+    ShardWorker(url, name, poll_interval=0.05, scraper_factory=lambda: FakeScraper(crash_on=crash_on)).run()
+
+
+@pytest.fixture
+def coordinator_url(monkeypatch):
+    monkeypatch.setattr(shard_coordinator, "coordinator", Coordinator(shard_size=3, lease_seconds=1))
+    app = FastAPI()
+    app.include_router(shard_coordinator.router)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
+
+
+def collect(job, shards, timeout=20):
+    """{row_num: data} once every shard of the job has reported"""
+    rows = {}
+    deadline = time.monotonic() + timeout
+    for _ in range(shards):
+        _, results = job.results.get(timeout=max(0.1, deadline - time.monotonic()))
+        for result in results:
+            assert result['row_num'] not in rows
+            rows[result['row_num']] = result['data']
+    return rows
+
+
+def test_worker_processes_finish_a_job_despite_a_crashed_node(coordinator_url):
+    rows = make_rows(20)
+    job = shard_coordinator.coordinator.add_job(1, rows)
+    fork = multiprocessing.get_context("fork")
+
+    # This node takes the first shard and dies on its first row
+    crashed = fork.Process(target=work, args=(coordinator_url, "crashed", rows[0]['asin']))
+    crashed.start()
+    crashed.join(10)
+    assert crashed.exitcode == 1
+
+    workers = [fork.Process(target=work, args=(coordinator_url, f"node-{i}")) for i in range(3)]
+    for worker in workers:
+        worker.start()
+    try:
+        results = collect(job, len(job.shards))
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join(5)
+
+    assert sorted(results) == [row['row_num'] for row in rows]
+    for row in rows:
+        assert results[row['row_num']] == scraped(row['asin'])
+    assert job.shards[0].attempts == 2  # re-leased after the crash
+
+
+def test_results_for_other_shards_rows_are_refused(coordinator_url):
+    shard_coordinator.coordinator.add_job(1, make_rows(6))
+    worker = ShardWorker(coordinator_url, "w1")
+    shard = worker._post("/lease", {"worker": "w1"})["shard"]
+    with pytest.raises(requests.HTTPError) as error:
+        worker._post(f"/1/{shard['shard_id']}/complete",
+                     {"lease_id": shard['lease_id'], "results": [{"row_num": 8, "data": {}}]})
+    assert error.value.response.status_code == 400
+
+
+def test_undeliverable_results_are_retried_then_handed_back(monkeypatch):
+    monkeypatch.setattr(shard_worker, "RETRY_SECONDS", 0)
+    worker = ShardWorker("http://coordinator", "w1", scraper_factory=FakeScraper)
+    posts = []
+
+    def post(path, payload):
+        posts.append(path.rsplit('/', 1)[-1])
+        if path.endswith("/complete"):
+            raise requests.ConnectionError("coordinator restarting")
+        return {"ok": True}
+
+    monkeypatch.setattr(worker, "_post", post)
+    worker.process_shard({'job_id': 1, 'shard_id': 0, 'lease_id': "l", 'rows': make_rows(1)})
+    assert posts == ["renew"] + ["complete"] * shard_worker.COMPLETE_ATTEMPTS + ["fail"]
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def test_first_request_leads_and_others_wait():
+    flights = SingleFlight(share_seconds=60)
+    flight, leader = flights.join("B1", ['buybox_price'])
+    joined, follower_leads = flights.join("B1", ['buybox_price'])
+    assert leader and not follower_leads and joined is flight
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(joined.wait()))
+    waiter.start()
+    flights.resolve(flight, {'buybox_price': 9.99})
+    waiter.join(1)
+    assert results == [{'buybox_price': 9.99}]
+    assert flights.status()['coalesced'] == 1
+
+
+def test_waiters_get_copies():
+    flights = SingleFlight()
+    flight, _ = flights.join("B1")
+    flights.resolve(flight, {'photos': 3})
+    copy = flight.wait()
+    copy['photos'] = 0
+    assert flight.wait() == {'photos': 3}
+
+
+def test_full_scrape_covers_a_price_check_but_not_the_reverse():
+    flights = SingleFlight()
+    price_check, _ = flights.join("B1", ['buybox_seller', 'buybox_price'])
+    _, leads = flights.join("B1", None)
+    assert leads  # a price check can't answer a full scrape
+
+    full, _ = flights.join("B2", None)
+    shared, leads = flights.join("B2", ['buybox_price'])
+    assert shared is full and not leads
+
+
+def test_finished_results_are_reused_until_they_expire():
+    flights = SingleFlight(share_seconds=0.05)
+    flight, _ = flights.join("B1")
+    flights.resolve(flight, {'review': 4.5})
+    assert flights.join("B1") == (flight, False)
+    assert flights.status()['hits'] == 1
+    time.sleep(0.06)
+    assert flights.join("B1")[1]
+
+
+def test_failures_are_not_shared_later():
+    flights = SingleFlight(share_seconds=60)
+    flight, _ = flights.join("B1")
+    flights.resolve(flight, None)
+    assert flight.wait() is None
+    assert flights.join("B1")[1]
+
+
+def test_wait_gives_up_when_asked_to_stop():
+    flights = SingleFlight()
+    flight, _ = flights.join("B1")
+    assert flight.wait(should_stop=lambda: True, poll=0.01) is None
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+
+from tracing import Tracer
+
+
+def spans(tracer):
+    return [e for e in tracer.trace_events()["traceEvents"] if e["ph"] == "X"]
+
+
+def test_spans_are_chrome_complete_events_with_row_tags():
+    tracer = Tracer("job")
+    with tracer.tags(asin="B1", row=3):
+        with tracer.span("navigate"):
+            time.sleep(0.01)
+        with tracer.span("buybox_seller/sold_by_xpath", method=3):
+            pass
+    with tracer.span("outside"):
+        pass
+
+    navigate, xpath, outside = spans(tracer)
+    assert navigate["name"] == "navigate" and navigate["ph"] == "X"
+    assert navigate["dur"] >= 10000  # microseconds
+    assert navigate["args"] == {"asin": "B1", "row": 3}
+    assert xpath["cat"] == "buybox_seller" and xpath["args"] == {"asin": "B1", "row": 3, "method": 3}
+    assert outside["args"] == {}
+
+
+def test_each_thread_gets_a_named_lane():
+    tracer = Tracer("job")
+
+    def work():
+        with tracer.tags(row=4), tracer.span("row"):
+            pass
+
+    thread = threading.Thread(target=work, name="fetcher-1")
+    thread.start()
+    thread.join()
+    with tracer.span("main"):
+        pass
+    tracer.add("parse", time.perf_counter(), 0.002, lane="parser-1", row=5)
+
+    events = tracer.trace_events()["traceEvents"]
+    lanes = {e["args"]["name"]: e["tid"] for e in events if e["name"] == "thread_name"}
+    assert set(lanes) == {"fetcher-1", threading.current_thread().name, "parser-1"}
+    by_name = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert by_name["row"]["tid"] == lanes["fetcher-1"] and by_name["row"]["args"] == {"row": 4}
+    assert by_name["parse"]["tid"] == lanes["parser-1"] and by_name["parse"]["dur"] == 2000
+    assert any(e["name"] == "process_name" and e["args"]["name"] == "job" for e in events)
+
+
+def test_spans_past_the_cap_are_counted_not_kept():
+    tracer = Tracer(max_events=2)
+    for _ in range(5):
+        with tracer.span("x"):
+            pass
+    assert len(spans(tracer)) == 2
+    assert tracer.trace_events()["otherData"]["dropped_spans"] == 3
+
+
+def test_export_writes_loadable_json(tmp_path):
+    tracer = Tracer()
+    with tracer.span("navigate"):
+        pass
+    path = tracer.export(str(tmp_path / "trace.json"))
+    with open(path) as f:
+        document = json.load(f)
+    assert document["displayTimeUnit"] == "ms"
+    assert [e["name"] for e in document["traceEvents"] if e["ph"] == "X"] == ["navigate"]
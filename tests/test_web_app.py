@@ -0,0 +1,186 @@
+import importlib
+import os
+import threading
+
+import jinja2
+import openpyxl
+import pytest
+
+fastapi_testclient = pytest.importorskip("fastapi.testclient")
+
+import database
+from fake_amazon_server import FakeScraper
+from job_scheduler import JobScheduler
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """web_app with its database and upload/result folders in a temp directory"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    import web_app
+    web_app = importlib.reload(web_app)
+    monkeypatch.setattr(web_app, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(web_app, "RESULTS_DIR", str(tmp_path / "results"))
+    os.makedirs(web_app.UPLOAD_DIR, exist_ok=True)
+    os.makedirs(web_app.RESULTS_DIR, exist_ok=True)
+    return web_app
+
+
+@pytest.fixture
+def client(app):
+    return fastapi_testclient.TestClient(app.app)
+
+
+def upload(client, content, fields=None, name="sheet.xlsx"):
+    return client.post("/upload", files={"file": (name, content)},
+                       data={"fields": fields} if fields else None, follow_redirects=False)
+
+
+def test_upload_is_stored_and_recorded(app, client):
+    response = upload(client, b"workbook bytes")
+    assert response.status_code == 303
+    files = database.get_all_files()
+    assert len(files) == 1 and files[0]['original_filename'] == "sheet.xlsx"
+    assert files[0]['file_size'] == len(b"workbook bytes")
+    assert os.listdir(app.UPLOAD_DIR) == [files[0]['filename']]
+
+
+def test_oversized_upload_is_rejected_without_leftovers(app, client, monkeypatch):
+    monkeypatch.setattr(app, "MAX_UPLOAD_BYTES", 10)
+    monkeypatch.setattr(app, "UPLOAD_CHUNK_SIZE", 4)
+    response = upload(client, b"x" * 50)
+    assert response.status_code == 413
+    assert os.listdir(app.UPLOAD_DIR) == []
+    assert database.get_all_files() == []
+
+
+def test_identical_upload_points_at_the_existing_file(app, client):
+    upload(client, b"same workbook")
+    original = database.get_all_files()[0]
+    response = upload(client, b"same workbook", name="copy.xlsx")
+    assert response.status_code == 303
+    assert response.headers["location"] == f"/?duplicate={original['id']}"
+    assert len(database.get_all_files()) == 1
+    assert len(os.listdir(app.UPLOAD_DIR)) == 1
+
+
+def test_same_workbook_with_other_fields_is_a_new_file(app, client):
+    upload(client, b"same workbook")
+    response = upload(client, b"same workbook", fields=["buybox_price"])
+    assert response.headers["location"] == "/"
+    assert len(database.get_all_files()) == 2
+
+
+def test_jobs_left_running_by_a_previous_process_are_interrupted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    database.init_db()
+    running = database.add_file("a.xlsx", "a.xlsx")
+    queued = database.add_file("b.xlsx", "b.xlsx")
+    done = database.add_file("c.xlsx", "c.xlsx")
+    database.update_status(running, "Running")
+    database.update_status(queued, "Queued")
+    database.update_status(done, "Completed")
+
+    import web_app
+    importlib.reload(web_app)
+    assert [database.get_file(i)['status'] for i in (running, queued, done)] == ["Interrupted", "Interrupted",
+                                                                                 "Completed"]
+
+
+def test_job_is_running_only_once_it_holds_a_browser(app, tmp_path, monkeypatch):
+    workbook = openpyxl.Workbook()
+    workbook.active.cell(3, 2).value = "B000000001"
+    input_path = str(tmp_path / "uploads" / "sheet.xlsx")
+    workbook.save(input_path)
+    file_id = database.add_file("sheet.xlsx", "sheet.xlsx")
+    database.update_status(file_id, "Queued")
+
+    scheduler = JobScheduler(max_jobs=1, max_browsers=1)
+    monkeypatch.setattr(app, "scheduler", scheduler)
+    monkeypatch.setattr(app, "AmazonScraper", FakeScraper)
+
+    with scheduler.browser_slot():  # another job has the only browser
+        job = threading.Thread(target=app.run_scraper_task, args=(file_id, input_path))
+        job.start()
+        job.join(0.5)
+        assert database.get_file(file_id)['status'] == "Queued"
+    job.join(5)
+    assert database.get_file(file_id)['status'] == "Completed"
+
+
+def test_upload_form_with_no_fields_ticked_is_refused(app, client):
+    response = client.post("/upload", files={"file": ("sheet.xlsx", b"workbook bytes")},
+                           data={"field_choice": "1"}, follow_redirects=False)
+    assert response.status_code == 400
+    assert database.get_all_files() == [] and os.listdir(app.UPLOAD_DIR) == []
+
+    response = client.post("/upload", files={"file": ("sheet.xlsx", b"workbook bytes")},
+                           data={"field_choice": "1", "fields": ["buybox_price"]}, follow_redirects=False)
+    assert response.status_code == 303
+    assert database.get_all_files()[0]['fields'] == "buybox_price"
+
+
+class RecordingScheduler:
+    def __init__(self):
+        self.submitted = []
+
+    def is_active(self, job_id):
+        return False
+
+    def queue_position(self, job_id):
+        return None
+
+    def submit(self, job_id, fn, *args, user=None):
+        self.submitted.append((job_id, fn))
+        return True
+
+
+def test_coordinator_mode_drops_deadlines_and_says_so(app, client, monkeypatch):
+    upload(client, b"workbook bytes")
+    file_id = database.get_all_files()[0]['id']
+    monkeypatch.setattr(app, "SCRAPER_MODE", "coordinator")
+    scheduler = RecordingScheduler()
+    monkeypatch.setattr(app, "scheduler", scheduler)
+
+    templates = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(REPO, "templates")))
+    page = templates.get_template("index.html").render(
+        request=None, files=database.get_all_files(), duplicate=None, notice=None, all_fields=[], deadlines=False)
+    assert 'name="deadline"' not in page
+    response = client.post(f"/scrape/{file_id}", data={"deadline": "18:30"}, follow_redirects=False)
+    assert response.headers["location"] == "/?notice=no_deadline"
+    assert scheduler.submitted == [(file_id, app.run_coordinator_task)]
+    assert database.get_file(file_id)['deadline'] is None
+
+
+class DeferEverythingBudget:
+    """Defers every row not yet started once the first one finishes"""
+    eta = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def check(self, pipeline, done):
+        return pipeline.defer(keep=0)
+
+
+def test_deferred_rows_leave_the_progress_total(app, tmp_path, monkeypatch):
+    workbook = openpyxl.Workbook()
+    for i in range(10):
+        workbook.active.cell(3 + i, 2).value = f"B{i:09d}"
+    input_path = str(tmp_path / "uploads" / "sheet.xlsx")
+    workbook.save(input_path)
+    file_id = database.add_file("sheet.xlsx", "sheet.xlsx")
+
+    monkeypatch.setattr(app, "scheduler", JobScheduler(max_jobs=1, max_browsers=1))
+    monkeypatch.setattr(app, "AmazonScraper", FakeScraper)
+    monkeypatch.setattr(FakeScraper, "delay", 0.05)
+    monkeypatch.setattr(app, "JobBudget", DeferEverythingBudget)
+    app.run_scraper_task(file_id, input_path)
+
+    job = database.get_file(file_id)
+    assert job['status'] == "Completed" and job['deferred'] > 0
+    assert job['progress_current'] == job['progress_total'] == 10 - job['deferred']
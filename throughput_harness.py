@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Throughput harness
+Runs the real scraper (Chrome included) end-to-end against
+fake_amazon_server.py and reports ASINs/minute, failure rates, field
+accuracy and where the time went. Needs Chrome, but no network.
+
+    python3 throughput_harness.py --rows 30 --mode excel
+    python3 throughput_harness.py --rows 30 --mode web --error-rate 0.05 --captcha-rate 0.05
+    python3 throughput_harness.py --rows 30 --fields price_check
+    python3 throughput_harness.py --rows 60 --fetchers 3 --parse-workers 4
+    python3 throughput_harness.py --rows 30 --prefetch 1
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+import openpyxl
+
+import amazon_scraper
+import database
+import scrape_pipeline
+from fake_amazon_server import FakeAmazonServer, make_product, expected_result
+
+
+class InstrumentedScraper(amazon_scraper.AmazonScraper):
+    """AmazonScraper that is kept around so its phase timings can be summed"""
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        InstrumentedScraper.instances.append(self)
+
+
+class InstrumentedPipeline(scrape_pipeline.ScrapePipeline):
+    """ScrapePipeline that keeps every result so the run can be scored"""
+    instances = []
+
+    def run(self, rows, on_result):
+        self.results = []
+        InstrumentedPipeline.instances.append(self)
+
+        def record(row, data):
+            self.results.append((row['asin'], data))
+            on_result(row, data)
+
+        return super().run(rows, record)
+
+
+def make_sheet(path, rows, seed):
+    """Write a maintenance sheet with `rows` ASINs and their true prices"""
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.cell(1, 2).value = "ASIN"
+    ws.cell(1, 3).value = "Price"
+    ws.cell(2, 2).value = "B07GFT91Z1"  # example row, skipped by the scraper
+    for row_num in range(3, rows + 3):
+        asin = "B0" + "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(8))
+        ws.cell(row_num, 2).value = asin
+        ws.cell(row_num, 3).value = make_product(asin)['price']
+    wb.save(path)
+
+
+def run_excel(input_path, workdir, fields, args):
+    amazon_scraper.process_excel(input_path, os.path.join(workdir, "output.xlsx"), fields=fields,
+                                 fetchers=args.fetchers, parse_workers=args.parse_workers, prefetch=args.prefetch)
+
+
+def run_web(input_path, workdir, fields, args):
+    """Run the dashboard's job function the way the scheduler would"""
+    database.DB_NAME = os.path.join(workdir, "harness.db")
+    import web_app
+    web_app.UPLOAD_DIR = os.path.join(workdir, "uploads")
+    web_app.RESULTS_DIR = os.path.join(workdir, "results")
+    os.makedirs(web_app.UPLOAD_DIR, exist_ok=True)
+    os.makedirs(web_app.RESULTS_DIR, exist_ok=True)
+    web_app.AmazonScraper = InstrumentedScraper
+    web_app.ScrapePipeline = InstrumentedPipeline
+    web_app.FETCHERS = args.fetchers
+    web_app.PARSE_WORKERS = args.parse_workers
+    web_app.PREFETCH_PAGES = args.prefetch
+    database.init_db()
+
+    filename = os.path.basename(input_path)
+    shutil.copy(input_path, os.path.join(web_app.UPLOAD_DIR, filename))
+    file_id = database.add_file(filename, filename)
+    web_app.run_scraper_task(file_id, os.path.join(web_app.UPLOAD_DIR, filename), fields)
+    status = database.get_file(file_id)['status']
+    if status != "Completed":
+        print(f"Web job finished with status {status}")
+
+
+def score(results, fields):
+    """Count failures and per-field mismatches against the fake server's ground truth"""
+    failed = 0
+    mismatches = defaultdict(int)
+    for asin, data in results:
+        if data is None:
+            failed += 1
+            continue
+        for field, expected in expected_result(make_product(asin)).items():
+            if fields is not None and field not in fields:
+                continue
+            actual = data.get(field)
+            if isinstance(expected, float):
+                ok = actual is not None and abs(actual - expected) < 0.01
+            else:
+                ok = actual == expected
+            if not ok:
+                mismatches[field] += 1
+    return failed, dict(mismatches)
+
+
+def run(args):
+    fake = FakeAmazonServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            captcha_rate=args.captcha_rate, seed=args.seed).start()
+    amazon_scraper.AMAZON_BASE_URL = fake.url
+    amazon_scraper.ROW_DELAY = args.row_delay
+    amazon_scraper.PAGE_LOAD_WAIT = args.page_wait
+    original_scraper = amazon_scraper.AmazonScraper
+    original_pipeline = amazon_scraper.ScrapePipeline
+    amazon_scraper.AmazonScraper = InstrumentedScraper
+    amazon_scraper.ScrapePipeline = InstrumentedPipeline
+    InstrumentedScraper.instances = []
+    InstrumentedPipeline.instances = []
+
+    workdir = tempfile.mkdtemp(prefix="throughput_")
+    try:
+        input_path = os.path.join(workdir, "sheet.xlsx")
+        make_sheet(input_path, args.rows, args.seed)
+
+        fields = amazon_scraper.parse_fields(args.fields)
+        started = time.perf_counter()
+        if args.mode == "web":
+            run_web(input_path, workdir, fields, args)
+        else:
+            run_excel(input_path, workdir, fields, args)
+        elapsed = time.perf_counter() - started
+    finally:
+        amazon_scraper.AmazonScraper = original_scraper
+        amazon_scraper.ScrapePipeline = original_pipeline
+        fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = [r for pipeline in InstrumentedPipeline.instances for r in pipeline.results]
+    timings = defaultdict(float)
+    for scraper in InstrumentedScraper.instances:
+        for phase, seconds in scraper.timings.items():
+            timings[phase] += seconds
+    # With several fetchers these phases overlap, so they can add up to more than the elapsed time
+    accounted = sum(timings.values())
+    timings['other (startup, saving, row delay)'] = max(0.0, elapsed - accounted)
+    parse_seconds = sum(pipeline.parse_seconds for pipeline in InstrumentedPipeline.instances)
+
+    failed, mismatches = score(results, fields)
+    scraped = len(results)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "report"},
+        "asins": scraped,
+        "elapsed_seconds": round(elapsed, 2),
+        "asins_per_minute": round(scraped / elapsed * 60, 2) if elapsed else None,
+        "failed": failed,
+        "failure_rate": round(failed / scraped, 4) if scraped else None,
+        "field_mismatches": mismatches,
+        "server_responses": dict(fake.stats),
+        "parse_process_seconds": round(parse_seconds, 2),
+        "time_breakdown_seconds": {phase: round(seconds, 2) for phase, seconds in
+                                   sorted(timings.items(), key=lambda item: -item[1])},
+    }
+
+
+def print_report(report):
+    print(f"\n{'='*60}")
+    print(f"Throughput ({report['config']['mode']} mode, {report['asins']} ASINs)")
+    print(f"{'='*60}")
+    print(f"Elapsed:        {report['elapsed_seconds']}s")
+    print(f"ASINs/minute:   {report['asins_per_minute']}")
+    print(f"Failed:         {report['failed']} ({report['failure_rate']})")
+    print(f"Wrong fields:   {report['field_mismatches'] or 'none'}")
+    print(f"Server served:  {report['server_responses']}")
+    print(f"Parse workers:  {report['parse_process_seconds']}s of CPU time off the fetch threads")
+    print("Time breakdown:")
+    total = report['elapsed_seconds'] or 1
+    for phase, seconds in report['time_breakdown_seconds'].items():
+        print(f"  {phase:<36}{seconds:>9.2f}s {seconds / total * 100:>6.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure scraper throughput against a local fake Amazon")
+    parser.add_argument("--mode", choices=["excel", "web"], default="excel",
+                        help="excel = process_excel, web = the dashboard's background job")
+    parser.add_argument("--rows", type=int, default=20, help="ASINs in the generated sheet")
+    parser.add_argument("--fields", default="all", help="'all', 'price_check' or a comma-separated list of fields")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean server seconds per page")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- seconds per page")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of pages answered with a 503")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="Share of pages answered with a robot check")
+    parser.add_argument("--page-wait", type=float, default=amazon_scraper.PAGE_LOAD_WAIT,
+                        help="Scraper's settle time after each page load")
+    parser.add_argument("--row-delay", type=float, default=amazon_scraper.ROW_DELAY,
+                        help="process_excel's pause between rows")
+    parser.add_argument("--fetchers", type=int, default=1, help="Browsers loading pages in parallel")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="Processes parsing page HTML (0 = parse with WebDriver in the fetch thread)")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="Pages each browser loads in background tabs while the current one is read")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", help="Write the report as JSON to this path")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report saved to: {args.report}")
@@ -0,0 +1,96 @@
+"""
+Span tracing
+Opt-in record of where each row's time goes: navigation, waits, and every
+extractor down to its individual fallback methods. Spans are tagged with the
+ASIN and sheet row they belong to and exported in Chrome's trace-event
+format, so a job's trace opens in chrome://tracing or ui.perfetto.dev with
+one lane per browser thread.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Off by default; SCRAPER_TRACE=1 records a trace for every job
+TRACING = os.environ.get("SCRAPER_TRACE", "0").lower() in ("1", "true", "yes")
+
+# Spans kept per trace; any beyond this are only counted (a few hundred per row is typical)
+MAX_EVENTS = 200000
+
+
+class Tracer:
+    def __init__(self, name="scraper", max_events=MAX_EVENTS):
+        self.name = name
+        self.max_events = max_events
+        self.dropped = 0
+        self._events = []
+        self._lanes = {}  # thread name -> tid in the trace
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    @contextmanager
+    def tags(self, **tags):
+        """Add tags (e.g. asin=..., row=...) to every span this thread records inside the block"""
+        previous = getattr(self._local, 'tags', {})
+        self._local.tags = {**previous, **tags}
+        try:
+            yield
+        finally:
+            self._local.tags = previous
+
+    @contextmanager
+    def span(self, name, **args):
+        """Record the time spent in a block as a span on this thread's lane"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter() - start, **args)
+
+    def add(self, name, start, seconds, lane=None, **args):
+        """Record a span timed elsewhere. start is a time.perf_counter() reading
+
+        lane names the row it is drawn on (default: the current thread's name).
+        perf_counter is system-wide on Linux, so spans timed in other processes line up.
+        """
+        args = {**getattr(self._local, 'tags', {}), **args}
+        lane = lane or threading.current_thread().name
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                self.dropped += 1
+                return
+            tid = self._lanes.setdefault(lane, len(self._lanes) + 1)
+            self._events.append({
+                "name": name,
+                "cat": name.split('/')[0],
+                "ph": "X",
+                "ts": round(start * 1e6, 1),
+                "dur": round(seconds * 1e6, 1),
+                "pid": self._pid,
+                "tid": tid,
+                "args": args,
+            })
+
+    def trace_events(self):
+        """The spans plus process/thread name records, as a Chrome trace-event document"""
+        with self._lock:
+            events = list(self._events)
+            lanes = dict(self._lanes)
+            dropped = self.dropped
+        metadata = [{"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": self.name}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": lane}}
+                     for lane, tid in lanes.items()]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_spans": dropped},
+        }
+
+    def export(self, path):
+        """Write the trace to path (open it in chrome://tracing or ui.perfetto.dev)"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace_events(), f)
+        return path
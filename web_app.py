@@ -1,16 +1,30 @@
-from fastapi import FastAPI, Request, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
 from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import shutil
+from typing import List, Optional
+from contextlib import contextmanager
+import aiofiles
+import hashlib
 import os
+import queue
+import threading
 import uuid
 import database
-from amazon_scraper import AmazonScraper
+from amazon_scraper import (AmazonScraper, FIELDS, FETCHERS, MAX_FETCHERS, PARSE_WORKERS, PREFETCH_PAGES,
+                            order_by_priority, parse_fields, read_asin_rows, write_deferred_row, write_result_row)
+from aimd import ADAPTIVE, AIMDController
+from job_budget import JobBudget, format_time, parse_deadline
+from job_scheduler import scheduler, JobCancelled
+from proxy_pool import ProxyPool
+from scrape_pipeline import ScrapePipeline
+from shard_coordinator import coordinator, router as shard_router
+from single_flight import flights
+from tracing import TRACING, Tracer
 import openpyxl
-from openpyxl.styles import PatternFill
 
 app = FastAPI()
+app.include_router(shard_router)
 
 # Setup directories
 UPLOAD_DIR = "uploads"
@@ -18,21 +32,54 @@ RESULTS_DIR = "results"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
+# Upload limits
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Messages shown on the dashboard after a redirect
+NOTICES = {
+    "already_running": "That file is already queued or running.",
+    "not_running": "That file is not queued or running.",
+    "bad_deadline": "Couldn't read that deadline. Use a time like 09:00.",
+    "no_deadline": "Deadlines only apply to local scraping; the job was started without one.",
+}
+
 # Setup templates
 templates = Jinja2Templates(directory="templates")
 
 # Initialize DB
 database.init_db()
 
-# Define colors (copied from script)
-GREEN_FILL = PatternFill(start_color='00FF00', end_color='00FF00', fill_type='solid')
-RED_FILL = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
+# Jobs only live in this process's memory, so any left Queued/Running by a previous run will never finish
+interrupted = database.mark_interrupted()
+if interrupted:
+    print(f"Marked {interrupted} unfinished job(s) from before the restart as Interrupted")
+
+# Optional egress pool shared by every job (SCRAPER_PROXIES / SCRAPER_PROXY_FILE)
+proxy_pool = ProxyPool.from_env()
+
+# "local" scrapes on this machine; "coordinator" hands shards to shard_worker.py nodes
+SCRAPER_MODE = os.environ.get("SCRAPER_MODE", "local")
 
-def run_scraper_task(file_id: int, input_path: str):
+def trace_path(file_id: int):
+    """Where a job's span trace is written when SCRAPER_TRACE is on"""
+    return os.path.join(RESULTS_DIR, f"trace_{file_id}.json")
+
+def run_scraper_task(file_id: int, input_path: str, fields=None, cancel_event=None):
     """Background task to run the scraper"""
+    tracer = Tracer(f"file {file_id}") if TRACING else None
+    running = threading.Event()
+    
+    @contextmanager
+    def browser_slot(give_up=None):
+        # The job stays Queued until its first browser is actually open
+        with scheduler.browser_slot(cancel_event, give_up):
+            if not running.is_set():
+                running.set()
+                database.update_status(file_id, "Running")
+            yield
+    
     try:
-        database.update_status(file_id, "Running")
-        
         # Define output path
         filename = os.path.basename(input_path)
         result_filename = f"updated_{filename}"
@@ -42,111 +89,242 @@ def run_scraper_task(file_id: int, input_path: str):
         wb = openpyxl.load_workbook(input_path)
         ws = wb.active
         
-        # Initialize scraper
-        scraper = AmazonScraper(headless=True)
+        rows = order_by_priority(read_asin_rows(ws))
+        total_rows = len(rows)
+        database.update_progress(file_id, 0, total_rows)
         
-        try:
-            # Count total rows to process
-            total_rows = 0
-            for row_num in range(3, ws.max_row + 1):
-                if ws.cell(row_num, 2).value:
-                    total_rows += 1
+        # Optional finish-by time set when the job was started
+        file_info = database.get_file(file_id)
+        deadline = parse_deadline(file_info['deadline']) if file_info else None
+        budget = JobBudget(deadline, max(FETCHERS, MAX_FETCHERS), raise_concurrency=not ADAPTIVE)
+        deferred_rows = 0
+        
+        # Each fetcher holds a browser slot while its scraper is open
+        pipeline = ScrapePipeline(lambda: AmazonScraper(headless=True, proxy_pool=proxy_pool, tracer=tracer,
+                                                        prefetch_pages=PREFETCH_PAGES, cancel_event=cancel_event),
+                                  fields, fetchers=FETCHERS, parse_workers=PARSE_WORKERS, cancel_event=cancel_event,
+                                  browser_slot=browser_slot, flights=flights,
+                                  tracer=tracer, prefetch=PREFETCH_PAGES)
+        controller = AIMDController(pipeline, max(FETCHERS, MAX_FETCHERS)) if ADAPTIVE else None
+        database.update_concurrency(file_id, FETCHERS)
+        logged_changes = 0
+        done_rows = 0
+        
+        def save_row(row, data):
+            nonlocal done_rows, deferred_rows, logged_changes
+            done_rows += 1
+            if data:
+                write_result_row(ws, row['row_num'], data, row['expected_price'], fields)
             
-            database.update_progress(file_id, 0, total_rows)
+            if controller is not None:
+                controller.observe(data)
             
-            # Process rows
-            current_row = 0
-            for row_num in range(3, ws.max_row + 1):
-                asin = ws.cell(row_num, 2).value
-                if not asin:
-                    continue
-                
-                asin = str(asin).strip()
-                expected_price = ws.cell(row_num, 3).value
-                
-                # Scrape
-                data = scraper.scrape_product(asin, expected_price)
-                
-                # Update progress
-                current_row += 1
-                database.update_progress(file_id, current_row, total_rows)
-                
-                if data:
-                    # Update Excel (Logic copied from run_test_15.py)
-                    ws.cell(row_num, 6).value = data['link']
-                    
-                    buybox_seller = data['buybox_seller']
-                    if buybox_seller and 'amazon.com' in buybox_seller.lower():
-                        ws.cell(row_num, 7).value = "YES"
-                        ws.cell(row_num, 7).fill = GREEN_FILL
-                    else:
-                        ws.cell(row_num, 7).value = buybox_seller or "Unknown"
-                        ws.cell(row_num, 7).fill = RED_FILL
-                    
-                    buybox_price = data['buybox_price']
-                    if buybox_price is not None:
-                        ws.cell(row_num, 8).value = buybox_price
-                        if expected_price and abs(buybox_price - expected_price) < 0.01:
-                            ws.cell(row_num, 8).fill = GREEN_FILL
-                        else:
-                            ws.cell(row_num, 8).fill = RED_FILL
-                    
-                    ws.cell(row_num, 9).value = data['ranking']
-                    ws.cell(row_num, 10).value = data['review']
-                    
-                    photo_count = data['photos']
-                    if photo_count >= 8:
-                        ws.cell(row_num, 11).value = "GOOD"
-                        ws.cell(row_num, 11).fill = GREEN_FILL
-                    else:
-                        ws.cell(row_num, 11).value = photo_count
-                        ws.cell(row_num, 11).fill = RED_FILL
-                    
-                    ws.cell(row_num, 12).value = data['videos']
-                    ws.cell(row_num, 13).value = data['bullet_points']
+            # Rows that can no longer make the deadline are marked and skipped
+            deferred = budget.check(pipeline, done_rows)
+            for deferred_row in deferred:
+                write_deferred_row(ws, deferred_row['row_num'])
+            deferred_rows += len(deferred)
+            # Deferred rows won't be scraped, so they leave the total (a finished job reaches 100%)
+            database.update_progress(file_id, done_rows, total_rows - deferred_rows)
+            database.update_eta(file_id, format_time(budget.eta), deferred_rows)
+            
+            # Show the current browser count and why it last changed
+            if pipeline.concurrency_changes != logged_changes:
+                logged_changes = pipeline.concurrency_changes
+                database.update_concurrency(file_id, pipeline.concurrency, "\n".join(pipeline.concurrency_log))
+        
+        try:
+            # Stops cleanly between rows when cancelled
+            if not pipeline.run(rows, save_row):
+                raise JobCancelled()
             
             # Save result
             wb.save(output_path)
             database.update_status(file_id, "Completed", result_filename)
             
-        except Exception as e:
-            print(f"Scraping error: {e}")
-            database.update_status(file_id, "Failed")
-        finally:
-            scraper.close()
+        except JobCancelled:
+            # Keep whatever was scraped before the cancel
+            if done_rows:
+                wb.save(output_path)
+                database.update_status(file_id, "Cancelled", result_filename)
+            else:
+                database.update_status(file_id, "Cancelled")
             
     except Exception as e:
         print(f"Task error: {e}")
         database.update_status(file_id, "Failed")
+    finally:
+        # Whatever ran, including cancelled and failed jobs, is worth a look
+        if tracer is not None:
+            tracer.export(trace_path(file_id))
+
+def run_coordinator_task(file_id: int, input_path: str, fields=None, cancel_event=None):
+    """Background task that shards a file across worker nodes and merges their results"""
+    try:
+        database.update_status(file_id, "Running")
+        
+        filename = os.path.basename(input_path)
+        result_filename = f"updated_{filename}"
+        output_path = os.path.join(RESULTS_DIR, result_filename)
+        
+        wb = openpyxl.load_workbook(input_path)
+        ws = wb.active
+        
+        rows = read_asin_rows(ws)
+        expected_prices = {row['row_num']: row['expected_price'] for row in rows}
+        total_rows = len(rows)
+        database.update_progress(file_id, 0, total_rows)
+        
+        job = coordinator.add_job(file_id, rows, fields)
+        try:
+            merged_rows = 0
+            merged_shards = 0
+            while merged_shards < len(job.shards):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                try:
+                    shard_id, results = job.results.get(timeout=1)
+                except queue.Empty:
+                    continue
+                
+                # Merge rows back at their original positions
+                for result in results:
+                    row_num = result['row_num']
+                    if result['data'] and row_num in expected_prices:
+                        write_result_row(ws, row_num, result['data'], expected_prices[row_num], fields)
+                merged_shards += 1
+                merged_rows += len(job.shards[shard_id].rows)
+                database.update_progress(file_id, merged_rows, total_rows)
+                wb.save(output_path)
+            
+            wb.save(output_path)
+            database.update_status(file_id, "Completed", result_filename)
+        except JobCancelled:
+            wb.save(output_path)
+            database.update_status(file_id, "Cancelled", result_filename)
+        finally:
+            coordinator.remove_job(file_id)
+    
+    except Exception as e:
+        print(f"Coordinator task error: {e}")
+        database.update_status(file_id, "Failed")
 
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request):
+async def dashboard(request: Request, duplicate: Optional[int] = None, notice: Optional[str] = None):
     files = database.get_all_files()
-    return templates.TemplateResponse("index.html", {"request": request, "files": files})
+    for file in files:
+        file['queue_position'] = scheduler.queue_position(file['id'])
+        file['has_trace'] = os.path.exists(trace_path(file['id']))
+    duplicate_file = database.get_file(duplicate) if duplicate else None
+    return templates.TemplateResponse("index.html", {"request": request, "files": files,
+                                                     "duplicate": duplicate_file,
+                                                     "notice": NOTICES.get(notice),
+                                                     "all_fields": FIELDS[1:],
+                                                     "deadlines": SCRAPER_MODE != "coordinator"})
+
+async def save_upload(file: UploadFile, file_path: str):
+    """Stream an upload to disk in chunks, returning (sha256 hex digest, size)"""
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413,
+                                        detail=f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+                sha256.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        # Never leave a partial upload behind
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return sha256.hexdigest(), size
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), fields: Optional[List[str]] = Form(None),
+                      field_choice: Optional[str] = Form(None)):
+    # The upload form marks its posts with field_choice, so unticking every box can't be mistaken for
+    # an API client that left fields out (which means all of them)
+    if field_choice and not fields:
+        raise HTTPException(status_code=400, detail="Choose at least one field to check")
+    try:
+        selected_fields = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fields_value = ",".join(selected_fields) if selected_fields else None
+    
     # Generate safe filename
-    safe_filename = f"{uuid.uuid4()}_{file.filename}"
+    safe_filename = f"{uuid.uuid4()}_{os.path.basename(file.filename)}"
     file_path = os.path.join(UPLOAD_DIR, safe_filename)
     
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream to a temporary name so a half-written upload is never picked up
+    partial_path = file_path + ".part"
+    content_hash, file_size = await save_upload(file, partial_path)
+    
+    # Identical workbook already uploaded: offer its results instead of a new job
+    existing = database.find_file_by_hash(content_hash, fields_value)
+    if existing and os.path.exists(os.path.join(UPLOAD_DIR, existing['filename'])):
+        os.remove(partial_path)
+        return RedirectResponse(url=f"/?duplicate={existing['id']}", status_code=303)
+    
+    os.replace(partial_path, file_path)
     
     # Add to DB
-    database.add_file(safe_filename, file.filename)
+    database.add_file(safe_filename, file.filename, content_hash, file_size, fields_value)
     
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/scrape/{file_id}")
-async def start_scrape(file_id: int, background_tasks: BackgroundTasks):
+async def start_scrape(file_id: int, request: Request, deadline: Optional[str] = Form(None)):
     file_info = database.get_file(file_id)
     if file_info:
         input_path = os.path.join(UPLOAD_DIR, file_info['filename'])
-        background_tasks.add_task(run_scraper_task, file_id, input_path)
+        user = request.client.host if request.client else "anonymous"
+        if scheduler.is_active(file_id):
+            return RedirectResponse(url="/?notice=already_running", status_code=303)
+        try:
+            deadline_value = format_time(parse_deadline(deadline))
+        except ValueError:
+            return RedirectResponse(url="/?notice=bad_deadline", status_code=303)
+        # Shards are scraped by whichever workers show up, so there is nothing for a budget to steer
+        ignored_deadline = SCRAPER_MODE == "coordinator" and deadline_value is not None
+        if ignored_deadline:
+            deadline_value = None
+        database.set_deadline(file_id, deadline_value)
+        database.update_status(file_id, "Queued")
+        task = run_coordinator_task if SCRAPER_MODE == "coordinator" else run_scraper_task
+        fields = parse_fields(file_info['fields'])
+        if not scheduler.submit(file_id, task, file_id, input_path, fields, user=user):
+            return RedirectResponse(url="/?notice=already_running", status_code=303)
+        if ignored_deadline:
+            return RedirectResponse(url="/?notice=no_deadline", status_code=303)
+    return RedirectResponse(url="/", status_code=303)
+
+@app.post("/cancel/{file_id}")
+async def cancel_scrape(file_id: int):
+    result = scheduler.cancel(file_id)
+    if result == "queued":
+        database.update_status(file_id, "Cancelled")
+    elif result is None:
+        return RedirectResponse(url="/?notice=not_running", status_code=303)
     return RedirectResponse(url="/", status_code=303)
 
+@app.get("/proxies")
+async def proxy_status():
+    if proxy_pool is None:
+        return {"enabled": False, "exits": []}
+    return {"enabled": True, "exits": proxy_pool.status()}
+
+@app.get("/flights")
+async def flight_status():
+    """How many page loads were shared between overlapping jobs"""
+    return flights.status()
+
 @app.get("/download/{file_id}")
 async def download_result(file_id: int):
     file_info = database.get_file(file_id)
@@ -155,10 +333,23 @@ async def download_result(file_id: int):
         return FileResponse(path, filename=f"UPDATED_{file_info['original_filename']}")
     return RedirectResponse(url="/")
 
+@app.get("/trace/{file_id}")
+async def download_trace(file_id: int):
+    """The job's span trace, for chrome://tracing or ui.perfetto.dev"""
+    file_info = database.get_file(file_id)
+    path = trace_path(file_id)
+    if file_info and os.path.exists(path):
+        name = os.path.splitext(file_info['original_filename'])[0]
+        return FileResponse(path, filename=f"trace_{name}.json", media_type="application/json")
+    return RedirectResponse(url="/")
+
 @app.post("/delete/{file_id}")
 async def delete_file(file_id: int):
     file_info = database.get_file(file_id)
     if file_info:
+        if scheduler.is_active(file_id):
+            scheduler.cancel(file_id)
+        
         # Try to delete actual files
         try:
             os.remove(os.path.join(UPLOAD_DIR, file_info['filename']))
@@ -166,6 +357,8 @@ async def delete_file(file_id: int):
                 os.remove(os.path.join(RESULTS_DIR, file_info['result_filename']))
         except:
             pass
+        if os.path.exists(trace_path(file_id)):
+            os.remove(trace_path(file_id))
         
         database.delete_file(file_id)
     return RedirectResponse(url="/", status_code=303)